@@ -1,13 +1,92 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .catalog import (
+    refresh_entries, refresh_search_text, update_category_entries,
+    update_shop_entries
+)
+from .catalog_cache import bump_catalog_version
+from .facets import rebuild_shop_facets
 from .models import (
     User, Shop, Category, Product, ProductInfo,
     Parameter, ProductParameter, Contact, Order,
-    OrderItem, ConfirmEmailToken
+    OrderItem, ConfirmEmailToken, ImportJob, ImportCheckpoint,
+    ParameterFacet
 )
 
 
+class CatalogCacheAdminMixin:
+    """
+    Делает устаревшими кэшированные ответы API каталога после правки
+    или удаления объекта в админке.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        bump_catalog_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_catalog_version()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        bump_catalog_version()
+
+
+class CatalogEntryAdminMixin(CatalogCacheAdminMixin):
+    """
+    Обновляет все, что строится из предложений при импорте, после
+    правки или удаления объекта в админке: записи витрины каталога
+    (CatalogEntry), search_text предложений и счетчики фасетов их
+    магазинов. Админка выполняет правку в транзакции, поэтому они
+    меняются вместе с исходными строками.
+
+    Админка модели определяет catalog_offers(objects) - QuerySet
+    предложений, которые строятся из objects.
+    """
+
+    def affected_offers(self, objects):
+        """
+        Returns:
+            list: Пары (id предложения, id магазина)
+        """
+        return list(self.catalog_offers(objects).values_list(
+            'pk', 'shop_id'))
+
+    @staticmethod
+    def refresh_catalog(offers):
+        """
+        Args:
+            offers: Пары из affected_offers, снятые до и после правки
+        """
+        changed = ProductInfo.objects.filter(
+            pk__in={offer_id for offer_id, _ in offers})
+        refresh_entries(changed)
+        refresh_search_text(changed)
+        for shop in Shop.objects.filter(
+                pk__in={shop_id for _, shop_id in offers}):
+            rebuild_shop_facets(shop)
+
+    def save_model(self, request, obj, form, change):
+        # Правка может перенести предложение в другой магазин
+        offers = self.affected_offers([obj]) if change else []
+        super().save_model(request, obj, form, change)
+        self.refresh_catalog(offers + self.affected_offers([obj]))
+
+    def delete_model(self, request, obj):
+        offers = self.affected_offers([obj])
+        super().delete_model(request, obj)
+        self.refresh_catalog(offers)
+
+    def delete_queryset(self, request, queryset):
+        offers = self.affected_offers(queryset)
+        super().delete_queryset(request, queryset)
+        self.refresh_catalog(offers)
+
+
 class UserAdmin(BaseUserAdmin):
     list_display = (
         'email',
@@ -35,14 +114,18 @@ class UserAdmin(BaseUserAdmin):
                 'email', 'password1', 'password2', 'first_name', 'last_name', 'type'), }), )
 
 
-class ShopAdmin(admin.ModelAdmin):
+class ShopAdmin(CatalogCacheAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'url', 'state', 'user')
     list_filter = ('state',)
     search_fields = ('name', 'url')
     raw_id_fields = ('user',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_shop_entries(obj)
+
 
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(CatalogCacheAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'display_shops')
     search_fields = ('name',)
     filter_horizontal = ('shops',)
@@ -51,38 +134,75 @@ class CategoryAdmin(admin.ModelAdmin):
         return ", ".join([shop.name for shop in obj.shops.all()])
     display_shops.short_description = 'Магазины'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_category_entries(obj)
 
-class ProductAdmin(admin.ModelAdmin):
+
+class ProductAdmin(CatalogEntryAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'category')
     list_filter = ('category',)
     search_fields = ('name',)
     raw_id_fields = ('category',)
 
+    def catalog_offers(self, objects):
+        return ProductInfo.objects.filter(product__in=objects)
+
 
-class ProductInfoAdmin(admin.ModelAdmin):
+class ProductInfoAdmin(CatalogEntryAdminMixin, admin.ModelAdmin):
     list_display = (
         'product',
         'shop',
         'price',
         'price_rrc',
         'quantity',
-        'external_id')
+        'external_id',
+        'generation')
     list_filter = ('shop',)
     search_fields = ('product__name', 'model', 'external_id')
     raw_id_fields = ('product', 'shop')
 
+    def catalog_offers(self, objects):
+        return ProductInfo.objects.filter(pk__in=[obj.pk for obj in objects])
 
-class ParameterAdmin(admin.ModelAdmin):
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по search_text и его индексам вместо icontains по полям
+        if not search_term.strip():
+            return queryset, False
+        results = queryset.search(search_term)
+        if search_term.strip().isdigit():
+            results = queryset.filter(
+                Q(pk__in=results.values('pk'))
+                | Q(external_id=int(search_term)))
+        return results, False
+
+
+class ParameterAdmin(CatalogEntryAdminMixin, admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
 
+    def catalog_offers(self, objects):
+        return ProductInfo.objects.filter(
+            product_parameters__parameter__in=objects)
+
 
-class ProductParameterAdmin(admin.ModelAdmin):
+class ProductParameterAdmin(CatalogEntryAdminMixin, admin.ModelAdmin):
     list_display = ('product_info', 'parameter', 'value')
     list_filter = ('parameter',)
     search_fields = ('product_info__product__name', 'parameter__name', 'value')
     raw_id_fields = ('product_info', 'parameter')
 
+    def catalog_offers(self, objects):
+        return ProductInfo.objects.filter(
+            pk__in=[obj.product_info_id for obj in objects])
+
+
+class ParameterFacetAdmin(CatalogCacheAdminMixin, admin.ModelAdmin):
+    list_display = ('shop', 'category', 'parameter', 'value', 'count')
+    list_filter = ('parameter',)
+    search_fields = ('shop__name', 'category__name', 'value')
+    raw_id_fields = ('shop', 'category', 'parameter')
+
 
 class ContactAdmin(admin.ModelAdmin):
     list_display = ('user', 'city', 'street', 'house', 'phone')
@@ -112,6 +232,25 @@ class OrderItemAdmin(admin.ModelAdmin):
     search_fields = ('order__id', 'product_info__product__name')
     raw_id_fields = ('order', 'product_info')
 
+    @staticmethod
+    def touch_orders(order_ids):
+        # Позиции входят в ответ заказа, его ETag должен смениться
+        Order.objects.filter(pk__in=order_ids).update(
+            updated_at=timezone.now())
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.touch_orders([obj.order_id, form.initial.get('order')])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.touch_orders([obj.order_id])
+
+    def delete_queryset(self, request, queryset):
+        order_ids = list(queryset.values_list('order_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.touch_orders(order_ids)
+
 
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'key', 'created_at')
@@ -119,6 +258,27 @@ class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     raw_id_fields = ('user',)
 
 
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'shop',
+        'status',
+        'processed',
+        'attempts',
+        'created_at',
+        'finished_at')
+    list_filter = ('status',)
+    search_fields = ('shop__name', 'url')
+    raw_id_fields = ('shop', 'user')
+    readonly_fields = ('result', 'error', 'started_at', 'finished_at')
+
+
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'job', 'source', 'offset', 'updated_at')
+    search_fields = ('shop__name', 'source')
+    raw_id_fields = ('shop', 'job')
+
+
 # Регистрация моделей в админке
 admin.site.register(User, UserAdmin)
 admin.site.register(Shop, ShopAdmin)
@@ -127,7 +287,10 @@ admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductInfo, ProductInfoAdmin)
 admin.site.register(Parameter, ParameterAdmin)
 admin.site.register(ProductParameter, ProductParameterAdmin)
+admin.site.register(ParameterFacet, ParameterFacetAdmin)
 admin.site.register(Contact, ContactAdmin)
 admin.site.register(Order, OrderAdmin)
 admin.site.register(OrderItem, OrderItemAdmin)
 admin.site.register(ConfirmEmailToken, ConfirmEmailTokenAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
+admin.site.register(ImportCheckpoint, ImportCheckpointAdmin)
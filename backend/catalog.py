@@ -0,0 +1,149 @@
+"""
+Витрина каталога (CatalogEntry).
+
+Список product-info читается из одной плоской таблицы вместо
+соединения ProductInfo, Product, Category, Shop и предзагрузки
+параметров. Импорт пишет записи витрины сам, в транзакции пачки
+(CatalogWriter), а правки исходных моделей в админке обновляют их
+в транзакции правки (admin.CatalogEntryAdminMixin). Там же
+пересчитывается search_text предложений, который импорт тоже
+заполняет сам.
+"""
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .models import CatalogEntry, ProductInfo, ProductParameter
+from .utils.search import build_search_text
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def render_parameters(parameters):
+    """
+    Параметры в виде ProductParameterSerializer.
+
+    Args:
+        parameters: Тройки (id параметра, имя параметра, значение)
+    """
+    return [{'parameter': {'id': parameter_id, 'name': name}, 'value': value}
+            for parameter_id, name, value in parameters]
+
+
+def build_entry(info, product_name, category, shop, parameters):
+    """
+    Запись витрины для сохраненного предложения.
+
+    Args:
+        info: ProductInfo с pk
+        product_name: Название продукта
+        category: Category продукта
+        shop: Shop предложения
+        parameters: Тройки для render_parameters
+    """
+    return CatalogEntry(
+        product_info_id=info.pk,
+        shop_id=shop.id,
+        shop_name=shop.name,
+        shop_url=shop.url,
+        shop_state=shop.state,
+        generation=info.generation,
+        product_id=info.product_id,
+        product_name=product_name,
+        category_id=category.id,
+        category_name=category.name,
+        external_id=info.external_id,
+        model=info.model,
+        quantity=info.quantity,
+        price=info.price,
+        price_rrc=info.price_rrc,
+        parameters=render_parameters(parameters))
+
+
+def replace_entries(entries, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Заменяет записи витрины тех же предложений. Вызывается внутри
+    транзакции, в которой изменены предложения.
+    """
+    CatalogEntry.objects.filter(
+        pk__in=[entry.pk for entry in entries]).delete()
+    CatalogEntry.objects.bulk_create(entries, batch_size=batch_size)
+
+
+def refresh_entries(product_infos, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Пересобирает записи витрины по текущему состоянию БД.
+
+    Args:
+        product_infos: QuerySet предложений
+
+    Returns:
+        int: Количество пересобранных записей
+    """
+    ids = list(product_infos.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        infos = ProductInfo.objects.filter(pk__in=chunk).select_related(
+            'product__category', 'shop'
+        ).prefetch_related('product_parameters__parameter')
+        entries = [
+            build_entry(info, info.product.name, info.product.category,
+                        info.shop,
+                        [(item.parameter_id, item.parameter.name, item.value)
+                         for item in info.product_parameters.all()])
+            for info in infos]
+        with transaction.atomic():
+            # Удаленные за это время предложения пропадут и из витрины
+            CatalogEntry.objects.filter(pk__in=chunk).delete()
+            CatalogEntry.objects.bulk_create(entries)
+    return len(ids)
+
+
+def refresh_search_text(product_infos, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Пересчитывает search_text предложений (utils.search) по текущему
+    состоянию БД: названию продукта, модели и значениям параметров
+    в порядке их записи.
+
+    Args:
+        product_infos: QuerySet предложений
+
+    Returns:
+        int: Количество предложений с измененным search_text
+    """
+    ids = list(product_infos.order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(ids), batch_size):
+        infos = ProductInfo.objects.filter(
+            pk__in=ids[start:start + batch_size]
+        ).select_related('product').prefetch_related(Prefetch(
+            'product_parameters',
+            queryset=ProductParameter.objects.order_by('pk')))
+        updated = []
+        for info in infos:
+            text = build_search_text(
+                info.product.name, info.model,
+                {item.parameter_id: item.value
+                 for item in info.product_parameters.all()})
+            if text != info.search_text:
+                info.search_text = text
+                updated.append(info)
+        ProductInfo.objects.bulk_update(updated, ['search_text'])
+        changed += len(updated)
+    return changed
+
+
+def update_shop_entries(shop):
+    """
+    Название, ссылка и статус магазина во всех его записях витрины.
+    """
+    return CatalogEntry.objects.filter(shop=shop).exclude(
+        shop_name=shop.name, shop_url=shop.url, shop_state=shop.state
+    ).update(shop_name=shop.name, shop_url=shop.url, shop_state=shop.state)
+
+
+def update_category_entries(category):
+    """
+    Название категории во всех ее записях витрины.
+    """
+    return CatalogEntry.objects.filter(category=category).exclude(
+        category_name=category.name).update(category_name=category.name)
@@ -0,0 +1,362 @@
+"""
+Кэш ответов API каталога.
+
+Каталог меняется только при импорте прайс-листа и правке в админке,
+поэтому готовые ответы списков и карточек хранятся в кэше Django
+(CACHES: locmem по умолчанию, общий бэкенд на рабочем сервере). Ключ
+ответа - полный URL запроса и версии каталога, которые хранятся в БД
+(CatalogVersion), поэтому импорт в другом процессе сразу делает
+устаревшими ответы в кэше каждого процесса:
+
+- глобальная версия растет при правке каталога в админке и командах
+  пересборки;
+- версия магазина растет при импорте его прайс-листа, вместе с ней
+  растет общая версия магазинов.
+
+Ответ, отфильтрованный по ?shop=, зависит от глобальной версии и версий
+этих магазинов, остальные - от глобальной версии и общей версии
+магазинов. Смена версии делает старые ключи недостижимыми, поэтому
+инвалидация точная и не требует перебора ключей; старые записи
+вытесняются по CATALOG_CACHE_TIMEOUT.
+
+После импорта крупного магазина его ответы пропадают из кэша разом, и
+одинаковые запросы не должны одновременно идти в БД (single-flight):
+
+- в процессе первый запрос ключа вычисляет ответ, остальные ждут его
+  результат (SingleFlight);
+- между процессами ответ вычисляет тот, кто взял блокировку ключа в
+  кэше (cache.add), остальные ждут, пока ответ появится в кэше, не
+  дольше CATALOG_CACHE_LOCK_TIMEOUT;
+- пока ответ вычисляется, ждущие первые CATALOG_CACHE_STALE_SECONDS
+  секунд получают ответ предыдущей версии (stale-while-revalidate).
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from rest_framework.response import Response
+
+from .conditional import conditional_response, make_etag
+from .models import CatalogVersion
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_STALE_SECONDS = 5
+# Как часто ждущий запрос проверяет кэш, сек.
+LOCK_POLL_INTERVAL = 0.05
+GLOBAL_VERSION_KEY = 'catalog:version'
+SHOPS_VERSION_KEY = 'catalog:version:shops'
+RESPONSE_KEY_PREFIX = 'catalog:response:'
+LATEST_KEY_PREFIX = 'catalog:latest:'
+LOCK_SUFFIX = ':lock'
+HITS_KEY = 'catalog:cache:hits'
+MISSES_KEY = 'catalog:cache:misses'
+COALESCED_KEY = 'catalog:cache:coalesced'
+STALE_KEY = 'catalog:cache:stale'
+STATS_KEYS = {'hits': HITS_KEY, 'misses': MISSES_KEY,
+              'coalesced': COALESCED_KEY, 'stale': STALE_KEY}
+CACHE_HEADER = 'X-Cache'
+
+
+def shop_version_key(shop_id):
+    return f'catalog:version:shop:{shop_id}'
+
+
+def cache_timeout():
+    """
+    Время жизни ответа, сек. 0 выключает кэш.
+    """
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def lock_timeout():
+    """
+    Сколько запрос ждет ответ, который вычисляет другой запрос, сек.
+    """
+    return getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT',
+                   DEFAULT_LOCK_TIMEOUT)
+
+
+def stale_seconds():
+    """
+    Сколько секунд с начала вычисления ответа ждущим отдается
+    предыдущая версия. 0 - не отдается.
+    """
+    return getattr(settings, 'CATALOG_CACHE_STALE_SECONDS',
+                   DEFAULT_STALE_SECONDS)
+
+
+def _initial_version():
+    # Первая версия - текущее время, а не 1, чтобы не совпасть с версией
+    # ответов, закэшированных до очистки таблицы версий
+    return time.time_ns() // 1000
+
+
+def _increment(key, initial):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, None)
+
+
+def catalog_version(shop_ids=None):
+    """
+    Версия каталога для ответа. Читается из БД одним запросом, поэтому
+    смену версии импортом в другом процессе сразу видят все процессы;
+    версия, которую еще не меняли, равна 0.
+
+    Args:
+        shop_ids: id магазинов, которыми ограничен ответ, или None
+
+    Returns:
+        str: Версии, от которых зависит ответ
+    """
+    keys = [GLOBAL_VERSION_KEY]
+    if shop_ids is None:
+        keys.append(SHOPS_VERSION_KEY)
+    else:
+        keys.extend(shop_version_key(shop_id)
+                    for shop_id in sorted(set(shop_ids)))
+    versions = dict(CatalogVersion.objects.filter(
+        key__in=keys).values_list('key', 'version'))
+    return '.'.join(str(versions.get(key, 0)) for key in keys)
+
+
+def bump_catalog_version(shop=None):
+    """
+    Делает устаревшими ответы, зависящие от каталога магазина shop, или
+    все ответы каталога без shop.
+
+    Версия меняется в БД в текущей транзакции, поэтому новые данные и
+    новая версия становятся видны другим запросам одновременно.
+    """
+    if shop is not None:
+        keys = [SHOPS_VERSION_KEY, shop_version_key(shop.pk)]
+    else:
+        keys = [GLOBAL_VERSION_KEY]
+    updated = CatalogVersion.objects.filter(key__in=keys).update(
+        version=F('version') + 1)
+    if updated < len(keys):
+        # Параллельный запрос мог создать ту же версию - она уже новая
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(key=key, version=_initial_version())
+             for key in keys], ignore_conflicts=True)
+
+
+def cache_stats(reset=False):
+    """
+    Returns:
+        dict: Число попаданий (hits), промахов (misses), ответов,
+            дождавшихся чужого вычисления (coalesced), и ответов
+            предыдущей версии (stale)
+    """
+    stats = cache.get_many(list(STATS_KEYS.values()))
+    if reset:
+        cache.delete_many(list(STATS_KEYS.values()))
+    return {name: stats.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def response_key(request, version):
+    """
+    Ключ ответа: URL с хостом и строкой запроса (ссылки пагинации в
+    ответе абсолютные) и версия каталога.
+    """
+    source = f'{request.build_absolute_uri()}|{version}'
+    return RESPONSE_KEY_PREFIX + hashlib.md5(source.encode()).hexdigest()
+
+
+def latest_key(request):
+    """
+    Ключ последней закэшированной версии ответа на URL.
+    """
+    source = request.build_absolute_uri()
+    return LATEST_KEY_PREFIX + hashlib.md5(source.encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вычисления одного ключа в процессе:
+    первый поток вычисляет, остальные ждут его результат.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def join(self, key):
+        """
+        Returns:
+            tuple: Вычисление ключа и True, если вычислять этому потоку
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call, data):
+        """
+        Отдает data ждущим; None - вычисление не удалось, ждущие
+        вычисляют сами.
+        """
+        with self._lock:
+            self._calls.pop(key, None)
+        call.data = data
+        call.done.set()
+
+
+_flights = SingleFlight()
+
+
+def _cached(data, state, stats_key):
+    _increment(stats_key, 1)
+    response = Response(data)
+    response[CACHE_HEADER] = state
+    return response
+
+
+def stale_response(request, key):
+    """
+    Ответ предыдущей версии, если ответ key вычисляется не дольше
+    stale_seconds(). ETag у него свой, от той версии.
+    """
+    started = cache.get(key + LOCK_SUFFIX)
+    if started is None or time.time() - started > stale_seconds():
+        return None
+    version = cache.get(latest_key(request))
+    data = cache.get(response_key(request, version)) \
+        if version is not None else None
+    if data is None:
+        return None
+    response = _cached(data, 'STALE', STALE_KEY)
+    response['ETag'] = make_etag(request, version)
+    return response
+
+
+def fill_response(request, key, version, build):
+    """
+    Вычисляет ответ под блокировкой ключа в кэше. Если блокировку
+    держит другой процесс, ждет его ответ в кэше или отдает предыдущую
+    версию, а по истечении lock_timeout() вычисляет сам.
+
+    Returns:
+        tuple: Ответ и данные для ждущих в процессе или None
+    """
+    lock = key + LOCK_SUFFIX
+    deadline = time.monotonic() + lock_timeout()
+    locked = cache.add(lock, time.time(), lock_timeout())
+    while not locked and time.monotonic() < deadline:
+        stale = stale_response(request, key)
+        if stale is not None:
+            return stale, None
+        time.sleep(LOCK_POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return _cached(data, 'COALESCED', COALESCED_KEY), data
+        # Блокировка снята без ответа (ошибка) - вычисляем сами
+        locked = cache.add(lock, time.time(), lock_timeout())
+
+    _increment(MISSES_KEY, 1)
+    try:
+        response = build()
+        data = None
+        if response.status_code == 200:
+            data = response.data
+            cache.set(key, data, cache_timeout())
+            cache.set(latest_key(request), version, cache_timeout())
+    finally:
+        if locked:
+            cache.delete(lock)
+    response[CACHE_HEADER] = 'MISS'
+    return response, data
+
+
+def cached_build(request, version, build):
+    """
+    Ответ из кэша или build(), вычисленный один раз на ключ (см.
+    SingleFlight и fill_response).
+    """
+    if not cache_timeout():
+        return build()
+    key = response_key(request, version)
+    data = cache.get(key)
+    if data is not None:
+        return _cached(data, 'HIT', HITS_KEY)
+
+    call, leader = _flights.join(key)
+    if not leader:
+        stale = stale_response(request, key)
+        if stale is not None:
+            return stale
+        if call.done.wait(lock_timeout()) and call.data is not None:
+            return _cached(call.data, 'COALESCED', COALESCED_KEY)
+        return fill_response(request, key, version, build)[0]
+
+    data = None
+    try:
+        response, data = fill_response(request, key, version, build)
+    finally:
+        _flights.finish(key, call, data)
+    return response
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует ответы list и retrieve ViewSet каталога. Ответы не зависят
+    от пользователя, поэтому ключ общий для всех; кэшируются только
+    успешные ответы. В заголовке X-Cache - HIT, MISS, COALESCED (ответ
+    вычислен параллельным запросом) или STALE. ETag строится из той же
+    версии каталога в БД, поэтому повторный запрос с If-None-Match не
+    читает даже кэш (см. conditional), а импорт в любом процессе меняет
+    ETag.
+
+    cache_shop_param - параметр запроса со списком id магазинов, которым
+    ограничен список (ответ тогда зависит только от их версий).
+    """
+    cache_shop_param = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    def cache_shop_ids(self, request):
+        """
+        Returns:
+            list: id магазинов из cache_shop_param или None, если ответ
+                не ограничен магазинами
+        """
+        if self.cache_shop_param is None or self.action == 'retrieve':
+            return None
+        values = []
+        for value in request.query_params.getlist(self.cache_shop_param):
+            values.extend(item for item in value.split(',') if item.strip())
+        try:
+            return [int(value) for value in values] or None
+        except ValueError:
+            # Фильтр вернет 400, а ошибки не кэшируются
+            return None
+
+    def cached_response(self, request, build):
+        """
+        304 по ETag, ответ из кэша или build(), сохраненный в кэш.
+        """
+        version = catalog_version(self.cache_shop_ids(request))
+        return conditional_response(
+            request, make_etag(request, version),
+            lambda: cached_build(request, version, build))
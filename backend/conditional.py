@@ -0,0 +1,66 @@
+"""
+Условные GET (ETag, If-None-Match) для каталога и заказов.
+
+ETag строится до чтения данных и сериализации: из URL запроса, формата
+ответа и метаданных версии - версии каталога (catalog_cache) или даты
+последнего изменения заказов. Метаданные читаются из БД, а не из кэша
+процесса, иначе импорт в другом процессе не менял бы ETag. Если клиент
+прислал совпадающий ETag, отдается 304 без тела, и ни данные, ни JSON не
+собираются.
+
+Cache-Control: ответы анонимам могут хранить общие кэши (public),
+ответы с токеном или сессией - только клиент (private). В обоих случаях
+no-cache: клиент хранит ответ, но каждый раз сверяет ETag.
+"""
+import hashlib
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VARY_HEADERS = ('Accept', 'Authorization', 'Cookie')
+
+
+def make_etag(request, *parts):
+    """
+    Сильный ETag ответа на request, зависящего от parts.
+    """
+    source = '|'.join(str(part) for part in (
+        request.build_absolute_uri(), request.accepted_renderer.format,
+        *parts))
+    return f'"{hashlib.md5(source.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    """
+    Совпадает ли etag с одним из If-None-Match. Для GET сравнение
+    слабое: W/ перед значением не учитывается.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.strip('"') in (
+        value.removeprefix('W/').strip('"') for value in etags)
+
+
+def conditional_response(request, etag, build):
+    """
+    304, если клиент прислал etag, иначе build(). У успешного ответа
+    выставляются ETag (если build не выставил свой), Cache-Control
+    и Vary.
+    """
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+    response.setdefault('ETag', etag)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, VARY_HEADERS)
+    return response
@@ -0,0 +1,73 @@
+"""
+Фасеты каталога: параметры и число предложений с каждым значением.
+
+Подсчет по ProductParameter (EAV) на каждый запрос требует
+группировки по всем предложениям категории, поэтому счетчики хранятся
+готовыми в ParameterFacet по (магазин, категория, параметр, значение).
+Импорт магазина пересчитывает только его строки одним GROUP BY, а API
+суммирует небольшое число готовых строк.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import ParameterFacet, ProductParameter
+from .utils.parameter_values import numeric_value
+
+# Сколько самых частых значений параметра отдает API
+MAX_FACET_VALUES = 50
+
+
+def rebuild_shop_facets(shop, batch_size=1000):
+    """
+    Пересчитывает счетчики магазина по его активному поколению
+    каталога. Читатели видят либо старые счетчики, либо новые.
+
+    Returns:
+        int: Количество строк счетчиков
+    """
+    rows = ProductParameter.objects.filter(
+        product_info__shop=shop,
+        product_info__generation=F('product_info__shop__catalog_generation'),
+    ).values(
+        'parameter_id', 'value',
+        category_id=F('product_info__product__category_id'),
+    ).annotate(count=Count('id')).order_by()
+    facets = [ParameterFacet(shop=shop, **row) for row in rows]
+    with transaction.atomic():
+        ParameterFacet.objects.filter(shop=shop).delete()
+        ParameterFacet.objects.bulk_create(facets, batch_size=batch_size)
+    return len(facets)
+
+
+def facet_counts(queryset):
+    """
+    Суммирует счетчики по магазинам и категориям.
+
+    Args:
+        queryset: ParameterFacet, уже отфильтрованные по магазинам
+            и категориям
+
+    Returns:
+        list: Параметры по имени, у каждого до MAX_FACET_VALUES самых
+            частых значений с числом предложений. У параметров, все
+            значения которых числа, есть min и max для ?param_min=
+            и ?param_max=
+    """
+    rows = queryset.values(
+        'parameter_id', 'value', name=F('parameter__name')
+    ).annotate(total=Sum('count')).order_by(
+        'name', 'parameter_id', '-total', 'value')
+    facets, numbers = [], []
+    for row in rows:
+        if not facets or facets[-1]['id'] != row['parameter_id']:
+            facets.append({'id': row['parameter_id'], 'name': row['name'],
+                           'values': []})
+            numbers.append([])
+        values = facets[-1]['values']
+        if len(values) < MAX_FACET_VALUES:
+            values.append({'value': row['value'], 'count': row['total']})
+        numbers[-1].append(numeric_value(row['value']))
+    for facet, values in zip(facets, numbers):
+        if None not in values:
+            facet['min'], facet['max'] = min(values), max(values)
+    return facets
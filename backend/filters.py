@@ -0,0 +1,221 @@
+"""
+Фильтры каталога для API.
+
+Параметры разбираются вручную из query_params, ошибки возвращаются
+клиенту как 400 с описанием параметра. Каждому фильтру соответствует
+индекс ProductInfo или Product (см. Meta.indexes моделей), поэтому
+фильтрация и сортировка по цене не требуют полного прохода по
+предложениям.
+"""
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+
+from .models import ProductParameter
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+SEARCH_QUERY_MAX_LENGTH = 200
+# Сколько разных параметров можно задать в ?param=
+MAX_PARAMETER_FILTERS = 10
+
+# Допустимые значения ordering и соответствующая сортировка. pk
+# добавлен для устойчивого порядка страниц при одинаковых ценах
+PRODUCT_INFO_ORDERING = {
+    'id': ('pk',),
+    'price': ('price', 'pk'),
+    '-price': ('-price', '-pk'),
+}
+
+# Поля для фильтров, которые у ProductInfo и витрины CatalogEntry
+# называются по-разному
+PRODUCT_INFO_LOOKUPS = {
+    'category': 'product__category_id',
+    'shop_state': 'shop__state',
+}
+CATALOG_ENTRY_LOOKUPS = {
+    'category': 'category_id',
+    'shop_state': 'shop_state',
+}
+
+
+def _ids(params, name):
+    """
+    Список id из параметра вида ?shop=1,2 или ?shop=1&shop=2.
+    """
+    values = []
+    for value in params.getlist(name):
+        values.extend(item for item in value.split(',') if item.strip())
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ValidationError({name: 'Ожидается список целых чисел'})
+
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    return _number(value, name)
+
+
+def _number(value, name):
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Ожидается число'})
+    if not number.is_finite():
+        raise ValidationError({name: 'Ожидается число'})
+    return number
+
+
+def _flag(params, name):
+    return str(params.get(name, '')).lower() in TRUE_VALUES
+
+
+def _parameter_values(params, name='param'):
+    """
+    Значения параметров из ?param=<id параметра>:<значение>.
+
+    Returns:
+        dict: Список значений по id параметра
+    """
+    values = {}
+    for item in params.getlist(name):
+        parameter_id, separator, value = item.partition(':')
+        if not separator or not parameter_id.isdigit():
+            raise ValidationError(
+                {name: 'Ожидается <id параметра>:<значение>'})
+        values.setdefault(int(parameter_id), []).append(value)
+    if len(values) > MAX_PARAMETER_FILTERS:
+        raise ValidationError(
+            {name: f'Не больше {MAX_PARAMETER_FILTERS} параметров'})
+    return values
+
+
+def _parameter_ranges(params):
+    """
+    Диапазоны числовых параметров из ?param_min=<id>:<число>
+    и ?param_max=<id>:<число>.
+
+    Returns:
+        dict: (нижняя граница, верхняя граница) по id параметра,
+            отсутствующая граница - None
+    """
+    ranges = {}
+    for index, name in enumerate(('param_min', 'param_max')):
+        for parameter_id, values in _parameter_values(params, name).items():
+            if len(values) > 1:
+                raise ValidationError(
+                    {name: f'Параметр {parameter_id} задан несколько раз'})
+            bounds = ranges.setdefault(parameter_id, [None, None])
+            bounds[index] = _number(values[0], name)
+    for parameter_id, (low, high) in ranges.items():
+        if low is not None and high is not None and low > high:
+            raise ValidationError({'param_min': (
+                f'Для параметра {parameter_id} больше, чем param_max')})
+    return ranges
+
+
+def filter_products(queryset, params):
+    """
+    Фильтрует товары по категориям (?category=<id,...>).
+    """
+    categories = _ids(params, 'category')
+    if categories:
+        queryset = queryset.filter(category_id__in=categories)
+    return queryset
+
+
+def filter_product_infos(queryset, params, lookups=PRODUCT_INFO_LOOKUPS):
+    """
+    Фильтрует и сортирует предложения по параметрам запроса.
+
+    Работает и с ProductInfo, и с витриной CatalogEntry (с
+    lookups=CATALOG_ENTRY_LOOKUPS); поиск q есть только у ProductInfo.
+
+    Параметры:
+        q: поисковый запрос (ProductInfoQuerySet.search)
+        shop: id магазинов через запятую
+        category: id категорий через запятую
+        price_min, price_max: диапазон цены
+        price_rrc_min, price_rrc_max: диапазон рекомендуемой цены
+        in_stock: только товары в наличии
+        active_shops: только магазины, принимающие заказы (Shop.state)
+        param: <id параметра>:<значение>, можно повторять; значения
+            одного параметра объединяются через ИЛИ, разных - через И
+        param_min, param_max: <id параметра>:<число>, диапазон
+            числового значения параметра
+        ordering: id, price или -price; с q по умолчанию результаты
+            сортируются по релевантности
+
+    Raises:
+        ValidationError: Если параметр задан неверно
+    """
+    query = params.get('q', '').strip()
+    if len(query) > SEARCH_QUERY_MAX_LENGTH:
+        raise ValidationError(
+            {'q': f'Не длиннее {SEARCH_QUERY_MAX_LENGTH} символов'})
+    if query:
+        queryset = queryset.search(query)
+
+    shops = _ids(params, 'shop')
+    if shops:
+        queryset = queryset.filter(shop_id__in=shops)
+    categories = _ids(params, 'category')
+    if categories:
+        queryset = queryset.filter(
+            **{f'{lookups["category"]}__in': categories})
+
+    for field in ('price', 'price_rrc'):
+        low = _decimal(params, f'{field}_min')
+        high = _decimal(params, f'{field}_max')
+        if low is not None and high is not None and low > high:
+            raise ValidationError(
+                {f'{field}_min': f'Больше, чем {field}_max'})
+        if low is not None:
+            queryset = queryset.filter(**{f'{field}__gte': low})
+        if high is not None:
+            queryset = queryset.filter(**{f'{field}__lte': high})
+
+    if _flag(params, 'in_stock'):
+        queryset = queryset.filter(quantity__gt=0)
+    if _flag(params, 'active_shops'):
+        queryset = queryset.filter(**{lookups['shop_state']: True})
+    # Каждый параметр - полусоединение по product_parameter_value_idx
+    for parameter_id, values in _parameter_values(params).items():
+        queryset = queryset.filter(pk__in=ProductParameter.objects.filter(
+            parameter_id=parameter_id, value__in=values
+        ).values('product_info_id'))
+    # Диапазоны - по product_parameter_numeric_idx
+    for parameter_id, (low, high) in _parameter_ranges(params).items():
+        numeric = ProductParameter.objects.filter(
+            parameter_id=parameter_id, value_numeric__isnull=False)
+        if low is not None:
+            numeric = numeric.filter(value_numeric__gte=float(low))
+        if high is not None:
+            numeric = numeric.filter(value_numeric__lte=float(high))
+        queryset = queryset.filter(
+            pk__in=numeric.values('product_info_id'))
+
+    ordering = params.get('ordering')
+    if not ordering:
+        return queryset.order_by('-rank', 'pk') if query \
+            else queryset.order_by('pk')
+    if ordering not in PRODUCT_INFO_ORDERING:
+        raise ValidationError({'ordering': (
+            f'Допустимые значения: {", ".join(PRODUCT_INFO_ORDERING)}')})
+    return queryset.order_by(*PRODUCT_INFO_ORDERING[ordering])
+
+
+def filter_facets(queryset, params):
+    """
+    Фильтрует счетчики ParameterFacet по ?shop= и ?category=.
+    """
+    shops = _ids(params, 'shop')
+    if shops:
+        queryset = queryset.filter(shop_id__in=shops)
+    categories = _ids(params, 'category')
+    if categories:
+        queryset = queryset.filter(category_id__in=categories)
+    return queryset
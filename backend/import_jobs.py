@@ -0,0 +1,338 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    DatabaseError, InterfaceError, OperationalError, close_old_connections,
+    connection, transaction
+)
+from django.utils import timezone
+
+from .import_lock import ShopImportLocked
+from .import_logic import YamlImporter
+from .models import ImportJob, Shop
+from .utils.import_profiler import ImportProfiler, NullProfiler
+from .utils.price_formats import supported_extensions
+from .utils.spooling import PriceListTooLarge
+
+logger = logging.getLogger(__name__)
+
+# Захват заданий потоками одного процесса идет по очереди: на SQLite
+# select_for_update не поддерживается
+_claim_lock = threading.Lock()
+
+
+def enqueue_import(shop, user=None, url=None, file=None, options=None):
+    """
+    Ставит импорт прайс-листа в очередь.
+
+    Ожидающие задания того же магазина заменяются новым: каждый
+    прайс-лист полный, поэтому серия повторных загрузок сводится
+    к одному импорту последней.
+
+    Загруженный файл сохраняется в IMPORT_UPLOAD_DIR, чтобы воркер
+    мог прочитать его после завершения запроса. Расширение файла
+    сохраняется, по нему воркер определяет формат прайс-листа.
+    Файл копируется частями и не больше IMPORT_MAX_SIZE; хеш его байтов
+    считается по ходу копирования и сохраняется в задании, поэтому
+    воркер не читает файл лишний раз ради отпечатка.
+
+    Returns:
+        ImportJob: Созданное задание
+
+    Raises:
+        PriceListTooLarge: Если файл больше IMPORT_MAX_SIZE
+    """
+    file_path = file_hash = ''
+    if file is not None:
+        upload_dir = settings.IMPORT_UPLOAD_DIR
+        os.makedirs(upload_dir, exist_ok=True)
+        suffix = '.yaml'
+        name = (file.name or '').lower()
+        for extension in sorted(supported_extensions(), key=len,
+                                reverse=True):
+            if name.endswith(extension):
+                suffix = extension
+                break
+        file_path = os.path.join(upload_dir, f'{uuid.uuid4().hex}{suffix}')
+        max_size = settings.IMPORT_MAX_SIZE
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with open(file_path, 'wb') as destination:
+                for chunk in file.chunks():
+                    size += len(chunk)
+                    if max_size and size > max_size:
+                        raise PriceListTooLarge(max_size)
+                    digest.update(chunk)
+                    destination.write(chunk)
+        except BaseException:
+            os.remove(file_path)
+            raise
+        file_hash = digest.hexdigest()
+
+    job = ImportJob.objects.create(
+        shop=shop,
+        user=user,
+        url=url or '',
+        file_path=file_path,
+        file_hash=file_hash,
+        options=options or {}
+    )
+    supersede_older_jobs(job)
+    return job
+
+
+def supersede_older_jobs(job):
+    """
+    Снимает с очереди ожидающие задания магазина, созданные раньше job.
+    Выполняющееся задание не прерывается: job начнется после него.
+
+    Returns:
+        int: Количество замененных заданий
+    """
+    with transaction.atomic():
+        older = list(ImportJob.objects.select_for_update().filter(
+            shop_id=job.shop_id, status='queued', id__lt=job.id
+        ).values_list('id', 'file_path'))
+        ImportJob.objects.filter(id__in=[pk for pk, _ in older]).update(
+            status='superseded',
+            result={'superseded_by': job.id},
+            finished_at=timezone.now(),
+            updated_at=timezone.now())
+        transaction.on_commit(lambda: _remove_files(
+            file_path for _, file_path in older))
+    return len(older)
+
+
+def _remove_files(paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+class Heartbeat:
+    """
+    Продлевает updated_at выполняющегося задания не чаще раза
+    в IMPORT_JOB_HEARTBEAT_SECONDS, чтобы requeue_stale_jobs не вернул
+    его в очередь. Вызывается на каждой фазе импорта, между пачками
+    удаления и пока импорт ждет блокировку магазина, поэтому долгие
+    фазы без записи товаров (загрузка, проверка, сборка старых
+    поколений, пересчет фасетов) тоже считаются признаком жизни.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = settings.IMPORT_JOB_HEARTBEAT_SECONDS \
+            if interval is None else interval
+        self.last = time.monotonic()
+
+    def __call__(self):
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            updated_at=timezone.now())
+
+
+def requeue_stale_jobs():
+    """
+    Возвращает в очередь задания, воркер которых перестал сообщать
+    о ходе выполнения (например, процесс был убит): updated_at не
+    менялся дольше IMPORT_JOB_STALE_SECONDS (см. Heartbeat). Задание
+    продолжится с контрольной точки. Исчерпавшие попытки задания
+    завершаются с ошибкой.
+
+    Returns:
+        int: Количество возвращенных заданий
+    """
+    stale_after = timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    stale = ImportJob.objects.filter(
+        status='running',
+        updated_at__lt=timezone.now() - stale_after)
+    stale.filter(attempts__gte=settings.IMPORT_JOB_MAX_ATTEMPTS).update(
+        status='failed',
+        error='Превышено число попыток выполнения',
+        finished_at=timezone.now(),
+        updated_at=timezone.now())
+    return stale.update(status='queued', updated_at=timezone.now())
+
+
+def claim_next_job():
+    """
+    Забирает из очереди самое старое задание.
+
+    Задания одного магазина выполняются строго по одному: задание не
+    выдается, пока по его магазину идет другой импорт. Из нескольких
+    ожидающих заданий магазина выполняется последнее, остальные
+    заменяются им.
+
+    Returns:
+        ImportJob или None
+    """
+    with _claim_lock, transaction.atomic():
+        running = ImportJob.objects.filter(
+            status='running').values('shop_id')
+        candidates = ImportJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(status='queued').exclude(
+            shop_id__in=running
+        ).order_by('created_at', 'id')[:10]
+
+        for job in candidates:
+            # Блокировка магазина сериализует воркеры, выбравшие
+            # разные задания одного магазина
+            Shop.objects.select_for_update().filter(pk=job.shop_id).first()
+            if ImportJob.objects.filter(
+                    shop_id=job.shop_id, status='running').exists():
+                continue
+            # Например, задание вернулось в очередь после сбоя, а за это
+            # время магазин загрузил новый прайс-лист
+            latest = ImportJob.objects.select_for_update(
+                skip_locked=True
+            ).filter(shop_id=job.shop_id, status='queued').order_by(
+                '-id').first()
+            if latest is None:
+                continue
+            if latest.pk != job.pk:
+                supersede_older_jobs(latest)
+                job = latest
+            job.status = 'running'
+            job.attempts += 1
+            job.started_at = timezone.now()
+            job.finished_at = None
+            job.save(update_fields=[
+                'status', 'attempts', 'started_at', 'finished_at',
+                'updated_at'])
+            return job
+    return None
+
+
+def run_job(job):
+    """
+    Выполняет задание импорта и сохраняет его результат.
+
+    Повторный запуск задания продолжает импорт с контрольной точки.
+    При потере соединения с БД задание возвращается в очередь, пока
+    не исчерпаны попытки.
+    """
+    def progress(processed):
+        ImportJob.objects.filter(pk=job.pk).update(
+            processed=processed, updated_at=timezone.now())
+
+    heartbeat = Heartbeat(job)
+    if job.options.get('profile'):
+        profiler = ImportProfiler(heartbeat=heartbeat)
+    else:
+        profiler = NullProfiler(heartbeat=heartbeat)
+    try:
+        result = YamlImporter.import_source(
+            job.url or job.file_path,
+            job.shop,
+            stream=job.options.get('stream', False),
+            incremental=job.options.get('incremental', False),
+            force=job.options.get('force', False),
+            progress=progress,
+            profiler=profiler,
+            resume=True,
+            job=job,
+            fmt=job.options.get('format'),
+            raw_hash=None if job.url else job.file_hash or None
+        )
+    except ShopImportLocked as e:
+        # Магазин импортируется вне очереди (import_data, refresh_shops):
+        # задание подождет, попытка не засчитывается
+        job.status = 'queued'
+        job.attempts -= 1
+        job.error = str(e)
+        job.save(update_fields=['status', 'attempts', 'error', 'updated_at'])
+        return job
+    except (OperationalError, InterfaceError) as e:
+        if job.attempts < settings.IMPORT_JOB_MAX_ATTEMPTS:
+            # Соединение могло оборваться, например при переключении БД
+            connection.close()
+            job.status = 'queued'
+            job.error = str(e)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            return job
+        job.status = 'failed'
+        job.error = str(e)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        # Отчет проверки прайс-листа отдается через import-status
+        if getattr(e, 'report', None):
+            job.result = {'validation': e.report}
+    else:
+        job.status = 'done'
+        job.processed = (result['created'] + result['updated']
+                         + result['unchanged'] + result['errors'])
+        result['shop'] = result['shop'].name
+        job.result = result
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'status', 'error', 'processed', 'result', 'finished_at',
+        'updated_at'])
+
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    return job
+
+
+def _worker_loop(once, poll_interval, stop_event):
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            try:
+                requeue_stale_jobs()
+                job = claim_next_job()
+                if job is not None:
+                    run_job(job)
+            except DatabaseError:
+                # Сбой БД не должен останавливать воркер. Задание, которое
+                # не удалось сохранить, вернется в очередь как зависшее
+                logger.exception('Ошибка очереди импорта')
+                connection.close()
+                stop_event.wait(poll_interval)
+                continue
+            if job is None:
+                if once:
+                    break
+                stop_event.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def run_worker(concurrency=1, once=False, poll_interval=2.0,
+               stop_event=None):
+    """
+    Запускает concurrency потоков, выполняющих задания из очереди.
+    У каждого потока свое соединение с БД.
+
+    Args:
+        concurrency: Количество одновременно выполняемых заданий
+        once: Завершиться, когда очередь опустеет
+        poll_interval: Пауза между опросами пустой очереди, сек
+        stop_event: threading.Event для остановки воркера
+    """
+    stop_event = stop_event or threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(_worker_loop, once, poll_interval, stop_event)
+            for _ in range(concurrency)
+        ]
+        try:
+            while not all(future.done() for future in futures):
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            stop_event.set()
+        for future in futures:
+            future.result()
@@ -0,0 +1,119 @@
+"""
+Блокировка импорта по магазину.
+
+Импорт пишет каталог несколькими транзакциями (по пачке), поэтому
+блокировка держится на сессии, а не на транзакции. На PostgreSQL это
+pg_advisory_lock: она общая для всех процессов (воркеры очереди,
+import_data, refresh_shops) и снимается сама, если соединение
+оборвалось. На других БД (SQLite в тестах и при разработке) импорты
+сериализуются блокировкой потоков внутри процесса.
+"""
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+# Первый ключ pg_advisory_lock(int, int): пространство блокировок
+# импорта, чтобы не пересечься с другими advisory-блокировками
+LOCK_NAMESPACE = zlib.crc32(b'backend.import') & 0x7fffffff
+# Пауза между попытками взять занятую блокировку, сек
+LOCK_POLL_INTERVAL = 0.2
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+class ShopImportLocked(ValueError):
+    """
+    Блокировку магазина не удалось взять за IMPORT_LOCK_TIMEOUT.
+    """
+
+    def __init__(self):
+        super().__init__(
+            'Импорт этого магазина уже выполняется, повторите позже')
+
+
+def lock_key(shop=None, shop_name=None):
+    """
+    Ключ блокировки: хеш названия магазина без учета регистра и
+    пробелов по краям. Для магазина из БД берется его название, для
+    еще не созданного - shop_name из прайс-листа, поэтому первые
+    импорты нового магазина и импорты уже созданного получают один
+    ключ. Совпадение хешей разных названий только сериализует их
+    импорты.
+    """
+    name = shop.name if shop is not None else shop_name
+    normalized = (name or '').strip().casefold()
+    return zlib.crc32(normalized.encode('utf-8')) & 0x7fffffff
+
+
+class ShopImportLock:
+    """
+    Сессионная блокировка импорта одного магазина.
+
+    Использование:
+        with ShopImportLock(lock_key(shop)):
+            ...
+
+    Args:
+        key: Ключ из lock_key()
+        timeout: Сколько ждать занятую блокировку, сек (по умолчанию
+            IMPORT_LOCK_TIMEOUT); 0 - не ждать
+        on_wait: Функция, вызываемая между попытками взять занятую
+            блокировку (например, heartbeat задания импорта)
+    """
+
+    def __init__(self, key, timeout=None, on_wait=None):
+        self.key = key
+        self.timeout = settings.IMPORT_LOCK_TIMEOUT \
+            if timeout is None else timeout
+        self.on_wait = on_wait
+
+    def acquire(self):
+        """
+        Raises:
+            ShopImportLocked: Если блокировка занята дольше timeout
+        """
+        deadline = time.monotonic() + self.timeout
+        while not self._try_acquire():
+            if time.monotonic() >= deadline:
+                raise ShopImportLocked()
+            if self.on_wait is not None:
+                self.on_wait()
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def release(self):
+        if connection.vendor != 'postgresql':
+            _local_lock(self.key).release()
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)',
+                               [LOCK_NAMESPACE, self.key])
+        except DatabaseError:
+            # Соединение оборвалось, блокировка снята вместе с сессией
+            pass
+
+    def _try_acquire(self):
+        if connection.vendor != 'postgresql':
+            return _local_lock(self.key).acquire(blocking=False)
+        # Блокировка принадлежит соединению текущего потока
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)',
+                           [LOCK_NAMESPACE, self.key])
+            return cursor.fetchone()[0]
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+def _local_lock(key):
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, threading.Lock())
@@ -1,6 +1,123 @@
+import itertools
+import logging
+from collections import ChainMap
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
 import yaml
 import requests
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .catalog import build_entry, replace_entries, update_shop_entries
+from .catalog_cache import bump_catalog_version
+from .facets import rebuild_shop_facets
+from .import_lock import ShopImportLock, lock_key
+from .models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter,
+    OrderItem, ImportCheckpoint, CatalogEntry
+)
+from .utils.fingerprint import (
+    DataHasher, HashingReader, hash_file, hash_fileobj
+)
+from .utils.import_profiler import NULL_PROFILER
+from .utils.parameter_values import numeric_value
+from .utils.price_formats import (
+    guess_format, load_price_list, stream_price_list
+)
+from .utils.price_list_validation import (
+    MAX_PRICE, NAME_MAX_LENGTH, PARAM_NAME_MAX_LENGTH,
+    PARAM_VALUE_MAX_LENGTH, PRICE_STEP, validate_price_list
+)
+from .utils.search import build_search_text
+from .utils.spooling import (
+    LimitedReader, check_content_length, spool_response
+)
+
+logger = logging.getLogger(__name__)
+
+# Размер пачки для bulk_create по умолчанию (переопределяется IMPORT_BATCH_SIZE)
+DEFAULT_BATCH_SIZE = 1000
+
+# Сколько сообщений об ошибках товаров сохраняется в результате импорта
+MAX_ERROR_MESSAGES = 50
+
+
+def batched(iterable, size):
+    """
+    Разбивает итерируемый объект на списки длиной не больше size.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def normalize_good(item):
+    """
+    Приводит товар из прайс-листа к виду, пригодному для записи в БД.
+
+    Returns:
+        dict: Нормализованные поля товара и его параметры
+
+    Raises:
+        ValueError: Если товар не проходит проверку
+    """
+    if not isinstance(item, dict):
+        raise ValueError('товар должен быть словарем')
+    try:
+        name = str(item['name'])
+        external_id = int(item['id'])
+        quantity = int(item['quantity'])
+        price = Decimal(str(item['price']))
+        price_rrc = Decimal(str(item['price_rrc']))
+    except KeyError as e:
+        raise ValueError(f'отсутствует поле {e}')
+    except (TypeError, ValueError, InvalidOperation) as e:
+        raise ValueError(f'неверное значение: {e}')
+
+    model = str(item.get('model') or '')
+    if len(name) > NAME_MAX_LENGTH or len(model) > NAME_MAX_LENGTH:
+        raise ValueError('слишком длинное название или модель')
+    if external_id < 0 or quantity < 0:
+        raise ValueError('id и quantity не могут быть отрицательными')
+    if not price.is_finite() or not price_rrc.is_finite():
+        raise ValueError('неверная цена')
+    if price < 0 or price_rrc < 0:
+        raise ValueError('цена не может быть отрицательной')
+    # Округляем так же, как БД, чтобы сравнение с сохраненной ценой
+    # в инкрементальном режиме было точным
+    try:
+        price = price.quantize(PRICE_STEP, rounding=ROUND_HALF_UP)
+        price_rrc = price_rrc.quantize(PRICE_STEP, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError('слишком большая цена')
+    if price >= MAX_PRICE or price_rrc >= MAX_PRICE:
+        raise ValueError('слишком большая цена')
+
+    parameters = {}
+    for param_name, param_value in (item.get('parameters') or {}).items():
+        param_name, param_value = str(param_name), str(param_value)
+        if len(param_name) > PARAM_NAME_MAX_LENGTH \
+                or len(param_value) > PARAM_VALUE_MAX_LENGTH:
+            raise ValueError(f'слишком длинный параметр {param_name}')
+        parameters[param_name] = param_value
+
+    return {
+        'name': name,
+        'external_id': external_id,
+        'model': model,
+        'quantity': quantity,
+        'price': price,
+        'price_rrc': price_rrc,
+        'parameters': parameters,
+        'search_text': build_search_text(name, model, parameters),
+    }
 
 
 class YamlImporter:
@@ -24,12 +141,9 @@ class YamlImporter:
             ValueError: Если источник недоступен или невалидный
         """
         if source.startswith(('http://', 'https://')):
-            try:
-                response = requests.get(source, timeout=10)
-                response.raise_for_status()
-                return yaml.safe_load(response.content)
-            except requests.RequestException as e:
-                raise ValueError(f'Ошибка загрузки по URL: {e}')
+            spooled = YamlImporter._spool_url(source)
+            with spooled:
+                return load_price_list(spooled, 'yaml', source)
         else:
             try:
                 with open(source, 'r', encoding='utf-8') as file:
@@ -40,13 +154,436 @@ class YamlImporter:
                 raise ValueError(f'Ошибка YAML: {e}')
 
     @staticmethod
-    def process_data(data, shop=None):
+    def import_source(source, shop=None, stream=False, incremental=False,
+                      force=False, batch_size=None, progress=None,
+                      profiler=None, validate=True, resume=False, job=None,
+                      fmt=None, raw_hash=None):
+        """
+        Полный цикл импорта: загрузка, сверка отпечатка и запись.
+
+        Прайс-лист может быть в YAML, JSON Lines или CSV, в том числе
+        сжатым gzip (см. utils.price_formats).
+
+        Если отпечаток прайс-листа совпадает с последним успешным
+        импортом магазина, данные не записываются и возвращается
+        результат со статусом unchanged.
+
+        До любой записи прайс-лист целиком проверяется
+        validate_price_list. В потоковом режиме для этого делается
+        отдельный проход по файлу, ответ по URL сначала сохраняется
+        во временный файл.
+
+        С resume=True или job после каждой пачки сохраняется контрольная
+        точка (ImportCheckpoint), и прерванный импорт того же файла
+        продолжается с первой незаписанной пачки. Без них записанная
+        часть прерванного полного импорта удаляется.
+
+        Args:
+            source: Путь к файлу, URL или файловый объект
+            shop: Существующий магазин (для PartnerUpdate) или None
+            stream: Потоковый разбор товаров
+            incremental: Записывать только разницу с текущим каталогом
+            force: Импортировать даже при совпадении отпечатка
+            batch_size: Размер пачки
+            progress: Функция для отчета о ходе импорта
+            profiler: ImportProfiler; его отчет добавляется в результат
+                под ключом profile. NullProfiler с heartbeat сообщает
+                о ходе импорта без замеров
+            validate: Проверять прайс-лист до записи
+            fmt: Формат прайс-листа (yaml, jsonl, csv); по умолчанию
+                определяется по Content-Type, расширению и содержимому
+            resume: Продолжить с контрольной точки, если она есть
+            job: ImportJob, к которому привязывается контрольная точка
+            raw_hash: Хеш байтов файла source, если уже известен
+                (посчитан при сохранении загрузки); файл тогда не
+                читается лишний раз
+
+        Returns:
+            dict: Результат импорта
+
+        Raises:
+            PriceListValidationError: Прайс-лист не прошел проверку,
+                отчет в атрибуте report
+        """
+        options = {
+            'stream': stream,
+            'incremental': incremental,
+            'force': force,
+            'batch_size': batch_size,
+            'progress': progress,
+            'validate': validate,
+            'resume': resume,
+            'job': job,
+            'fmt': fmt,
+            'raw_hash': raw_hash,
+        }
+        with profiler or NULL_PROFILER as active_profiler:
+            result = YamlImporter._import_source(
+                source, shop, active_profiler, options)
+            active_profiler.rows = result['created'] + result['updated'] \
+                + result['unchanged']
+            active_profiler.errors = result['errors']
+        report = active_profiler.report()
+        if report is not None:
+            result['profile'] = report
+        return result
+
+    @staticmethod
+    def _import_source(source, shop, profiler, options):
+        if not (options['stream'] and options['validate']):
+            return YamlImporter._import_loaded(
+                source, shop, profiler, options)
+
+        # Потоковый прайс-лист проверяется отдельным проходом, поэтому
+        # его нужно уметь прочитать дважды
+        with profiler.phase('load'):
+            spooled = YamlImporter._spool_url(source)
+        try:
+            # Формат берется из адреса, а не из временного файла
+            if spooled and not options['fmt']:
+                options = dict(
+                    options, fmt=guess_format(source, spooled.content_type))
+            with profiler.phase('validate'):
+                YamlImporter._validate_stream(
+                    spooled or source, options['fmt'],
+                    source if spooled else None)
+            return YamlImporter._import_loaded(
+                spooled or source, shop, profiler,
+                dict(options, validate=False), source_name=source)
+        finally:
+            if spooled:
+                spooled.close()
+
+    @staticmethod
+    def _import_loaded(source, shop, profiler, options, source_name=None):
+        with profiler.phase('load'):
+            data, raw_hash, reader = YamlImporter._load_source(
+                source, options['stream'], options['fmt'],
+                source_name if isinstance(source_name, str) else None,
+                options['raw_hash'])
+        if not data or 'shop' not in data:
+            raise ValueError('Неверный формат прайс-листа')
+
+        known_shop = shop or Shop.objects.filter(name=data['shop']).first()
+        # Импорты одного магазина выполняются строго по одному. Повтор
+        # того же прайс-листа, дождавшись блокировки, пропускается по
+        # отпечатку, сохраненному первым импортом
+        try:
+            with profiler.phase('lock'):
+                lock, known_shop = YamlImporter._lock_shop(
+                    known_shop, data['shop'], profiler)
+        except BaseException:
+            YamlImporter._close_goods(data)
+            raise
+        try:
+            return YamlImporter._import_locked(
+                data, raw_hash, reader, shop, known_shop, source, profiler,
+                options, source_name)
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _lock_shop(known_shop, shop_name, profiler):
+        """
+        Берет блокировку импорта магазина (см. lock_key).
+
+        Пока импорт ждал блокировку, отпечаток магазина мог измениться,
+        новый магазин - появиться, а название - смениться другим
+        импортом. Если из-за этого ключ стал другим, блокировка
+        берется заново.
+
+        Returns:
+            tuple: Взятая ShopImportLock и магазин из БД или None
+        """
+        while True:
+            lock = ShopImportLock(lock_key(known_shop, shop_name),
+                                  on_wait=profiler.heartbeat)
+            lock.acquire()
+            try:
+                if known_shop is not None:
+                    known_shop.refresh_from_db()
+                else:
+                    known_shop = Shop.objects.filter(
+                        name=shop_name).first()
+            except BaseException:
+                lock.release()
+                raise
+            if lock_key(known_shop, shop_name) == lock.key:
+                return lock, known_shop
+            lock.release()
+
+    @staticmethod
+    def _import_locked(data, raw_hash, reader, shop, known_shop, source,
+                       profiler, options, source_name):
+        """
+        Импорт разобранного прайс-листа под блокировкой магазина.
+        """
+        stream, force = options['stream'], options['force']
+        if not force and YamlImporter._is_unchanged(known_shop, raw_hash):
+            YamlImporter._close_goods(data)
+            return YamlImporter._unchanged_result(known_shop)
+
+        if options['validate']:
+            with profiler.phase('validate'):
+                validate_price_list(data)
+
+        hasher = DataHasher(data['shop'], data.get('categories'))
+        if stream:
+            data['goods'] = hasher.wrap(data.get('goods') or [])
+        else:
+            with profiler.phase('fingerprint'):
+                for item in data.get('goods') or []:
+                    hasher.update(item)
+                data_hash = hasher.hexdigest()
+            if not force and YamlImporter._is_unchanged(
+                    known_shop, data_hash=data_hash):
+                YamlImporter._save_fingerprint(
+                    known_shop, raw_hash, data_hash)
+                return YamlImporter._unchanged_result(known_shop)
+
+        # Контрольная точка нужна, только если импорт будут продолжать
+        # (resume, задание очереди). Без хеша файла заранее (поток по URL
+        # без проверки) нельзя убедиться, что продолжается тот же
+        # прайс-лист
+        checkpoint = None
+        if raw_hash and (options['resume'] or options['job'] is not None):
+            source_name = source_name or source
+            checkpoint = {
+                'source': source_name if isinstance(source_name, str)
+                else getattr(source_name, 'name', ''),
+                'source_hash': raw_hash,
+                'resume': options['resume'],
+                'job': options['job'],
+            }
+
+        result = YamlImporter.process_data(
+            data, shop, batch_size=options['batch_size'],
+            incremental=options['incremental'],
+            progress=options['progress'], profiler=profiler,
+            checkpoint=checkpoint)
+
+        # Отпечаток сохраняется только после полностью успешного импорта
+        if not result['failed_batches']:
+            with profiler.phase('fingerprint'):
+                YamlImporter._save_fingerprint(
+                    result['shop'],
+                    raw_hash or (reader.hexdigest() if reader else ''),
+                    hasher.hexdigest())
+        result['status'] = 'imported'
+        return result
+
+    @staticmethod
+    def _spool_url(source):
+        """
+        Скачивает прайс-лист по URL частями во временный файл, который
+        держится в памяти, пока не превысит SPOOL_MAX_SIZE. Хеш байтов
+        считается по ходу загрузки, размер ограничен IMPORT_MAX_SIZE.
+
+        Returns:
+            SpooledTemporaryFile или None, если source не URL
+        """
+        if not isinstance(source, str) or not source.startswith(
+                ('http://', 'https://')):
+            return None
+        try:
+            with requests.get(source, stream=True, timeout=10) as response:
+                response.raise_for_status()
+                return spool_response(response, settings.IMPORT_MAX_SIZE)
+        except requests.RequestException as e:
+            raise ValueError(f'Ошибка загрузки по URL: {e}')
+
+    @staticmethod
+    def _validate_stream(source, fmt=None, name=None):
+        """
+        Проверяет прайс-лист потоковым проходом, не загружая товары
+        в память.
+        """
+        if isinstance(source, str):
+            try:
+                file = open(source, 'rb')
+            except FileNotFoundError:
+                raise ValueError(f'Файл не найден: {source}')
+            data = stream_price_list(
+                file, fmt, name or source,
+                max_size=settings.IMPORT_MAX_SIZE, on_close=file.close)
+        else:
+            data = stream_price_list(
+                source, fmt, name, getattr(source, 'content_type', None),
+                max_size=settings.IMPORT_MAX_SIZE)
+        try:
+            validate_price_list(data)
+        finally:
+            YamlImporter._close_goods(data)
+            if not isinstance(source, str):
+                source.seek(0)
+
+    @staticmethod
+    def _load_source(source, stream, fmt=None, name=None, raw_hash=None):
+        """
+        Загружает прайс-лист любого поддерживаемого формата и считает
+        хеш исходных байтов.
+
+        Args:
+            fmt: Формат (yaml, jsonl, csv) или None для автоопределения
+            name: Имя источника для определения формата по расширению
+            raw_hash: Известный заранее хеш файла по пути source
+
+        Returns:
+            tuple: Данные, хеш байтов (если известен заранее) и
+                HashingReader, если хеш считается по ходу чтения
+        """
+        is_url = isinstance(source, str) and source.startswith(
+            ('http://', 'https://'))
+        if name is None:
+            name = source if isinstance(source, str) \
+                else getattr(source, 'name', None)
+        if not isinstance(name, str):
+            name = None
+
+        max_size = settings.IMPORT_MAX_SIZE
+        # Разбор идет из файла, а не из копии содержимого в памяти
+        if not stream:
+            if is_url:
+                with YamlImporter._spool_url(source) as spooled:
+                    data = load_price_list(
+                        spooled, fmt, name, spooled.content_type,
+                        max_size=max_size)
+                return data, spooled.raw_hash, None
+            if isinstance(source, str):
+                try:
+                    raw_hash = raw_hash or hash_file(source)
+                    with open(source, 'rb') as file:
+                        data = load_price_list(
+                            file, fmt, name, max_size=max_size)
+                except FileNotFoundError:
+                    raise ValueError(f'Файл не найден: {source}')
+                return data, raw_hash, None
+            raw_hash = YamlImporter._fileobj_hash(source)
+            return load_price_list(
+                source, fmt, name, getattr(source, 'content_type', None),
+                max_size=max_size), raw_hash, None
+
+        if not isinstance(source, str):
+            raw_hash = YamlImporter._fileobj_hash(source)
+            return stream_price_list(
+                source, fmt, name, getattr(source, 'content_type', None),
+                max_size=max_size), raw_hash, None
+        if not is_url:
+            try:
+                raw_hash = raw_hash or hash_file(source)
+                file = open(source, 'rb')
+            except FileNotFoundError:
+                raise ValueError(f'Файл не найден: {source}')
+            data = stream_price_list(
+                file, fmt, name, max_size=max_size, on_close=file.close)
+            return data, raw_hash, None
+
+        # Ответ по URL читается потоком, хеш будет известен в конце
+        try:
+            response = requests.get(source, stream=True, timeout=10)
+            response.raise_for_status()
+            check_content_length(response, max_size)
+        except requests.RequestException as e:
+            raise ValueError(f'Ошибка загрузки по URL: {e}')
+        except ValueError:
+            response.close()
+            raise
+        # Content-Encoding: gzip распаковывается при чтении
+        response.raw.decode_content = True
+        reader = HashingReader(LimitedReader(response.raw, max_size))
+        data = stream_price_list(
+            reader, fmt, name, response.headers.get('Content-Type'),
+            max_size=max_size, on_close=response.close)
+        return data, None, reader
+
+    @staticmethod
+    def _fileobj_hash(file):
+        """
+        Хеш файлового объекта: посчитанный при сохранении во временный
+        файл (spool_chunks) или заново по содержимому.
+        """
+        raw_hash = getattr(file, 'raw_hash', None)
+        if raw_hash:
+            file.seek(0)
+            return raw_hash
+        return hash_fileobj(file)
+
+    @staticmethod
+    def _close_goods(data):
+        """
+        Закрывает потоковый источник, если товары не будут прочитаны.
+        """
+        goods = data.get('goods')
+        if hasattr(goods, 'close'):
+            goods.close()
+
+    @staticmethod
+    def _is_unchanged(shop, raw_hash=None, data_hash=None):
+        if shop is None:
+            return False
+        return bool(
+            (raw_hash and shop.import_raw_hash == raw_hash)
+            or (data_hash and shop.import_data_hash == data_hash))
+
+    @staticmethod
+    def _save_fingerprint(shop, raw_hash, data_hash):
+        shop.import_raw_hash = raw_hash or ''
+        shop.import_data_hash = data_hash or ''
+        Shop.objects.filter(pk=shop.pk).update(
+            import_raw_hash=shop.import_raw_hash,
+            import_data_hash=shop.import_data_hash)
+
+    @staticmethod
+    def _unchanged_result(shop):
+        products = ProductInfo.objects.filter(
+            shop=shop, generation=shop.catalog_generation).count()
+        return {
+            'shop': shop,
+            'status': 'unchanged',
+            'categories': shop.categories.count(),
+            'products': products,
+            'created': 0,
+            'updated': 0,
+            'unchanged': products,
+            'deleted': 0,
+            'errors': 0,
+            'failed_batches': 0,
+            'error_messages': []
+        }
+
+    @staticmethod
+    def process_data(data, shop=None, batch_size=None, incremental=False,
+                     progress=None, profiler=None, checkpoint=None):
         """
         Основная логика обработки YAML данных.
 
+        Товары записываются пачками через bulk_create, поэтому число
+        запросов к БД растет с числом пачек, а не с числом товаров.
+
+        Полный импорт собирает новое поколение каталога рядом с активным,
+        которое покупатели продолжают видеть. Готовое поколение
+        включается одним UPDATE магазина, после чего старые удаляются
+        пачками. При ошибке собранная часть удаляется, а активным
+        остается прежнее поколение. Инкрементальный импорт меняет
+        активное поколение на месте. Если каталог изменился, счетчики
+        фасетов магазина пересчитываются. В конце растет версия каталога
+        магазина, и кэшированные ответы API с ним устаревают.
+
+        С checkpoint вместе с каждой пачкой сохраняется контрольная
+        точка. Если импорт прервется, собранная часть поколения остается
+        в БД, и повторный запуск с resume продолжит запись с нее.
+
         Args:
             data: Данные из YAML
             shop: Существующий магазин (для PartnerUpdate) или None
+            batch_size: Размер пачки (по умолчанию IMPORT_BATCH_SIZE)
+            incremental: Записывать только разницу с текущим каталогом
+                магазина вместо полной перезаписи
+            progress: Функция, получающая число обработанных товаров
+                после каждой пачки
+            profiler: ImportProfiler для замера фаз импорта
+            checkpoint: Словарь source, source_hash, resume и job для
+                контрольной точки или None
 
         Returns:
             dict: Результат импорта
@@ -54,88 +591,640 @@ class YamlImporter:
         if not data or 'shop' not in data:
             raise ValueError('Неверный формат YAML файла')
 
+        profiler = profiler or NULL_PROFILER
+
+        batch_size = batch_size or getattr(
+            settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
         shop_name = data['shop']
-        categories = data.get('categories', [])
-        goods = data.get('goods', [])
+        categories = data.get('categories') or []
+        goods = data.get('goods') or []
+
+        with profiler.phase('categories'):
+            shop = YamlImporter._import_shop(shop, shop_name)
+            category_map = YamlImporter._import_categories(
+                categories, shop, batch_size)
+
+        saved = None
+        if checkpoint is not None:
+            saved = YamlImporter._open_checkpoint(
+                shop, incremental, **checkpoint)
+            generation = saved.generation
+        elif incremental:
+            generation = shop.catalog_generation
+        else:
+            generation = YamlImporter._next_generation(shop)
+
+        with profiler.phase('preload'):
+            writer = CatalogWriter(
+                shop, category_map, batch_size, incremental, progress,
+                generation, profiler, saved)
+        try:
+            stats = writer.write(goods)
+            if not incremental and stats['failed_batches']:
+                raise ValueError(
+                    f'Не записано пачек товаров: {stats["failed_batches"]}, '
+                    f'каталог магазина не изменен. {writer.batch_error}')
+        except BaseException:
+            # Инкрементальный импорт мог успеть записать часть пачек
+            bump_catalog_version(shop)
+            # С контрольной точкой записанная часть нужна для продолжения
+            if not incremental and saved is None:
+                with profiler.phase('delete'):
+                    YamlImporter._delete_generations(
+                        ProductInfo.objects.filter(
+                            shop=shop, generation=generation),
+                        batch_size, profiler.heartbeat)
+            raise
+
+        if not incremental:
+            with profiler.phase('activate'):
+                YamlImporter._activate_generation(shop, generation)
+            with profiler.phase('delete'):
+                stats['deleted'] += YamlImporter._delete_generations(
+                    ProductInfo.objects.filter(shop=shop).exclude(
+                        generation=generation),
+                    batch_size, profiler.heartbeat)
+        if not incremental or stats['created'] or stats['updated'] \
+                or stats['deleted']:
+            with profiler.phase('facets'):
+                rebuild_shop_facets(shop, batch_size)
+        # Импорт завершен, продолжать больше нечего
+        ImportCheckpoint.objects.filter(shop=shop).delete()
+        bump_catalog_version(shop)
 
+        return {
+            'shop': shop,
+            'categories': len(category_map),
+            'products': stats['created'] + stats['updated']
+            + stats['unchanged'],
+            **stats,
+            'resumed_from': saved.resumed_from if saved else 0,
+            'error_messages': writer.error_messages
+        }
+
+    @staticmethod
+    def _open_checkpoint(shop, incremental, source, source_hash,
+                         resume=False, job=None):
+        """
+        Находит контрольную точку для продолжения импорта или создает
+        новую.
+
+        Точка годится, только если файл тот же, а записываемое поколение
+        все еще актуально: для полного импорта оно не было включено или
+        удалено более поздним импортом, для инкрементального совпадает
+        с активным.
+
+        Returns:
+            ImportCheckpoint: С атрибутом resumed_from - сколько товаров
+                уже записано
+        """
+        checkpoints = ImportCheckpoint.objects.filter(
+            shop=shop, source_hash=source_hash, incremental=incremental)
+        if job is not None:
+            checkpoints = checkpoints.filter(job=job)
+        saved = checkpoints.order_by('-updated_at').first() \
+            if resume else None
+        if saved is not None:
+            if incremental:
+                valid = saved.generation == shop.catalog_generation
+            else:
+                valid = saved.generation > shop.catalog_generation
+            if valid:
+                saved.resumed_from = saved.offset
+                return saved
+
+        # Начинаем заново: старые точки магазина больше не понадобятся
+        ImportCheckpoint.objects.filter(shop=shop).delete()
+        generation = shop.catalog_generation if incremental \
+            else YamlImporter._next_generation(shop)
+        saved = ImportCheckpoint.objects.create(
+            shop=shop,
+            job=job,
+            source=str(source)[:500],
+            source_hash=source_hash,
+            incremental=incremental,
+            generation=generation)
+        saved.resumed_from = 0
+        return saved
+
+    @staticmethod
+    def _import_shop(shop, shop_name):
+        """
+        Создает магазин из прайс-листа или обновляет имя существующего.
+        """
         # Создаем или получаем магазин
         if shop:
+            # Поколение могло смениться с момента загрузки магазина
+            shop.refresh_from_db(fields=['catalog_generation'])
             # Обновляем существующий магазин
             if shop.name != shop_name:
                 shop.name = shop_name
                 shop.save()
+                update_shop_entries(shop)
         else:
             shop, _ = Shop.objects.get_or_create(
                 name=shop_name,
                 defaults={'state': True}
             )
+        return shop
+
+    @staticmethod
+    def _delete_offers(queryset):
+        """
+        Удаляет предложения вместе с зависимыми строками.
+
+        Зависимые таблицы чистятся одним DELETE с подзапросом, чтобы
+        каскад Django не загружал все строки магазина в память.
+
+        Returns:
+            int: Количество удаленных предложений
+        """
+        ids = queryset.values('id')
+        with transaction.atomic():
+            ProductParameter.objects.filter(product_info__in=ids).delete()
+            OrderItem.objects.filter(product_info__in=ids).delete()
+            CatalogEntry.objects.filter(product_info__in=ids).delete()
+            # Зависимых строк уже нет, поэтому каскад не нужен
+            return queryset._raw_delete(queryset.db)
 
-        # Обрабатываем категории
-        category_map = {}
+    @staticmethod
+    def _next_generation(shop):
+        """
+        Номер для нового поколения каталога магазина. Учитываются и
+        остатки прерванных сборок, чтобы не пересечься с ними.
+        """
+        latest = ProductInfo.objects.filter(shop=shop).aggregate(
+            latest=Max('generation'))['latest']
+        return max(latest or 0, shop.catalog_generation) + 1
+
+    @staticmethod
+    def _activate_generation(shop, generation):
+        """
+        Делает поколение активным. Читатели видят либо старый каталог,
+        либо новый целиком.
+        """
+        Shop.objects.filter(pk=shop.pk).update(catalog_generation=generation)
+        shop.catalog_generation = generation
+
+    @staticmethod
+    def _delete_generations(queryset, batch_size, heartbeat=None):
+        """
+        Удаляет предложения пачками, каждая в своей транзакции, чтобы
+        не держать длинных блокировок.
+
+        Args:
+            heartbeat: Функция, вызываемая перед каждой пачкой
+
+        Returns:
+            int: Количество удаленных предложений
+        """
+        deleted = 0
+        while True:
+            if heartbeat is not None:
+                heartbeat()
+            ids = list(queryset.order_by('id').values_list(
+                'id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += YamlImporter._delete_offers(
+                ProductInfo.objects.filter(pk__in=ids))
+
+    @staticmethod
+    def _import_categories(categories, shop, batch_size):
+        """
+        Создает недостающие категории и привязывает их к магазину.
+
+        Returns:
+            dict: Категории по id из прайс-листа
+        """
+        names = {}
         for cat_data in categories:
             category_id = cat_data.get('id')
             category_name = cat_data.get('name')
 
             if not category_id or not category_name:
                 continue
+            names.setdefault(category_id, category_name)
 
-            category, _ = Category.objects.get_or_create(
-                id=category_id,
-                defaults={'name': category_name}
-            )
-            category.shops.add(shop)
-            category_map[category_id] = category
+        category_map = Category.objects.in_bulk(list(names))
+        missing = [
+            Category(id=category_id, name=category_name)
+            for category_id, category_name in names.items()
+            if category_id not in category_map
+        ]
+        Category.objects.bulk_create(
+            missing, batch_size=batch_size, ignore_conflicts=True)
+        category_map.update((category.id, category) for category in missing)
 
-        # Очищаем старые товары магазина
-        ProductInfo.objects.filter(shop=shop).delete()
+        if category_map:
+            shop.categories.add(*category_map.values())
+        return category_map
 
-        # Обрабатываем товары
-        imported_count = 0
-        for item in goods:
-            try:
-                category_id = item.get('category')
-                if category_id not in category_map:
-                    continue
 
-                category = category_map[category_id]
+class CatalogWriter:
+    """
+    Пакетная запись товаров одного магазина.
+
+    Существующие продукты и параметры загружаются в словари заранее,
+    новые создаются через bulk_create. Каждая пачка пишется в своей
+    транзакции.
 
-                # Создаем или получаем продукт
-                product, _ = Product.objects.get_or_create(
-                    name=item['name'],
-                    category=category
-                )
+    В инкрементальном режиме предложения сопоставляются по
+    (shop, external_id): меняются только отличающиеся строки, id
+    существующих предложений сохраняются, а отсутствующие в прайс-листе
+    удаляются в конце импорта.
+
+    Предложения пишутся в заданное поколение каталога магазина
+    (по умолчанию в активное). Записи витрины (CatalogEntry) новых и
+    измененных предложений пишутся в транзакции той же пачки.
+
+    С контрольной точкой (ImportCheckpoint) число записанных товаров
+    сохраняется в транзакции каждой пачки, а уже записанные товары
+    при продолжении импорта пропускаются. Ошибка записи пачки в этом
+    режиме прерывает импорт, чтобы его можно было продолжить с нее.
+    """
+
+    OFFER_FIELDS = ('product_id', 'model', 'quantity', 'price', 'price_rrc',
+                    'search_text')
+
+    def __init__(self, shop, category_map, batch_size, incremental=False,
+                 progress=None, generation=None, profiler=None,
+                 checkpoint=None):
+        self.shop = shop
+        self.checkpoint = checkpoint
+        self.profiler = profiler or NULL_PROFILER
+        self.generation = shop.catalog_generation if generation is None \
+            else generation
+        self.category_map = category_map
+        self.categories = {category.id: category
+                           for category in category_map.values()}
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.progress = progress
+        self.error_messages = []
+        self.batch_error = None
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0,
+                      'deleted': 0, 'errors': 0, 'failed_batches': 0}
+        if checkpoint is not None:
+            self.stats.update(checkpoint.stats)
+
+        self.product_ids = {
+            (name, category_id): product_id
+            for product_id, name, category_id in Product.objects.filter(
+                category__in=list(category_map.values())
+            ).order_by().values_list('id', 'name', 'category_id')}
+        self.parameter_ids = dict(
+            Parameter.objects.order_by().values_list('name', 'id'))
+
+        # Ключи уже записанных товаров для отсева дубликатов
+        self.seen = set()
+        if incremental:
+            self.existing_ids = set(self.offers().values_list(
+                'id', flat=True))
+            self.matched_ids = set()
+
+    def offers(self):
+        """
+        Предложения магазина в записываемом поколении.
+        """
+        return ProductInfo.objects.filter(
+            shop=self.shop, generation=self.generation)
 
-                # Создаем информацию о продукте
-                product_info = ProductInfo.objects.create(
-                    product=product,
-                    shop=shop,
-                    external_id=item['id'],
-                    model=item.get('model', ''),
-                    quantity=item['quantity'],
-                    price=item['price'],
-                    price_rrc=item['price_rrc']
+    def write(self, goods):
+        """
+        Записывает все товары и возвращает статистику импорта.
+        """
+        processed = 0
+        goods = iter(self.profiler.iterate('parse', goods))
+        if self.checkpoint is not None and self.checkpoint.offset:
+            with self.profiler.phase('resume'):
+                processed = self.skip_written(goods, self.checkpoint.offset)
+        for batch in batched(goods, self.batch_size):
+            processed += len(batch)
+            self.write_batch(batch, processed)
+            if self.progress:
+                with self.profiler.phase('progress'):
+                    self.progress(processed)
+        if self.incremental:
+            with self.profiler.phase('delete'):
+                self.delete_missing()
+        return self.stats
+
+    def skip_written(self, goods, count):
+        """
+        Пропускает товары, записанные до прерывания импорта.
+
+        Returns:
+            int: Количество пропущенных товаров
+        """
+        skipped = 0
+        external_ids = []
+        for item in itertools.islice(goods, count):
+            skipped += 1
+            if self.incremental and isinstance(item, dict):
+                external_ids.append(item.get('id'))
+        # Их предложения не должны считаться пропавшими из прайс-листа
+        for ids in batched(external_ids, self.batch_size):
+            self.matched_ids.update(self.offers().filter(
+                external_id__in=ids).values_list('id', flat=True))
+        return skipped
+
+    def save_checkpoint(self, offset, batch_stats):
+        stats = dict(self.stats)
+        for key, value in batch_stats.items():
+            stats[key] += value
+        ImportCheckpoint.objects.filter(pk=self.checkpoint.pk).update(
+            offset=offset, stats=stats, updated_at=timezone.now())
+
+    def write_batch(self, batch, offset=None):
+        profiler = self.profiler
+        with profiler.phase('normalize'):
+            rows = self.normalize(batch)
+        try:
+            with profiler.phase('transaction'), transaction.atomic():
+                with profiler.phase('products'):
+                    new_products = self.create_products(rows)
+                with profiler.phase('parameters'):
+                    new_parameters = self.create_parameters(rows)
+                lookup = (
+                    ChainMap(new_products, self.product_ids),
+                    ChainMap(new_parameters, self.parameter_ids),
                 )
+                with profiler.phase('offers'):
+                    if self.incremental:
+                        stats, written, matched = self.sync_rows(
+                            rows, *lookup)
+                    else:
+                        stats, written = self.insert_rows(rows, *lookup)
+                        matched = ()
+                # Точка сохраняется в той же транзакции, что и пачка
+                if self.checkpoint is not None:
+                    self.save_checkpoint(offset, stats)
+        except DatabaseError as e:
+            if self.checkpoint is not None:
+                raise
+            self.batch_error = f'Ошибка записи пачки товаров: {e}'
+            self.report_error(self.batch_error)
+            self.stats['errors'] += len(rows)
+            self.stats['failed_batches'] += 1
+            if self.incremental:
+                # Предложения из неудачной пачки не должны считаться
+                # пропавшими из прайс-листа
+                self.matched_ids.update(self.offers().filter(
+                    external_id__in=[row['external_id'] for row in rows]
+                ).values_list('id', flat=True))
+            return
+
+        # Кэши пополняются только после успешного коммита пачки
+        self.product_ids.update(new_products)
+        self.parameter_ids.update(new_parameters)
+        self.seen.update(written)
+        if self.incremental:
+            self.matched_ids.update(matched)
+        for key, value in stats.items():
+            self.stats[key] += value
 
-                # Обрабатываем параметры
-                parameters = item.get('parameters', {})
-                for param_name, param_value in parameters.items():
-                    param_value_str = str(param_value)
-                    parameter, _ = Parameter.objects.get_or_create(
-                        name=param_name)
-                    ProductParameter.objects.create(
-                        product_info=product_info,
-                        parameter=parameter,
-                        value=param_value_str
-                    )
-
-                imported_count += 1
-
-            except Exception as e:
-                print(f"Ошибка обработки товара {item.get('id')}: {e}")
+    def report_error(self, message):
+        logger.warning('Импорт магазина %s: %s', self.shop.name, message)
+        if len(self.error_messages) < MAX_ERROR_MESSAGES:
+            self.error_messages.append(message)
+
+    def normalize(self, batch):
+        rows = []
+        for item in batch:
+            category = self.category_map.get(
+                item.get('category') if isinstance(item, dict) else None)
+            if category is None:
                 continue
+            try:
+                row = normalize_good(item)
+            except ValueError as e:
+                self.report_error(
+                    f"Ошибка обработки товара {item.get('id')}: {e}")
+                self.stats['errors'] += 1
+                continue
+            row['category_id'] = category.id
+            rows.append(row)
+        return rows
 
-        return {
-            'shop': shop,
-            'categories': len(category_map),
-            'products': imported_count
-        }
+    def create_products(self, rows):
+        """
+        Создает недостающие продукты пачки.
+
+        Тот же продукт мог одновременно создать параллельный импорт,
+        поэтому конфликты с unique_product_name пропускаются, а id
+        читаются заново.
+
+        Returns:
+            dict: id новых продуктов по (name, category_id)
+        """
+        products = {}
+        for row in rows:
+            key = (row['name'], row['category_id'])
+            if key not in self.product_ids and key not in products:
+                products[key] = Product(
+                    name=row['name'], category_id=row['category_id'])
+        if not products:
+            return {}
+        Product.objects.bulk_create(
+            products.values(), batch_size=self.batch_size,
+            ignore_conflicts=True)
+        created = {}
+        for product_id, name, category_id in Product.objects.filter(
+                category_id__in={key[1] for key in products},
+                name__in={key[0] for key in products}
+        ).order_by().values_list('id', 'name', 'category_id'):
+            if (name, category_id) in products:
+                created[(name, category_id)] = product_id
+        return created
+
+    def create_parameters(self, rows):
+        """
+        Создает недостающие имена параметров пачки. Конфликты
+        с параллельным импортом обрабатываются как в create_products.
+
+        Returns:
+            dict: id новых параметров по имени
+        """
+        parameters = {}
+        for row in rows:
+            for param_name in row['parameters']:
+                if param_name not in self.parameter_ids \
+                        and param_name not in parameters:
+                    parameters[param_name] = Parameter(name=param_name)
+        if not parameters:
+            return {}
+        Parameter.objects.bulk_create(
+            parameters.values(), batch_size=self.batch_size,
+            ignore_conflicts=True)
+        return dict(Parameter.objects.filter(
+            name__in=list(parameters)).order_by().values_list('name', 'id'))
+
+    def skip_duplicate(self, key, written, external_id):
+        if key in self.seen or key in written:
+            self.report_error(
+                f'Ошибка обработки товара {external_id}: дубликат')
+            self.stats['errors'] += 1
+            return True
+        written.add(key)
+        return False
+
+    def insert_rows(self, rows, product_ids, parameter_ids):
+        """
+        Вставляет все товары пачки (режим полной перезаписи).
+
+        Returns:
+            tuple: Статистика пачки и ключи записанных товаров
+        """
+        infos = []
+        written = set()
+        for row in rows:
+            product_id = product_ids[(row['name'], row['category_id'])]
+            if self.skip_duplicate((product_id, row['external_id']),
+                                   written, row['external_id']):
+                continue
+            infos.append((self.build_offer(row, product_id), row))
+        self.create_offers(infos, parameter_ids)
+        return {'created': len(infos)}, written
+
+    def sync_rows(self, rows, product_ids, parameter_ids):
+        """
+        Записывает только разницу между пачкой и текущими предложениями.
+
+        Returns:
+            tuple: Статистика пачки, ключи записанных товаров
+                и id сопоставленных существующих предложений
+        """
+        existing = {}
+        for info in self.offers().filter(
+                external_id__in=[row['external_id'] for row in rows]
+        ).order_by('id'):
+            existing.setdefault(info.external_id, info)
+        current_params = {}
+        for product_parameter in ProductParameter.objects.filter(
+                product_info__in=[info.pk for info in existing.values()]
+        ).only('id', 'product_info_id', 'parameter_id', 'value'):
+            current_params.setdefault(
+                product_parameter.product_info_id, {}
+            )[product_parameter.parameter_id] = product_parameter
+
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+        written, matched = set(), set()
+        new_infos, changed_infos, changed_rows = [], [], []
+        new_params, changed_params, removed_params = [], [], []
+        for row in rows:
+            if self.skip_duplicate(row['external_id'], written,
+                                   row['external_id']):
+                continue
+            product_id = product_ids[(row['name'], row['category_id'])]
+            wanted = {parameter_ids[name]: value
+                      for name, value in row['parameters'].items()}
+
+            info = existing.get(row['external_id'])
+            if info is None:
+                new_infos.append((self.build_offer(row, product_id), row))
+                stats['created'] += 1
+                continue
+            matched.add(info.pk)
+
+            changed = False
+            values = dict(row, product_id=product_id)
+            for field in self.OFFER_FIELDS:
+                if getattr(info, field) != values[field]:
+                    setattr(info, field, values[field])
+                    changed = True
+            if changed:
+                changed_infos.append(info)
+
+            params = current_params.get(info.pk, {})
+            for parameter_id, value in wanted.items():
+                product_parameter = params.get(parameter_id)
+                if product_parameter is None:
+                    new_params.append(ProductParameter(
+                        product_info_id=info.pk,
+                        parameter_id=parameter_id,
+                        value=value,
+                        value_numeric=numeric_value(value)))
+                    changed = True
+                elif product_parameter.value != value:
+                    product_parameter.value = value
+                    product_parameter.value_numeric = numeric_value(value)
+                    changed_params.append(product_parameter)
+                    changed = True
+            for parameter_id, product_parameter in params.items():
+                if parameter_id not in wanted:
+                    removed_params.append(product_parameter.pk)
+                    changed = True
+
+            stats['updated' if changed else 'unchanged'] += 1
+            if changed:
+                changed_rows.append((info, row))
+
+        self.create_offers(new_infos, parameter_ids)
+        ProductInfo.objects.bulk_update(
+            changed_infos, self.OFFER_FIELDS, batch_size=self.batch_size)
+        ProductParameter.objects.bulk_create(
+            new_params, batch_size=self.batch_size)
+        ProductParameter.objects.bulk_update(
+            changed_params, ['value', 'value_numeric'],
+            batch_size=self.batch_size)
+        if removed_params:
+            ProductParameter.objects.filter(pk__in=removed_params).delete()
+        replace_entries(self.build_entries(changed_rows, parameter_ids),
+                        self.batch_size)
+        return stats, written, matched
+
+    def build_offer(self, row, product_id):
+        return ProductInfo(
+            product_id=product_id,
+            shop=self.shop,
+            external_id=row['external_id'],
+            model=row['model'],
+            quantity=row['quantity'],
+            price=row['price'],
+            price_rrc=row['price_rrc'],
+            search_text=row['search_text'],
+            generation=self.generation
+        )
+
+    def create_offers(self, infos, parameter_ids):
+        """
+        Вставляет новые предложения, их параметры и записи витрины.
+        """
+        ProductInfo.objects.bulk_create(
+            [info for info, _ in infos], batch_size=self.batch_size)
+        ProductParameter.objects.bulk_create([
+            ProductParameter(
+                product_info_id=info.pk,
+                parameter_id=parameter_ids[param_name],
+                value=param_value,
+                value_numeric=numeric_value(param_value)
+            )
+            for info, row in infos
+            for param_name, param_value in row['parameters'].items()
+        ], batch_size=self.batch_size)
+        CatalogEntry.objects.bulk_create(
+            self.build_entries(infos, parameter_ids),
+            batch_size=self.batch_size)
+
+    def build_entries(self, infos, parameter_ids):
+        """
+        Записи витрины для пар (предложение, строка прайс-листа).
+        """
+        return [
+            build_entry(
+                info, row['name'], self.categories[row['category_id']],
+                self.shop,
+                [(parameter_ids[name], name, value)
+                 for name, value in row['parameters'].items()])
+            for info, row in infos]
+
+    def delete_missing(self):
+        """
+        Удаляет предложения, которых больше нет в прайс-листе.
+        """
+        missing = sorted(self.existing_ids - self.matched_ids)
+        for ids in batched(missing, self.batch_size):
+            self.profiler.heartbeat()
+            self.stats['deleted'] += YamlImporter._delete_offers(
+                ProductInfo.objects.filter(pk__in=ids))
@@ -0,0 +1,127 @@
+"""
+Параллельный импорт нескольких прайс-листов в пуле процессов.
+
+Модуль не импортирует модели на верхнем уровне: процессы пула
+запускаются через spawn и сами настраивают Django в init_worker,
+поэтому у каждого процесса собственное соединение с БД.
+"""
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+from .utils.price_formats import supported_extensions
+
+
+def expand_sources(sources):
+    """
+    Раскрывает каталоги и glob-шаблоны в список файлов.
+    Из каталогов берутся файлы всех поддерживаемых форматов.
+    URL и обычные пути возвращаются как есть.
+    """
+    extensions = supported_extensions()
+    expanded = []
+    for source in sources:
+        if source.startswith(('http://', 'https://')):
+            expanded.append(source)
+        elif os.path.isdir(source):
+            expanded.extend(sorted(
+                os.path.join(source, name)
+                for name in os.listdir(source)
+                if name.lower().endswith(extensions)))
+        elif glob.has_magic(source):
+            expanded.extend(sorted(glob.glob(source)))
+        else:
+            expanded.append(source)
+    # Один и тот же файл не должен импортироваться дважды
+    return list(dict.fromkeys(expanded))
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def import_one(source, options):
+    """
+    Импортирует один источник. Ошибки не пробрасываются, а возвращаются
+    в результате, чтобы один плохой файл не останавливал остальные.
+
+    Returns:
+        dict: Итог импорта источника
+    """
+    from django.db import connection
+    from .import_logic import YamlImporter
+    from .utils.import_profiler import ImportProfiler
+
+    options = dict(options)
+    trace_memory = options.pop('profile_memory', True)
+    profiler = ImportProfiler(trace_memory) \
+        if options.pop('profile', False) else None
+    started = time.perf_counter()
+    try:
+        result = YamlImporter.import_source(
+            source, profiler=profiler, **options)
+    except Exception as e:
+        return {
+            'source': source,
+            'ok': False,
+            'error': str(e),
+            # Отчет проверки прайс-листа (PriceListValidationError)
+            'validation': getattr(e, 'report', None),
+            'seconds': time.perf_counter() - started,
+        }
+    finally:
+        connection.close()
+
+    rows = result['created'] + result['updated'] + result['unchanged']
+    return {
+        'source': source,
+        'ok': True,
+        'status': result['status'],
+        'shop': result['shop'].name,
+        'categories': result['categories'],
+        'products': result['products'],
+        'created': result['created'],
+        'updated': result['updated'],
+        'unchanged': result['unchanged'],
+        'deleted': result['deleted'],
+        'resumed_from': result.get('resumed_from', 0),
+        'rows': rows if result['status'] == 'imported' else 0,
+        'errors': result['errors'],
+        'seconds': time.perf_counter() - started,
+        'profile': result.get('profile'),
+    }
+
+
+def import_many(sources, options, workers):
+    """
+    Импортирует источники в пуле из workers процессов.
+
+    Yields:
+        dict: Итог по каждому источнику по мере готовности
+    """
+    if workers <= 1:
+        for source in sources:
+            yield import_one(source, options)
+        return
+
+    from django.db import connections
+
+    # Соединения родителя не должны переживать запуск пула
+    connections.close_all()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker) as pool:
+        futures = {
+            pool.submit(import_one, source, options): source
+            for source in sources
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # Процесс пула упал целиком (например, OOM)
+                yield {'source': futures[future], 'ok': False,
+                       'error': str(e), 'seconds': 0}
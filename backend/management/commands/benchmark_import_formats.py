@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.import_logic import batched, normalize_good
+from backend.utils.price_formats import (
+    FORMATS, load_price_list, stream_price_list
+)
+from backend.utils.sample_catalog import WRITERS
+
+
+def _parse(path, mode, batch_size):
+    """
+    Разбирает файл и прогоняет товары через нормализацию, как при
+    записи в БД.
+
+    Returns:
+        int: Количество товаров
+    """
+    with open(path, 'rb') as file:
+        if mode == 'stream':
+            goods = stream_price_list(file, name=path)['goods']
+        else:
+            goods = load_price_list(file, name=path)['goods']
+        return sum(
+            len([normalize_good(item) for item in batch])
+            for batch in batched(goods, batch_size))
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк форматов прайс-листов: размер файла и скорость '
+            'разбора одного и того же каталога в YAML, JSON Lines и CSV, '
+            'в том числе сжатых gzip')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=int, default=100000,
+            help='Количество товаров в сгенерированном каталоге')
+        parser.add_argument(
+            '--formats', nargs='+', choices=sorted(FORMATS),
+            default=sorted(FORMATS),
+            help='Форматы для сравнения')
+        parser.add_argument(
+            '--modes', nargs='+', choices=['full', 'stream'],
+            default=['full', 'stream'],
+            help='Режимы разбора для сравнения')
+        parser.add_argument(
+            '--no-gzip', action='store_false', dest='gzip',
+            help='Не сравнивать сжатые варианты')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"формат":>10} {"режим":>8} {"файл, МБ":>10} '
+            f'{"время, с":>10} {"товаров/с":>12}')
+        suffixes = ['', '.gz'] if options['gzip'] else ['']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for fmt in options['formats']:
+                for suffix in suffixes:
+                    path = os.path.join(
+                        tmp_dir, f'goods_{options["size"]}.{fmt}{suffix}')
+                    WRITERS[fmt](path, options['size'])
+                    file_mb = os.path.getsize(path) / 1024 / 1024
+
+                    for mode in options['modes']:
+                        started = time.perf_counter()
+                        count = _parse(path, mode, options['batch_size'])
+                        elapsed = time.perf_counter() - started
+                        self.stdout.write(
+                            f'{fmt + suffix:>10} {mode:>8} '
+                            f'{file_mb:>10.1f} {elapsed:>10.2f} '
+                            f'{count / elapsed:>12.0f}')
+                    os.remove(path)
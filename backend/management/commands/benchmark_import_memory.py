@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.import_logic import batched, normalize_good
+from backend.utils.sample_catalog import write_yaml
+from backend.utils.yaml_stream import stream_load
+
+
+def _measure(path, mode, batch_size, queue):
+    """
+    Разбирает файл в отдельном процессе и сообщает пиковый RSS.
+    Товары проходят через ту же нормализацию и разбиение на пачки,
+    что и при записи в БД.
+    """
+    import yaml
+
+    started = time.perf_counter()
+    if mode == 'stream':
+        with open(path, 'rb') as file:
+            goods = stream_load(file)['goods']
+            count = sum(
+                len([normalize_good(item) for item in batch])
+                for batch in batched(goods, batch_size))
+    else:
+        with open(path, 'rb') as file:
+            goods = yaml.load(file, Loader=getattr(
+                yaml, 'CSafeLoader', yaml.SafeLoader))['goods']
+        count = sum(
+            len([normalize_good(item) for item in batch])
+            for batch in batched(goods, batch_size))
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss в Linux возвращается в килобайтах
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((count, peak_kb, elapsed))
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк памяти: пиковый RSS при разборе прайс-листов '
+            'разного размера в потоковом и обычном режимах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Количество товаров в сгенерированных файлах')
+        parser.add_argument(
+            '--modes', nargs='+', choices=['stream', 'full'],
+            default=['stream'],
+            help='Режимы разбора для сравнения')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # fork: дочерний процесс наследует настроенный Django
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(
+            f'{"товаров":>10} {"файл, МБ":>10} {"режим":>8} '
+            f'{"RSS, МБ":>10} {"время, с":>10}')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for size in options['sizes']:
+                path = os.path.join(tmp_dir, f'goods_{size}.yaml')
+                write_yaml(path, size)
+                file_mb = os.path.getsize(path) / 1024 / 1024
+
+                for mode in options['modes']:
+                    # Каждый замер в новом процессе, иначе пиковый RSS
+                    # наследуется от предыдущего
+                    queue = context.Queue()
+                    process = context.Process(
+                        target=_measure,
+                        args=(path, mode, options['batch_size'], queue))
+                    process.start()
+                    process.join()
+                    if process.exitcode != 0:
+                        raise CommandError(
+                            f'Замер {size}/{mode} завершился с ошибкой')
+                    count, peak_kb, elapsed = queue.get()
+
+                    self.stdout.write(
+                        f'{count:>10} {file_mb:>10.1f} {mode:>8} '
+                        f'{peak_kb / 1024:>10.1f} {elapsed:>10.2f}')
+                os.remove(path)
@@ -0,0 +1,81 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from backend.models import CatalogEntry, ProductInfo
+from backend.serializers import (
+    CatalogEntrySerializer, ProductInfoRowSerializer, ProductInfoSerializer
+)
+
+
+def _serializer(size):
+    infos = ProductInfo.objects.active().with_details().order_by('pk')
+    return ProductInfoSerializer(infos[:size], many=True).data
+
+
+def _rows(size):
+    rows = ProductInfo.objects.active().as_rows().order_by('pk')
+    return ProductInfoRowSerializer(rows[:size], many=True).data
+
+
+def _entries(size):
+    rows = CatalogEntry.objects.active().as_rows().order_by('pk')
+    return CatalogEntrySerializer(rows[:size], many=True).data
+
+
+# Способы собрать страницу списка product-info
+PATHS = {
+    'serializer': _serializer,
+    'rows': _rows,
+    'entries': _entries,
+}
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк страницы списка product-info: ProductInfoSerializer '
+            'против values() с ProductInfoRowSerializer (поиск) и витрины '
+            'CatalogEntry (список без поиска) на текущей БД. Время - '
+            'медиана чтения и сериализации страницы, вывод всех способов '
+            'сверяется с ProductInfoSerializer')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[20, 100, 500],
+            help='Размеры страницы')
+        parser.add_argument(
+            '--paths', nargs='+', choices=sorted(PATHS),
+            default=list(PATHS),
+            help='Способы для сравнения')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз собирать каждую страницу')
+
+    def handle(self, *args, **options):
+        if not ProductInfo.objects.active().exists():
+            raise CommandError('Каталог пуст, сначала импортируйте '
+                               'прайс-лист')
+        self.stdout.write(
+            f'{"страница":>9} {"способ":>11} {"запросов":>9} '
+            f'{"время, мс":>10} {"ускорение":>10} {"вывод":>8}')
+        for size in options['sizes']:
+            expected = json.dumps(_serializer(size))
+            baseline = None
+            for name in options['paths']:
+                build = PATHS[name]
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        data = build(size)
+                        timings.append(time.perf_counter() - started)
+                elapsed = statistics.median(timings) * 1000
+                baseline = baseline or elapsed
+                same = json.dumps(data) == expected
+                self.stdout.write(
+                    f'{size:>9} {name:>11} {len(queries):>9} '
+                    f'{elapsed:>10.1f} {baseline / elapsed:>9.1f}x '
+                    f'{"совпал" if same else "ОТЛИЧИЕ":>8}')
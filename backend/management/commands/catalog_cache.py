@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog_cache import bump_catalog_version, cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Статистика кэша ответов API каталога: попадания, промахи, '
+            'ответы, дождавшиеся параллельного запроса, и устаревшие. '
+            'С --invalidate делает устаревшими все кэшированные ответы '
+            '(после правки каталога в обход импорта и админки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода')
+        parser.add_argument(
+            '--invalidate', action='store_true',
+            help='Сменить глобальную версию каталога')
+
+    def handle(self, *args, **options):
+        stats = cache_stats(reset=options['reset'])
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f'Попаданий: {stats["hits"]}, промахов: '
+                          f'{stats["misses"]}, доля попаданий: {ratio:.1f}%')
+        self.stdout.write(f'Дождались параллельного запроса: '
+                          f'{stats["coalesced"]}, устаревших ответов: '
+                          f'{stats["stale"]}')
+        if options['invalidate']:
+            bump_catalog_version()
+            self.stdout.write('Версия каталога сменена')
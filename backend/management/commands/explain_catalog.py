@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from backend.filters import filter_product_infos
+from backend.models import Category, ProductInfo, Shop
+
+# Признак полного прохода по таблице предложений в плане PostgreSQL
+FULL_SCAN_MARKER = 'Seq Scan on backend_productinfo'
+
+
+class Command(BaseCommand):
+    help = ('Планы запросов (EXPLAIN) для типичных фильтров каталога '
+            'product-info. Запускается на БД с реальным объемом данных, '
+            'чтобы убедиться, что фильтры используют индексы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL): выполнить запросы '
+                 'и показать фактическое время')
+        parser.add_argument(
+            '--page-size', type=int, default=20,
+            help='LIMIT запросов, как у страницы API')
+
+    def handle(self, *args, **options):
+        shop = Shop.objects.order_by('id').first()
+        category = Category.objects.order_by('id').first()
+        if shop is None or category is None:
+            raise CommandError('Каталог пуст: нечего проверять')
+
+        cases = {
+            'без фильтров': '',
+            'по цене': 'ordering=price',
+            'по цене, в наличии': 'ordering=price&in_stock=1',
+            'магазин, диапазон цены': (
+                f'shop={shop.id}&price_min=1000&price_max=50000'
+                '&ordering=price'),
+            'категория, по цене': f'category={category.id}&ordering=price',
+            'активные магазины, по убыванию цены': (
+                'active_shops=1&ordering=-price'),
+            'поиск по релевантности': 'q=смартфон apple',
+            'поиск с опечаткой': 'q=айфон',
+        }
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze поддерживается только '
+                                   'на PostgreSQL')
+            explain_options = {'analyze': True, 'buffers': True}
+
+        full_scans = 0
+        for title, query in cases.items():
+            queryset = filter_product_infos(
+                ProductInfo.objects.active(), QueryDict(query))
+            plan = queryset[:options['page_size']].explain(
+                **explain_options)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{title}: ?{query}'))
+            self.stdout.write(plan + '\n')
+            if FULL_SCAN_MARKER in plan:
+                full_scans += 1
+                self.stdout.write(self.style.WARNING(
+                    '   полный проход по предложениям'))
+
+        if full_scans:
+            self.stdout.write(self.style.WARNING(
+                f'Запросов с полным проходом: {full_scans} из {len(cases)}'))
+        elif connection.vendor == 'postgresql':
+            self.stdout.write(self.style.SUCCESS(
+                'Все запросы используют индексы'))
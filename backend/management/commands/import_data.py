@@ -1,28 +1,176 @@
+import argparse
+import json
+import time
+
 from django.core.management.base import BaseCommand
-from backend.import_logic import YamlImporter
+from backend.import_pool import expand_sources, import_many
+from backend.utils.import_profiler import format_table
+from backend.utils.price_formats import FORMATS
 
 
 class Command(BaseCommand):
-    help = 'Импорт товаров из YAML файла (локального или по URL)'
+    help = ('Импорт товаров из прайс-листов YAML, JSON Lines или CSV, '
+            'в том числе сжатых gzip (локальных или по URL). '
+            'Принимает несколько путей, каталоги и glob-шаблоны')
 
     def add_arguments(self, parser):
-        parser.add_argument('source', type=str, help='Путь к YAML файлу или URL')
+        parser.add_argument(
+            'sources', nargs='+', type=str,
+            help='Пути к прайс-листам, каталоги, glob-шаблоны или URL')
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default=None,
+            help='Формат прайс-листов (по умолчанию определяется по '
+                 'расширению и содержимому)')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Количество процессов для параллельного импорта магазинов')
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Размер пачки для массовой записи товаров')
+        parser.add_argument(
+            '--stream', action='store_true',
+            help='Потоковый разбор: товары читаются по одному, '
+                 'память не зависит от размера файла')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Записать только изменения: id предложений сохраняются, '
+                 'корзины и заказы не теряются')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Импортировать, даже если прайс-лист не изменился '
+                 'с последнего импорта')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Сохранять контрольные точки и продолжить прерванный '
+                 'импорт того же файла с последней из них')
+        parser.add_argument(
+            '--no-validate', action='store_false', dest='validate',
+            help='Не проверять прайс-лист целиком до записи (в потоковом '
+                 'режиме экономит второй проход по файлу)')
+        parser.add_argument(
+            '--profile', nargs='?', const='table', choices=['table', 'json'],
+            help='Замерить время, SQL-запросы и память по фазам импорта '
+                 'и вывести отчет таблицей или в JSON')
+        parser.add_argument(
+            '--profile-memory', action=argparse.BooleanOptionalAction,
+            default=True,
+            help='Замерять пик памяти через tracemalloc. Трассировка '
+                 'замедляет разбор YAML в несколько раз, для точных '
+                 'замеров времени используйте --no-profile-memory')
 
     def handle(self, *args, **options):
-        source = options['source']
+        sources = expand_sources(options['sources'])
+        if not sources:
+            self.stdout.write(self.style.ERROR(
+                '❌ Ошибка импорта: не найдено ни одного файла'))
+            return
+
+        import_options = {
+            'stream': options['stream'],
+            'incremental': options['incremental'],
+            'force': options['force'],
+            'batch_size': options['batch_size'],
+            'validate': options['validate'],
+            'resume': options['resume'],
+            'fmt': options['format'],
+            'profile': bool(options['profile']),
+            'profile_memory': options['profile_memory'],
+        }
+        workers = max(1, min(options['workers'], len(sources)))
+
+        started = time.perf_counter()
+        results = []
+        for item in import_many(sources, import_options, workers):
+            results.append(item)
+            if len(sources) == 1:
+                self.report_single(item)
+            else:
+                self.report(item)
+        elapsed = time.perf_counter() - started
 
-        try:
-            data = YamlImporter.load_yaml(source)
-            result = YamlImporter.process_data(data)
+        if len(sources) > 1:
+            self.report_summary(results, elapsed)
+        if options['profile']:
+            self.report_profiles(results, options['profile'])
 
+    def report_single(self, item):
+        if not item['ok']:
+            self.stdout.write(self.style.ERROR(
+                f'❌ Ошибка импорта: {item["error"]}'))
+            self.report_validation(item)
+        elif item['status'] == 'unchanged':
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Прайс-лист не изменился, импорт пропущен\n'
+                f'   Магазин: {item["shop"]}\n'
+                f'   Товаров: {item["products"]}'
+            ))
+        else:
+            if item['resumed_from']:
+                self.stdout.write(
+                    f'   Продолжено с товара {item["resumed_from"]}')
             self.stdout.write(self.style.SUCCESS(
                 f'✅ Импорт завершен успешно!\n'
-                f'   Магазин: {result["shop"].name}\n'
-                f'   Категорий: {result["categories"]}\n'
-                f'   Товаров: {result["products"]}'
+                f'   Магазин: {item["shop"]}\n'
+                f'   Категорий: {item["categories"]}\n'
+                f'   Товаров: {item["products"]}\n'
+                f'   Добавлено: {item["created"]}, '
+                f'изменено: {item["updated"]}, '
+                f'без изменений: {item["unchanged"]}, '
+                f'удалено: {item["deleted"]}'
             ))
 
-        except ValueError as e:
-            self.stdout.write(self.style.ERROR(f'❌ Ошибка импорта: {e}'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'❌ Неизвестная ошибка: {e}'))
\ No newline at end of file
+    def report(self, item):
+        source = item['source']
+        if not item['ok']:
+            self.stdout.write(self.style.ERROR(
+                f'❌ {source}: ошибка импорта: {item["error"]}'))
+            self.report_validation(item)
+        elif item['status'] == 'unchanged':
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {source}: прайс-лист не изменился, импорт пропущен '
+                f'(магазин: {item["shop"]}, товаров: {item["products"]})'))
+        else:
+            rate = item['rows'] / item['seconds'] if item['seconds'] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {source}: магазин {item["shop"]}, '
+                f'товаров: {item["products"]}, ошибок: {item["errors"]}, '
+                f'{item["seconds"]:.1f} с, {rate:.0f} строк/с'))
+
+    def report_validation(self, item, limit=20):
+        report = item.get('validation')
+        if not report:
+            return
+        for error in report['errors'][:limit]:
+            position = f'товар #{error["index"]}' \
+                if error['index'] is not None else 'заголовок'
+            if error['id'] is not None:
+                position += f' (id {error["id"]})'
+            field = f'{error["field"]}: ' if error['field'] else ''
+            self.stdout.write(f'   {position}: {field}{error["error"]}')
+        if report['errors_total'] > limit:
+            self.stdout.write(
+                f'   ... и еще ошибок: {report["errors_total"] - limit}')
+
+    def report_profiles(self, results, output_format):
+        profiled = [item for item in results if item.get('profile')]
+        if output_format == 'json':
+            self.stdout.write(json.dumps(
+                [{'source': item['source'], **item['profile']}
+                 for item in profiled],
+                ensure_ascii=False, indent=2))
+            return
+        for item in profiled:
+            self.stdout.write(f'\nПрофиль импорта {item["source"]}:')
+            self.stdout.write(format_table(item['profile']))
+
+    def report_summary(self, results, elapsed):
+        succeeded = [item for item in results if item['ok']]
+        failed = len(results) - len(succeeded)
+        rows = sum(item['rows'] for item in succeeded)
+        rate = rows / elapsed if elapsed else 0
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(
+            f'Итого: файлов {len(results)}, успешно {len(succeeded)}, '
+            f'с ошибками {failed}\n'
+            f'   Строк записано: {rows} за {elapsed:.1f} с '
+            f'({rate:.0f} строк/с)'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from backend.import_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди импорта прайс-листов (задания из PartnerUpdate)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Количество одновременно выполняемых заданий')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задания из очереди и завершиться')
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Пауза между опросами пустой очереди, сек')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Воркер импорта запущен, потоков: {options["concurrency"]}')
+        run_worker(
+            concurrency=options['concurrency'],
+            once=options['once'],
+            poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS('Воркер импорта остановлен'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog import refresh_entries
+from backend.catalog_cache import bump_catalog_version
+from backend.models import ProductInfo
+
+
+class Command(BaseCommand):
+    help = ('Пересборка витрины каталога (CatalogEntry). Импорт и админка '
+            'обновляют ее сами, команда нужна после правки каталога '
+            'в обход импорта')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop', type=int, nargs='+', dest='shop_ids',
+            help='ID магазинов (по умолчанию все)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Предложений в одной транзакции')
+
+    def handle(self, *args, **options):
+        infos = ProductInfo.objects.all()
+        if options['shop_ids']:
+            infos = infos.filter(shop_id__in=options['shop_ids'])
+        rows = refresh_entries(infos, batch_size=options['batch_size'])
+        bump_catalog_version()
+        self.stdout.write(f'Пересобрано записей витрины: {rows}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog_cache import bump_catalog_version
+from backend.facets import rebuild_shop_facets
+from backend.models import Shop
+
+
+class Command(BaseCommand):
+    help = ('Пересчет счетчиков фасетов (ParameterFacet). Импорт '
+            'пересчитывает их сам, команда нужна после правки каталога '
+            'в обход импорта')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop', type=int, nargs='+', dest='shop_ids',
+            help='ID магазинов (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.order_by('id')
+        if options['shop_ids']:
+            shops = shops.filter(id__in=options['shop_ids'])
+        for shop in shops:
+            rows = rebuild_shop_facets(shop)
+            bump_catalog_version(shop)
+            self.stdout.write(f'{shop.name}: {rows} счетчиков')
@@ -0,0 +1,102 @@
+import time
+
+from django.core.management.base import BaseCommand
+from backend.shop_refresh import refreshable_shops, refresh_shops
+
+
+class Command(BaseCommand):
+    help = ('Обновление прайс-листов активных магазинов по ссылке из '
+            'Shop.url. С --interval работает как демон')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop', type=int, nargs='+', dest='shop_ids',
+            help='ID магазинов (по умолчанию все активные со ссылкой)')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Количество одновременных загрузок')
+        parser.add_argument(
+            '--per-host', type=int, default=2,
+            help='Количество одновременных загрузок с одного хоста')
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Таймаут HTTP-запроса, сек')
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Повторять обновление каждые N секунд')
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Размер пачки для массовой записи товаров')
+        parser.add_argument(
+            '--stream', action='store_true',
+            help='Потоковый разбор прайс-листов')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Записать только изменения прайс-листов')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Скачать и импортировать без условного GET и проверки '
+                 'отпечатка')
+
+    def handle(self, *args, **options):
+        import_options = {
+            'stream': options['stream'],
+            'incremental': options['incremental'],
+            'force': options['force'],
+            'batch_size': options['batch_size'],
+        }
+        try:
+            while True:
+                self.refresh(options, import_options)
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Обновление остановлено')
+
+    def refresh(self, options, import_options):
+        shops = refreshable_shops()
+        if options['shop_ids']:
+            shops = shops.filter(id__in=options['shop_ids'])
+
+        started = time.perf_counter()
+        counts = {'imported': 0, 'unchanged': 0, 'failed': 0}
+        for item in refresh_shops(
+                shops,
+                workers=options['workers'],
+                per_host=options['per_host'],
+                options=import_options,
+                timeout=options['timeout']):
+            self.report(item)
+            if not item['ok']:
+                counts['failed'] += 1
+            elif item['status'] == 'imported':
+                counts['imported'] += 1
+            else:
+                counts['unchanged'] += 1
+
+        elapsed = time.perf_counter() - started
+        style = self.style.SUCCESS if not counts['failed'] \
+            else self.style.WARNING
+        self.stdout.write(style(
+            f'Итого: обновлено {counts["imported"]}, '
+            f'без изменений {counts["unchanged"]}, '
+            f'с ошибками {counts["failed"]} за {elapsed:.1f} с'))
+
+    def report(self, item):
+        shop = item['shop']
+        if not item['ok']:
+            self.stdout.write(self.style.ERROR(
+                f'❌ {shop}: ошибка обновления: {item["error"]}'))
+        elif item['status'] == 'not_modified':
+            self.stdout.write(f'   {shop}: не изменился (304)')
+        elif item['status'] == 'unchanged':
+            self.stdout.write(
+                f'   {shop}: содержимое не изменилось, импорт пропущен')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {shop}: товаров {item["products"]}, '
+                f'добавлено {item["created"]}, '
+                f'изменено {item["updated"]}, '
+                f'удалено {item["deleted"]}, '
+                f'ошибок {item["errors"]}'))
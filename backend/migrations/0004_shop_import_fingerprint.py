@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_alter_user_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='import_data_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хеш данных последнего импорта'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='import_raw_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хеш файла последнего импорта'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_shop_import_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(blank=True, max_length=500, verbose_name='Ссылка')),
+                ('file_path', models.CharField(blank=True, max_length=255, verbose_name='Загруженный файл')),
+                ('options', models.JSONField(blank=True, default=dict, verbose_name='Параметры импорта')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=15, verbose_name='Статус')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='backend.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание импорта',
+                'verbose_name_plural': 'Список заданий импорта',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'created_at'], name='import_job_status_idx')],
+            },
+        ),
+    ]
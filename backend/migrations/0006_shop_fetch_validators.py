@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='fetch_etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='fetch_last_modified',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Last-Modified прайс-листа'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_shop_fetch_validators'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='productinfo',
+            name='unique_product_info',
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='generation',
+            field=models.PositiveIntegerField(default=0, verbose_name='Поколение каталога'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_generation',
+            field=models.PositiveIntegerField(default=0, verbose_name='Активное поколение каталога'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'generation'], name='product_info_generation_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('product', 'shop', 'external_id', 'generation'), name='unique_product_info'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_catalog_generations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попыток выполнения'),
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(blank=True, max_length=500, verbose_name='Источник')),
+                ('source_hash', models.CharField(max_length=64, verbose_name='Хеш файла')),
+                ('incremental', models.BooleanField(default=False, verbose_name='Инкрементальный импорт')),
+                ('generation', models.PositiveIntegerField(verbose_name='Записываемое поколение каталога')),
+                ('offset', models.PositiveIntegerField(default=0, verbose_name='Записано товаров')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика записанных пачек')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='backend.importjob', verbose_name='Задание импорта')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_checkpoints', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка импорта',
+                'verbose_name_plural': 'Список контрольных точек импорта',
+                'ordering': ('-updated_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_importjob_superseded'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'generation', 'price'], name='product_info_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['price', 'id'], name='product_info_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['price', 'id'], name='product_info_in_stock_idx'),
+        ),
+        # Старый индекс удаляется последним: его заменяет
+        # product_info_shop_price_idx с тем же префиксом
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_generation_idx',
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:01
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from backend.utils.search import SEARCH_CONFIG, build_search_text
+
+BACKFILL_BATCH_SIZE = 2000
+
+# Индексы и триггер только для PostgreSQL: GIN и tsvector на других БД
+# не поддерживаются, там поиск идет по search_text без индекса
+POSTGRES_FORWARD = [
+    f"""
+    CREATE TRIGGER product_info_search_vector
+    BEFORE INSERT OR UPDATE OF search_text ON backend_productinfo
+    FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(
+        search_vector, 'pg_catalog.{SEARCH_CONFIG}', search_text)
+    """,
+]
+POSTGRES_INDEXES = [
+    'CREATE INDEX product_info_search_idx ON backend_productinfo '
+    'USING gin (search_vector)',
+    'CREATE INDEX product_info_search_trgm_idx ON backend_productinfo '
+    'USING gin (search_text gin_trgm_ops)',
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS product_info_search_trgm_idx',
+    'DROP INDEX IF EXISTS product_info_search_idx',
+    'DROP TRIGGER IF EXISTS product_info_search_vector ON backend_productinfo',
+]
+
+
+def run_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_text(apps, schema_editor):
+    """
+    Заполняет search_text существующих предложений.
+    """
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    last_id = 0
+    while True:
+        infos = list(ProductInfo.objects.filter(id__gt=last_id).select_related(
+            'product').order_by('id')[:BACKFILL_BATCH_SIZE])
+        if not infos:
+            break
+        parameters = {}
+        for info_id, parameter_id, value in ProductParameter.objects.filter(
+                product_info__in=infos).order_by('id').values_list(
+                'product_info_id', 'parameter_id', 'value'):
+            parameters.setdefault(info_id, {})[parameter_id] = value
+        for info in infos:
+            info.search_text = build_search_text(
+                info.product.name, info.model, parameters.get(info.id))
+        ProductInfo.objects.bulk_update(infos, ['search_text'])
+        last_id = infos[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_catalog_filter_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_postgres(POSTGRES_FORWARD),
+                             run_postgres(POSTGRES_BACKWARD)),
+        # Триггер уже создан, поэтому search_vector заполняется вместе
+        # с search_text, а индексы строятся по готовым данным
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(run_postgres(POSTGRES_INDEXES),
+                             migrations.RunPython.noop),
+    ]
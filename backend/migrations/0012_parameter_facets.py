@@ -0,0 +1,75 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def fill_facets(apps, schema_editor):
+    """
+    Счетчики для уже импортированных каталогов.
+    """
+    Shop = apps.get_model('backend', 'Shop')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+    for shop in Shop.objects.order_by('id'):
+        rows = ProductParameter.objects.filter(
+            product_info__shop=shop,
+            product_info__generation=shop.catalog_generation,
+        ).values(
+            'parameter_id', 'value',
+            category_id=F('product_info__product__category_id'),
+        ).annotate(count=Count('id')).order_by()
+        ParameterFacet.objects.bulk_create(
+            (ParameterFacet(shop=shop, **row) for row in rows),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_product_info_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Предложений')),
+            ],
+            options={
+                'verbose_name': 'Счетчик значения параметра',
+                'verbose_name_plural': 'Счетчики значений параметров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddIndex(
+            model_name='parameterfacet',
+            index=models.Index(fields=['category', 'parameter', 'value'], name='parameter_facet_category_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value'), name='unique_parameter_facet'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+from backend.utils.parameter_values import numeric_value
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def fill_value_numeric(apps, schema_editor):
+    """
+    Заполняет value_numeric у уже импортированных параметров.
+    """
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    last_id = 0
+    while True:
+        rows = list(ProductParameter.objects.filter(
+            id__gt=last_id).order_by('id').only(
+            'id', 'value')[:BACKFILL_BATCH_SIZE])
+        if not rows:
+            break
+        numeric = []
+        for row in rows:
+            row.value_numeric = numeric_value(row.value)
+            if row.value_numeric is not None:
+                numeric.append(row)
+        ProductParameter.objects.bulk_update(numeric, ['value_numeric'])
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_numeric',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Числовое значение'),
+        ),
+        # Индекс строится по заполненной колонке
+        migrations.RunPython(fill_value_numeric, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(condition=models.Q(('value_numeric__isnull', False)), fields=['parameter', 'value_numeric', 'product_info'], name='product_parameter_numeric_idx'),
+        ),
+    ]
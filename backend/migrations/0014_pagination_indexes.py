@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_parameter_value_numeric'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'dt', 'id'], name='order_user_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+    ]
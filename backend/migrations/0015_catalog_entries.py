@@ -0,0 +1,83 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def fill_catalog_entries(apps, schema_editor):
+    """
+    Записи витрины для уже импортированных предложений.
+    """
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    last_id = 0
+    while True:
+        infos = list(ProductInfo.objects.filter(id__gt=last_id).select_related(
+            'product__category', 'shop'
+        ).prefetch_related('product_parameters__parameter').order_by(
+            'id')[:BACKFILL_BATCH_SIZE])
+        if not infos:
+            break
+        CatalogEntry.objects.bulk_create(CatalogEntry(
+            product_info_id=info.id,
+            shop_id=info.shop_id,
+            shop_name=info.shop.name,
+            shop_url=info.shop.url,
+            shop_state=info.shop.state,
+            generation=info.generation,
+            product_id=info.product_id,
+            product_name=info.product.name,
+            category_id=info.product.category_id,
+            category_name=info.product.category.name,
+            external_id=info.external_id,
+            model=info.model,
+            quantity=info.quantity,
+            price=info.price,
+            price_rrc=info.price_rrc,
+            parameters=[
+                {'parameter': {'id': item.parameter_id,
+                               'name': item.parameter.name},
+                 'value': item.value}
+                for item in info.product_parameters.all()],
+        ) for info in infos)
+        last_id = infos[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo', verbose_name='Информация о продукте')),
+                ('shop_name', models.CharField(max_length=50, verbose_name='Магазин')),
+                ('shop_url', models.URLField(blank=True, null=True, verbose_name='Ссылка')),
+                ('shop_state', models.BooleanField(verbose_name='Магазин принимает заказы')),
+                ('generation', models.PositiveIntegerField(verbose_name='Поколение каталога')),
+                ('product_name', models.CharField(max_length=80, verbose_name='Продукт')),
+                ('category_name', models.CharField(max_length=40, verbose_name='Категория')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.product', verbose_name='Продукт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Запись витрины каталога',
+                'verbose_name_plural': 'Витрина каталога',
+                'indexes': [models.Index(fields=['shop', 'generation', 'price'], name='catalog_entry_shop_price_idx'), models.Index(fields=['category', 'price', 'product_info'], name='catalog_entry_category_idx'), models.Index(fields=['price', 'product_info'], name='catalog_entry_price_idx'), models.Index(condition=models.Q(('quantity__gt', 0)), fields=['price', 'product_info'], name='catalog_entry_in_stock_idx')],
+            },
+        ),
+        migrations.RunPython(fill_catalog_entries,
+                             migrations.RunPython.noop),
+    ]
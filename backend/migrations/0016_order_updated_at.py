@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:17
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    """
+    Существующие заказы считаются измененными в момент создания.
+    """
+    Order = apps.get_model('backend', 'Order')
+    Order.objects.update(updated_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_catalog_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменен'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
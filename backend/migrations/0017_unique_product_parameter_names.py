@@ -0,0 +1,137 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:37
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+BATCH_SIZE = 5000
+
+
+def _duplicates(model, fields):
+    """
+    Returns:
+        dict: id дубликата -> id оставляемой записи (наименьший id)
+    """
+    groups = model.objects.values(*fields).annotate(
+        keep=Min('id'), total=Count('id')).filter(total__gt=1).order_by()
+    merged = {}
+    for group in groups:
+        keep = group.pop('keep')
+        group.pop('total')
+        for pk in model.objects.filter(**group).exclude(
+                pk=keep).values_list('id', flat=True):
+            merged[pk] = keep
+    return merged
+
+
+def _merge_parameters(apps, merged):
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    for duplicate, keep in merged.items():
+        # У предложения может быть значение обоих дубликатов
+        ProductParameter.objects.filter(
+            parameter_id=duplicate,
+            product_info__in=ProductParameter.objects.filter(
+                parameter_id=keep).values('product_info')
+        ).delete()
+        ProductParameter.objects.filter(parameter_id=duplicate).update(
+            parameter_id=keep)
+        for facet in ParameterFacet.objects.filter(parameter_id=duplicate):
+            updated = ParameterFacet.objects.filter(
+                shop_id=facet.shop_id, category_id=facet.category_id,
+                parameter_id=keep, value=facet.value
+            ).update(count=models.F('count') + facet.count)
+            if updated:
+                facet.delete()
+            else:
+                facet.parameter_id = keep
+                facet.save(update_fields=['parameter'])
+
+    # В витрине id параметров хранятся в JSON
+    last_id = 0
+    while True:
+        entries = list(CatalogEntry.objects.filter(
+            product_info_id__gt=last_id).order_by('product_info_id').only(
+            'product_info_id', 'parameters')[:BATCH_SIZE])
+        if not entries:
+            break
+        changed = []
+        for entry in entries:
+            if not any(item['parameter']['id'] in merged
+                       for item in entry.parameters):
+                continue
+            # Значение удаленного дубликата пропадает, как и в БД
+            parameters, seen = [], set()
+            for item in entry.parameters:
+                parameter_id = merged.get(
+                    item['parameter']['id'], item['parameter']['id'])
+                if parameter_id in seen:
+                    continue
+                seen.add(parameter_id)
+                item['parameter']['id'] = parameter_id
+                parameters.append(item)
+            entry.parameters = parameters
+            changed.append(entry)
+        CatalogEntry.objects.bulk_update(changed, ['parameters'])
+        last_id = entries[-1].product_info_id
+
+
+def _merge_products(apps, merged):
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    for duplicate, keep in merged.items():
+        # Такое же предложение уже есть у оставляемого продукта
+        kept = ProductInfo.objects.filter(product_id=keep)
+        for info in ProductInfo.objects.filter(product_id=duplicate):
+            if kept.filter(shop_id=info.shop_id,
+                           external_id=info.external_id,
+                           generation=info.generation).exists():
+                info.delete()
+        ProductInfo.objects.filter(product_id=duplicate).update(
+            product_id=keep)
+        CatalogEntry.objects.filter(product_id=duplicate).update(
+            product_id=keep)
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Объединяет дубликаты имен параметров и продуктов, созданные
+    параллельными импортами, чтобы можно было добавить ограничения
+    уникальности.
+    """
+    Parameter = apps.get_model('backend', 'Parameter')
+    Product = apps.get_model('backend', 'Product')
+
+    merged = _duplicates(Parameter, ['name'])
+    if merged:
+        _merge_parameters(apps, merged)
+        Parameter.objects.filter(pk__in=list(merged)).delete()
+
+    merged = _duplicates(Product, ['name', 'category_id'])
+    if merged:
+        _merge_products(apps, merged)
+        Product.objects.filter(pk__in=list(merged)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='parameter',
+            constraint=models.UniqueConstraint(fields=('name',), name='unique_parameter_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='unique_product_name'),
+        ),
+        # Индекс ограничения unique_product_name покрывает те же запросы
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_category_name_idx',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_unique_product_parameter_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('version', models.PositiveBigIntegerField(verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Список версий каталога',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-17 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='file_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хеш загруженного файла'),
+        ),
+    ]
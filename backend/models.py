@@ -1,11 +1,18 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
-from django.db import models
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorField, TrigramWordSimilarity
+)
+from django.db import connections, models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 from django.core.validators import MinValueValidator
 
+from .utils.parameter_values import numeric_value
+from .utils.search import SEARCH_CONFIG, query_words
+
 STATE_CHOICES = (
     ('basket', 'Статус корзины'),
     ('new', 'Новый'),
@@ -16,6 +23,14 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_JOB_STATUS_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+    ('superseded', 'Заменен более новым'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -116,6 +131,28 @@ class Shop(models.Model):
     state = models.BooleanField(
         verbose_name='статус получения заказов',
         default=True)
+    # Отпечаток последнего успешного импорта прайс-листа
+    import_raw_hash = models.CharField(
+        verbose_name='Хеш файла последнего импорта',
+        max_length=64,
+        blank=True)
+    import_data_hash = models.CharField(
+        verbose_name='Хеш данных последнего импорта',
+        max_length=64,
+        blank=True)
+    # Валидаторы условного GET для обновления прайс-листа по url
+    fetch_etag = models.CharField(
+        verbose_name='ETag прайс-листа',
+        max_length=255,
+        blank=True)
+    fetch_last_modified = models.CharField(
+        verbose_name='Last-Modified прайс-листа',
+        max_length=64,
+        blank=True)
+    # Предложения магазина видны покупателям только из этого поколения
+    catalog_generation = models.PositiveIntegerField(
+        verbose_name='Активное поколение каталога',
+        default=0)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -156,11 +193,89 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
         ordering = ('-name',)
+        constraints = [
+            # Параллельные импорты создают продукты с ignore_conflicts.
+            # Индекс ограничения служит и фильтру по категории
+            # с сортировкой по названию
+            models.UniqueConstraint(fields=['category', 'name'],
+                                    name='unique_product_name'),
+        ]
+        indexes = [
+            # Весь список по названию, курсор (name, id)
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.category.name if self.category else "без категории"})'
 
 
+# Столбцы, которые выводит ProductInfoSerializer (без параметров)
+PRODUCT_INFO_ROW_FIELDS = (
+    'pk', 'external_id', 'model', 'quantity', 'price', 'price_rrc',
+    'product_id', 'product__name', 'product__category_id',
+    'product__category__name', 'shop_id', 'shop__name', 'shop__url',
+    'shop__state',
+)
+
+
+class ProductInfoQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Предложения из активного поколения каталога своего магазина.
+        """
+        return self.filter(generation=models.F('shop__catalog_generation'))
+
+    def as_rows(self, *extra):
+        """
+        Столбцы ProductInfoSerializer словарями через values(), одним
+        запросом с JOIN товара, категории и магазина, без экземпляров
+        моделей. Параметры дочитывает ProductInfoRowSerializer.
+
+        Args:
+            extra: Дополнительные поля и аннотации, например ключи
+                сортировки для курсора
+        """
+        return self.prefetch_related(None).values(
+            *PRODUCT_INFO_ROW_FIELDS, *extra)
+
+    def with_details(self):
+        """
+        Все, что выводит ProductInfoSerializer, за фиксированное число
+        запросов: товар с категорией, магазин и параметры. Поисковые
+        поля не загружаются.
+        """
+        return self.select_related(
+            'product__category', 'shop'
+        ).prefetch_related(
+            'product_parameters__parameter'
+        ).defer('search_text', 'search_vector')
+
+    def search(self, query):
+        """
+        Поиск по названию, модели и значениям параметров.
+
+        На PostgreSQL предложение находится по search_vector (слова
+        с учетом словоформ) или по триграммному сходству слов запроса
+        с search_text (опечатки); в rank записывается релевантность.
+        На других БД каждое слово запроса должно входить в search_text,
+        rank у всех результатов 0.
+        """
+        words = query_words(query)
+        text = ' '.join(words)
+        if not words or connections[self.db].vendor != 'postgresql':
+            queryset = self if words else self.none()
+            for word in words:
+                queryset = queryset.filter(search_text__contains=word)
+            return queryset.annotate(
+                rank=models.Value(0.0, output_field=models.FloatField()))
+        search_query = SearchQuery(text, config=SEARCH_CONFIG)
+        return self.filter(
+            models.Q(search_vector=search_query)
+            | models.Q(search_text__trigram_word_similar=text)
+        ).annotate(rank=SearchRank(models.F('search_vector'), search_query)
+                   + TrigramWordSimilarity(text, 'search_text'))
+
+
 class ProductInfo(models.Model):
     model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
     external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
@@ -191,6 +306,23 @@ class ProductInfo(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(0)]
     )
+    # Поколение каталога, в котором создано предложение. Полный импорт
+    # собирает новое поколение рядом с активным
+    generation = models.PositiveIntegerField(
+        verbose_name='Поколение каталога',
+        default=0)
+    # Название, модель и значения параметров (utils.search), заполняется
+    # при импорте
+    search_text = models.TextField(
+        verbose_name='Текст для поиска',
+        blank=True,
+        default='',
+        editable=False)
+    # Только PostgreSQL: to_tsvector(search_text), обновляется триггером
+    # (миграция 0011). На других БД остается пустым
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductInfoQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -200,9 +332,23 @@ class ProductInfo(models.Model):
                 fields=[
                     'product',
                     'shop',
-                    'external_id'],
+                    'external_id',
+                    'generation'],
                 name='unique_product_info'),
         ]
+        indexes = [
+            # Активное поколение магазина (фильтр shop, сборка мусора
+            # старых поколений) с диапазоном и сортировкой по цене
+            models.Index(fields=['shop', 'generation', 'price'],
+                         name='product_info_shop_price_idx'),
+            # Весь каталог, отсортированный по цене
+            models.Index(fields=['price', 'id'],
+                         name='product_info_price_idx'),
+            # То же только для товаров в наличии (in_stock)
+            models.Index(fields=['price', 'id'],
+                         condition=models.Q(quantity__gt=0),
+                         name='product_info_in_stock_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product.name} - {self.shop.name} - {self.price} руб.'
@@ -215,6 +361,10 @@ class Parameter(models.Model):
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ('-name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name'],
+                                    name='unique_parameter_name'),
+        ]
 
     def __str__(self):
         return self.name
@@ -234,6 +384,12 @@ class ProductParameter(models.Model):
         blank=True,
         on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    # Значение, если оно число (utils.parameter_values), иначе NULL
+    value_numeric = models.FloatField(
+        verbose_name='Числовое значение',
+        null=True,
+        blank=True,
+        editable=False)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -245,11 +401,159 @@ class ProductParameter(models.Model):
                     'parameter'],
                 name='unique_product_parameter'),
         ]
+        indexes = [
+            # Обратный индекс значение -> предложения для фильтра ?param=
+            models.Index(fields=['parameter', 'value', 'product_info'],
+                         name='product_parameter_value_idx'),
+            # Диапазон числовых значений для ?param_min= и ?param_max=
+            models.Index(fields=['parameter', 'value_numeric',
+                                 'product_info'],
+                         condition=models.Q(value_numeric__isnull=False),
+                         name='product_parameter_numeric_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Импорт заполняет value_numeric сам в bulk_create, здесь - при
+        # правке значения (например, в админке)
+        self.value_numeric = numeric_value(self.value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'value_numeric'}
+        return super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.parameter.name}: {self.value}'
 
 
+class ParameterFacet(models.Model):
+    """
+    Число предложений активного каталога магазина в категории с данным
+    значением параметра. Пересчитывается после импорта магазина
+    (facets.rebuild_shop_facets), API суммирует строки по магазинам
+    или категориям.
+    """
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name='Магазин',
+        related_name='parameter_facets',
+        on_delete=models.CASCADE)
+    category = models.ForeignKey(
+        Category,
+        verbose_name='Категория',
+        related_name='parameter_facets',
+        on_delete=models.CASCADE)
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name='Параметр',
+        related_name='facets',
+        on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Предложений')
+
+    class Meta:
+        verbose_name = 'Счетчик значения параметра'
+        verbose_name_plural = 'Счетчики значений параметров'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shop', 'category', 'parameter', 'value'],
+                name='unique_parameter_facet'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'parameter', 'value'],
+                         name='parameter_facet_category_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.parameter.name}: {self.value} ({self.count})'
+
+
+class CatalogEntryQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Записи из активного поколения каталога своего магазина.
+        """
+        return self.filter(generation=models.F('shop__catalog_generation'))
+
+    def as_rows(self):
+        """
+        Столбцы для CatalogEntrySerializer словарями через values().
+        """
+        return self.values(
+            'pk', 'external_id', 'model', 'quantity', 'price', 'price_rrc',
+            'product_id', 'product_name', 'category_id', 'category_name',
+            'shop_id', 'shop_name', 'shop_url', 'shop_state', 'parameters')
+
+
+class CatalogEntry(models.Model):
+    """
+    Плоская запись витрины каталога: предложение со всем, что выводит
+    список product-info, в одной строке. Параметры хранятся готовым
+    JSON в виде ProductParameterSerializer. Пишется импортом в той же
+    транзакции, что и предложения, и обновляется при правке исходных
+    моделей в админке (catalog.py).
+    """
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name='Информация о продукте',
+        related_name='catalog_entry',
+        primary_key=True,
+        on_delete=models.CASCADE)
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name='Магазин',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE)
+    shop_name = models.CharField(max_length=50, verbose_name='Магазин')
+    shop_url = models.URLField(verbose_name='Ссылка', null=True, blank=True)
+    shop_state = models.BooleanField(verbose_name='Магазин принимает заказы')
+    generation = models.PositiveIntegerField(
+        verbose_name='Поколение каталога')
+    product = models.ForeignKey(
+        Product,
+        verbose_name='Продукт',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=80, verbose_name='Продукт')
+    category = models.ForeignKey(
+        Category,
+        verbose_name='Категория',
+        related_name='catalog_entries',
+        on_delete=models.CASCADE)
+    category_name = models.CharField(max_length=40, verbose_name='Категория')
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.DecimalField(
+        verbose_name='Цена', max_digits=10, decimal_places=2)
+    price_rrc = models.DecimalField(
+        verbose_name='Рекомендуемая розничная цена',
+        max_digits=10,
+        decimal_places=2)
+    parameters = models.JSONField(verbose_name='Параметры', default=list)
+
+    objects = CatalogEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись витрины каталога'
+        verbose_name_plural = 'Витрина каталога'
+        indexes = [
+            # Те же пути доступа, что у ProductInfo, плюс категория
+            # без соединения с Product
+            models.Index(fields=['shop', 'generation', 'price'],
+                         name='catalog_entry_shop_price_idx'),
+            models.Index(fields=['category', 'price', 'product_info'],
+                         name='catalog_entry_category_idx'),
+            models.Index(fields=['price', 'product_info'],
+                         name='catalog_entry_price_idx'),
+            models.Index(fields=['price', 'product_info'],
+                         condition=models.Q(quantity__gt=0),
+                         name='catalog_entry_in_stock_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} - {self.shop_name} - {self.price} руб.'
+
+
 class Contact(models.Model):
     user = models.ForeignKey(User, verbose_name='Пользователь',
                              related_name='contacts', blank=True,
@@ -280,11 +584,25 @@ class Contact(models.Model):
         return f'{self.city}, ул. {self.street}, д. {self.house} ({self.user.email})'
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Заказы с позициями и их предложениями: сериализаторы и письма
+        о заказе не делают запросов на каждую позицию.
+        """
+        return self.select_related('contact', 'user').prefetch_related(
+            models.Prefetch(
+                'ordered_items', queryset=OrderItem.objects.with_details()))
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, verbose_name='Пользователь',
                              related_name='orders', blank=True,
                              on_delete=models.CASCADE)
     dt = models.DateTimeField(auto_now_add=True)
+    # Меняется при каждом сохранении заказа и правке его позиций,
+    # из него строится ETag заказа
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменен')
     status = models.CharField(
         verbose_name='Статус',
         choices=STATE_CHOICES,
@@ -293,15 +611,32 @@ class Order(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказов"
         ordering = ('-dt',)
+        indexes = [
+            # История заказов пользователя, курсор (dt, id)
+            models.Index(fields=['user', 'dt', 'id'],
+                         name='order_user_dt_idx'),
+        ]
 
     def __str__(self):
         return f'Заказ #{self.id} от {self.dt.strftime("%d.%m.%Y %H:%M")} ({self.get_status_display()})'
 
 
+class OrderItemQuerySet(models.QuerySet):
+    def with_details(self):
+        """
+        Позиции с предложением, см. ProductInfoQuerySet.with_details.
+        """
+        return self.select_related(
+            'product_info__product__category', 'product_info__shop'
+        ).prefetch_related('product_info__product_parameters__parameter')
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order,
@@ -317,6 +652,8 @@ class OrderItem(models.Model):
         on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = "Список заказанных позиций"
@@ -332,6 +669,78 @@ class OrderItem(models.Model):
         return f'{self.product_info.product.name} x {self.quantity}'
 
 
+class ImportJob(models.Model):
+    """
+    Задание на импорт прайс-листа, выполняемое воркером import_worker
+    """
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name='Магазин',
+        related_name='import_jobs',
+        on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='import_jobs',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL)
+    url = models.URLField(verbose_name='Ссылка', max_length=500, blank=True)
+    file_path = models.CharField(
+        verbose_name='Загруженный файл',
+        max_length=255,
+        blank=True)
+    file_hash = models.CharField(
+        verbose_name='Хеш загруженного файла',
+        max_length=64,
+        blank=True)
+    options = models.JSONField(
+        verbose_name='Параметры импорта',
+        default=dict,
+        blank=True)
+    status = models.CharField(
+        verbose_name='Статус',
+        choices=IMPORT_JOB_STATUS_CHOICES,
+        max_length=15,
+        default='queued')
+    processed = models.PositiveIntegerField(
+        verbose_name='Обработано товаров',
+        default=0)
+    attempts = models.PositiveIntegerField(
+        verbose_name='Попыток выполнения',
+        default=0)
+    result = models.JSONField(
+        verbose_name='Результат',
+        default=dict,
+        blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Задание импорта'
+        verbose_name_plural = 'Список заданий импорта'
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=['status', 'created_at'],
+                name='import_job_status_idx'),
+        ]
+
+    @property
+    def duration(self):
+        """Длительность выполнения в секундах"""
+        if not self.started_at:
+            return None
+        finished_at = self.finished_at or timezone.now()
+        return (finished_at - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f'Импорт #{self.id} ({self.shop.name}, {self.get_status_display()})'
+
+
 class ConfirmEmailToken(models.Model):
     class Meta:
         verbose_name = 'Токен подтверждения Email'
@@ -368,3 +777,78 @@ class ConfirmEmailToken(models.Model):
 
     def __str__(self):
         return f"Токен подтверждения для {self.user.email}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Контрольная точка импорта: сколько товаров прайс-листа уже записано.
+
+    Обновляется в одной транзакции с каждой пачкой товаров, поэтому
+    прерванный импорт того же файла продолжается ровно с первой
+    незаписанной пачки.
+    """
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name='Магазин',
+        related_name='import_checkpoints',
+        on_delete=models.CASCADE)
+    job = models.ForeignKey(
+        ImportJob,
+        verbose_name='Задание импорта',
+        related_name='checkpoints',
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE)
+    source = models.CharField(
+        verbose_name='Источник',
+        max_length=500,
+        blank=True)
+    source_hash = models.CharField(
+        verbose_name='Хеш файла',
+        max_length=64)
+    incremental = models.BooleanField(
+        verbose_name='Инкрементальный импорт',
+        default=False)
+    generation = models.PositiveIntegerField(
+        verbose_name='Записываемое поколение каталога')
+    offset = models.PositiveIntegerField(
+        verbose_name='Записано товаров',
+        default=0)
+    stats = models.JSONField(
+        verbose_name='Статистика записанных пачек',
+        default=dict,
+        blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Контрольная точка импорта'
+        verbose_name_plural = 'Список контрольных точек импорта'
+        ordering = ('-updated_at',)
+
+    def __str__(self):
+        return f'{self.shop.name}: {self.offset} товаров ({self.source})'
+
+
+class CatalogVersion(models.Model):
+    """
+    Счетчик версии каталога (см. catalog_cache).
+
+    Хранится в БД, а не в кэше Django: импорт в import_worker и командах
+    идет в другом процессе, и смена версии в его локальном кэше до
+    веб-процессов не дошла бы. Версия меняется в одной транзакции с
+    каталогом.
+    """
+    key = models.CharField(
+        verbose_name='Ключ',
+        max_length=64,
+        primary_key=True)
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = 'Список версий каталога'
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
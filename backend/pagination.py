@@ -0,0 +1,171 @@
+"""
+Постраничный вывод списков каталога и заказов.
+
+По умолчанию работает как раньше: ?page=N, count и ссылки на
+соседние страницы (PageNumberPagination). С ?pagination=cursor список
+отдается по курсору (keyset): в ссылках next/previous закодированы
+значения ключей сортировки крайней строки страницы, и следующая
+страница выбирается условием "после этих значений" по индексу
+сортировки. COUNT(*) и OFFSET не выполняются, поэтому далекие
+страницы стоят столько же, сколько первая, а строки, добавленные
+импортом между запросами, не сдвигают уже просмотренные.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_MODE = 'cursor'
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Номера страниц по умолчанию, курсор с ?pagination=cursor.
+
+    Сортировка берется из queryset (или Meta.ordering модели) и
+    дополняется id, чтобы ключ был уникальным. Поддерживаются только
+    имена полей и аннотаций, в том числе через __.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            request.query_params.get(self.mode_query_param) == CURSOR_MODE
+            or self.cursor_query_param in request.query_params)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request, ordering)
+        if reverse:
+            ordering = [self.flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            ordering = [self.flip(field) for field in ordering]
+
+        self.next_position = self.previous_position = None
+        if rows and (has_more or reverse):
+            self.next_position = (self.position(rows[-1], ordering), False)
+        if rows and (has_more if reverse else values is not None):
+            self.previous_position = (self.position(rows[0], ordering), True)
+        self.ordering = ordering
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.cursor_link(self.next_position),
+            'previous': self.cursor_link(self.previous_position),
+            'results': data,
+        })
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_ordering(queryset):
+        """
+        Ключи сортировки queryset с id в конце.
+        """
+        ordering = [field for field in queryset.query.order_by
+                    if isinstance(field, str)]
+        if len(ordering) != len(queryset.query.order_by):
+            raise ValueError('Курсор поддерживает сортировку только '
+                             'по именам полей')
+        if not ordering:
+            ordering = list(queryset.model._meta.ordering)
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    @staticmethod
+    def after(ordering, values):
+        """
+        Условие "строка после values" для сортировки ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def position(row, ordering):
+        """
+        Значения ключей сортировки строки: объекта модели или словаря
+        из values().
+        """
+        values = []
+        for field in ordering:
+            if isinstance(row, dict):
+                value = row[field.lstrip('-')]
+            else:
+                value = row
+                for name in field.lstrip('-').split('__'):
+                    value = getattr(value, name)
+            values.append(_json_value(value))
+        return values
+
+    def decode_cursor(self, request, ordering):
+        """
+        Returns:
+            tuple: Значения ключей сортировки или None для первой
+                страницы и признак перехода назад
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = cursor['v'], bool(cursor['r'])
+            valid = cursor['o'] == ordering and len(values) == len(ordering)
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            valid = False
+        if not valid:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def cursor_link(self, position):
+        if position is None:
+            return None
+        values, reverse = position
+        cursor = json.dumps({'o': self.ordering, 'v': values,
+                             'r': int(reverse)}, separators=(',', ':'))
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode()).decode())
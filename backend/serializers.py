@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order, OrderItem
+from .catalog import render_parameters
+from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order, OrderItem, ImportJob
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -75,6 +76,94 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class CatalogEntrySerializer(serializers.BaseSerializer):
+    """
+    Запись витрины каталога (CatalogEntryQuerySet.as_rows) в том же
+    виде, что ProductInfoSerializer. Вложенные сериализаторы не нужны:
+    все поля уже в одной строке, параметры - готовый JSON.
+    """
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    def to_representation(self, entry):
+        return {
+            'id': entry['pk'],
+            'external_id': entry['external_id'],
+            'model': entry['model'],
+            'product': {
+                'id': entry['product_id'],
+                'name': entry['product_name'],
+                'category': {'id': entry['category_id'],
+                             'name': entry['category_name']},
+            },
+            'shop': {
+                'id': entry['shop_id'],
+                'name': entry['shop_name'],
+                'url': entry['shop_url'],
+                'state': entry['shop_state'],
+            },
+            'quantity': entry['quantity'],
+            'price': self.price_field.to_representation(entry['price']),
+            'price_rrc': self.price_field.to_representation(
+                entry['price_rrc']),
+            'product_parameters': entry['parameters'],
+        }
+
+
+class ProductInfoRowListSerializer(serializers.ListSerializer):
+    """
+    Параметры всех предложений страницы одним запросом.
+    """
+
+    def to_representation(self, data):
+        rows = list(data)
+        parameters = {}
+        for info_id, *parameter in ProductParameter.objects.filter(
+                product_info__in=[row['pk'] for row in rows]
+        ).order_by('pk').values_list(
+                'product_info_id', 'parameter_id', 'parameter__name',
+                'value'):
+            parameters.setdefault(info_id, []).append(parameter)
+        for row in rows:
+            row['parameters'] = render_parameters(
+                parameters.get(row['pk'], ()))
+        return [self.child.to_representation(row) for row in rows]
+
+
+class ProductInfoRowSerializer(serializers.BaseSerializer):
+    """
+    Предложение из ProductInfoQuerySet.as_rows в том же виде, что
+    ProductInfoSerializer. Словарь собирается напрямую, без полей DRF
+    на каждое значение; только для списков (many=True).
+    """
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        list_serializer_class = ProductInfoRowListSerializer
+
+    def to_representation(self, row):
+        return {
+            'id': row['pk'],
+            'external_id': row['external_id'],
+            'model': row['model'],
+            'product': {
+                'id': row['product_id'],
+                'name': row['product__name'],
+                'category': {'id': row['product__category_id'],
+                             'name': row['product__category__name']},
+            },
+            'shop': {
+                'id': row['shop_id'],
+                'name': row['shop__name'],
+                'url': row['shop__url'],
+                'state': row['shop__state'],
+            },
+            'quantity': row['quantity'],
+            'price': self.price_field.to_representation(row['price']),
+            'price_rrc': self.price_field.to_representation(row['price_rrc']),
+            'product_parameters': row['parameters'],
+        }
+
+
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
@@ -187,7 +276,7 @@ class BasketItemSerializer(serializers.ModelSerializer):
 
     def validate_product_info_id(self, value):
         try:
-            ProductInfo.objects.get(id=value)
+            ProductInfo.objects.active().get(id=value)
         except ProductInfo.DoesNotExist:
             raise serializers.ValidationError("Товар не найден")
         return value
@@ -213,3 +302,18 @@ class BasketSerializer(serializers.ModelSerializer):
         for item in obj.ordered_items.all():
             total += item.quantity * item.product_info.price
         return total
+
+
+# ==================== ИМПОРТ ====================
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    shop = serializers.CharField(source='shop.name', read_only=True)
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'shop', 'status', 'processed', 'attempts', 'result',
+            'error', 'created_at', 'started_at', 'finished_at', 'duration'
+        ]
+        read_only_fields = fields
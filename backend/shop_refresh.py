@@ -0,0 +1,189 @@
+"""
+Обновление прайс-листов магазинов по полю Shop.url.
+
+Прайс-листы скачиваются параллельно пулом потоков через общую
+requests.Session (один пул соединений на все магазины). Число
+одновременных запросов к одному хосту ограничено отдельно. Запросы
+условные: сохраненные ETag и Last-Modified отправляются обратно, и
+неизмененный прайс-лист стоит серверу только ответа 304.
+
+Импорты на PostgreSQL тоже идут параллельно. SQLite допускает одну
+пишущую транзакцию, и параллельные импорты падают с "database table
+is locked", поэтому на других БД скачанные прайс-листы импортируются
+по одному.
+"""
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .import_logic import YamlImporter
+from .models import Shop
+from .utils.price_formats import guess_format
+from .utils.spooling import spool_response
+
+
+_serial_imports = threading.Lock()
+
+
+def import_guard():
+    """
+    Блокировка, под которой поток пула пишет в БД: на PostgreSQL
+    пустая, на других БД общая для всех потоков.
+    """
+    if connection.vendor == 'postgresql':
+        return contextlib.nullcontext()
+    return _serial_imports
+
+
+def build_session(pool_size):
+    """
+    Сессия с пулом соединений на pool_size соединений к каждому хосту.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostLimiter:
+    """
+    Ограничивает число одновременных запросов к одному хосту.
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def semaphore(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            semaphore = self.semaphores.setdefault(
+                host, threading.BoundedSemaphore(self.per_host))
+        return semaphore
+
+
+def refreshable_shops():
+    """
+    Активные магазины с заданной ссылкой на прайс-лист.
+    """
+    return Shop.objects.filter(
+        state=True, url__isnull=False).exclude(url='').order_by('id')
+
+
+def fetch_price_list(session, shop, limiter, timeout=30, conditional=True):
+    """
+    Скачивает прайс-лист магазина условным GET.
+
+    Returns:
+        tuple: (None, None, None), если прайс-лист не изменился (304),
+            иначе файловый объект с содержимым, ETag и Last-Modified.
+            Хеш содержимого посчитан при загрузке (атрибут raw_hash)
+    """
+    headers = {}
+    if conditional and shop.fetch_etag:
+        headers['If-None-Match'] = shop.fetch_etag
+    if conditional and shop.fetch_last_modified:
+        headers['If-Modified-Since'] = shop.fetch_last_modified
+
+    with limiter.semaphore(shop.url):
+        try:
+            with session.get(shop.url, headers=headers, stream=True,
+                             timeout=timeout) as response:
+                if response.status_code == 304:
+                    return None, None, None
+                response.raise_for_status()
+                content = spool_response(
+                    response, settings.IMPORT_MAX_SIZE)
+        except requests.RequestException as e:
+            raise ValueError(f'Ошибка загрузки по URL: {e}')
+
+    return (content, response.headers.get('ETag', ''),
+            response.headers.get('Last-Modified', ''))
+
+
+def refresh_shop(shop, session, limiter, options=None, timeout=30):
+    """
+    Обновляет прайс-лист одного магазина. Ошибки не пробрасываются,
+    а возвращаются в результате.
+
+    Валидаторы сохраняются только после успешного импорта, чтобы
+    неудачная попытка повторилась при следующем обновлении.
+
+    Returns:
+        dict: Итог обновления магазина
+    """
+    options = dict(options or {})
+    conditional = not options.get('force', False)
+    outcome = {'shop': shop.name, 'url': shop.url}
+    try:
+        content, etag, last_modified = fetch_price_list(
+            session, shop, limiter, timeout=timeout,
+            conditional=conditional)
+        if content is None:
+            outcome.update(ok=True, status='not_modified')
+            return outcome
+
+        if not options.get('fmt'):
+            options['fmt'] = guess_format(shop.url, content.content_type)
+        with content, import_guard():
+            result = YamlImporter.import_source(content, shop, **options)
+            if not result['failed_batches']:
+                Shop.objects.filter(pk=shop.pk).update(
+                    fetch_etag=etag[:255],
+                    fetch_last_modified=last_modified[:64])
+        outcome.update(
+            ok=True,
+            status=result['status'],
+            products=result['products'],
+            created=result['created'],
+            updated=result['updated'],
+            deleted=result['deleted'],
+            errors=result['errors'])
+    except Exception as e:
+        outcome.update(ok=False, error=str(e))
+    finally:
+        # Каждый поток пула держит свое соединение с БД
+        connection.close()
+    return outcome
+
+
+def refresh_shops(shops=None, workers=8, per_host=2, options=None,
+                  timeout=30):
+    """
+    Параллельно обновляет прайс-листы магазинов.
+
+    Args:
+        shops: Магазины для обновления, по умолчанию refreshable_shops()
+        workers: Общее число одновременных загрузок
+        per_host: Число одновременных загрузок с одного хоста
+        options: Параметры YamlImporter.import_source
+            (stream, incremental, force, batch_size)
+        timeout: Таймаут HTTP-запроса, сек
+
+    Yields:
+        dict: Итог по каждому магазину по мере готовности
+    """
+    shops = list(refreshable_shops() if shops is None else shops)
+    if not shops:
+        return
+
+    close_old_connections()
+    limiter = HostLimiter(per_host)
+    with build_session(workers) as session, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(refresh_shop, shop, session, limiter, options,
+                        timeout)
+            for shop in shops
+        ]
+        for future in as_completed(futures):
+            yield future.result()
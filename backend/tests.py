@@ -1,3 +1,1420 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import yaml
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from backend.catalog import refresh_entries
+from backend.catalog_cache import (
+    LOCK_SUFFIX, SHOPS_VERSION_KEY, bump_catalog_version, cache_stats,
+    cached_build, catalog_version, response_key
+)
+from backend.import_jobs import (
+    Heartbeat, claim_next_job, enqueue_import, requeue_stale_jobs, run_job
+)
+from backend.import_logic import CatalogWriter, YamlImporter
+from backend.import_lock import ShopImportLock, ShopImportLocked, lock_key
+from backend.models import (
+    CatalogEntry, CatalogVersion, Category, Contact, ImportCheckpoint,
+    ImportJob, Order, OrderItem, Parameter, Product, ProductInfo,
+    ProductParameter, Shop, User
+)
+from backend.serializers import ProductInfoSerializer
+from backend.shop_refresh import refresh_shops
+from backend.utils.import_profiler import (
+    ImportProfiler, NullProfiler, format_table
+)
+from backend.utils.price_list_validation import PriceListValidationError
+from backend.utils.search import build_search_text
+
+PRICE_LIST = '''shop: Связной
+categories:
+  - id: 224
+    name: Смартфоны
+goods:
+  - id: 4216292
+    category: 224
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+    price: 110000
+    price_rrc: 116990
+    quantity: 14
+    parameters:
+      "Диагональ (дюйм)": 6.5
+      "Цвет": золотистый
+  - id: 4216313
+    category: 224
+    model: apple/iphone/xr
+    name: Смартфон Apple iPhone XR 256GB (красный)
+    price: 65000
+    price_rrc: 69990
+    quantity: 9
+    parameters:
+      "Диагональ (дюйм)": 6.1
+      "Цвет": красный
+'''.encode('utf-8')
+
+
+PRICE_LIST_CSV = '''#shop
+name
+Связной
+#categories
+id,name
+224,Смартфоны
+#goods
+id,category,model,name,price,price_rrc,quantity,param:Диагональ (дюйм),param:Цвет
+4216292,224,apple/iphone/xs-max,Смартфон Apple iPhone XS Max 512GB (золотистый),110000,116990,14,6.5,золотистый
+4216313,224,apple/iphone/xr,Смартфон Apple iPhone XR 256GB (красный),65000,69990,9,6.1,красный
+'''.encode('utf-8')
+
+
+def price_list_jsonl():
+    data = yaml.safe_load(PRICE_LIST)
+    lines = [{'shop': data['shop'], 'categories': data['categories']},
+             *data['goods']]
+    return '\n'.join(
+        json.dumps(line, ensure_ascii=False) for line in lines
+    ).encode('utf-8')
+
+
+class PriceListHandler(BaseHTTPRequestHandler):
+    """
+    Отдает прайс-лист с ETag и отвечает 304 на совпавший If-None-Match.
+    """
+    body = PRICE_LIST
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-yaml')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RefreshShopsTest(TransactionTestCase):
+    """
+    Обновление прайс-листов по Shop.url на локальном http.server.
+    """
+
+    def setUp(self):
+        PriceListHandler.requests = []
+        PriceListHandler.etag = '"v1"'
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceListHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+        self.shop = Shop.objects.create(
+            name='Связной', url=f'{base_url}/shop1.yaml')
+        self.other = Shop.objects.create(
+            name='Евросеть', url=f'{base_url}/shop2.yaml')
+        Shop.objects.create(name='Без ссылки')
+        Shop.objects.create(
+            name='Неактивный', url=f'{base_url}/off.yaml', state=False)
+
+    def refresh(self, **kwargs):
+        return {item['url']: item
+                for item in refresh_shops(workers=4, per_host=2, **kwargs)}
+
+    def test_refresh_imports_and_stores_validators(self):
+        results = self.refresh()
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(PriceListHandler.requests), 2)
+        self.assertTrue(all(item['ok'] for item in results.values()))
+        self.assertEqual(results[self.shop.url]['status'], 'imported')
+        self.assertEqual(
+            ProductInfo.objects.filter(shop=self.shop).count(), 2)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.fetch_etag, '"v1"')
+
+    def test_unchanged_price_list_costs_only_304(self):
+        self.refresh()
+        PriceListHandler.requests = []
+
+        results = self.refresh()
+
+        self.assertEqual(
+            {item['status'] for item in results.values()}, {'not_modified'})
+        self.assertEqual(
+            [headers.get('If-None-Match')
+             for headers in PriceListHandler.requests], ['"v1"', '"v1"'])
+        self.assertEqual(
+            ProductInfo.objects.filter(shop=self.shop).count(), 2)
+
+    def test_changed_etag_reimports(self):
+        self.refresh()
+        PriceListHandler.etag = '"v2"'
+
+        results = self.refresh(shops=Shop.objects.filter(pk=self.shop.pk))
+
+        # Содержимое то же, поэтому импорт пропущен по отпечатку,
+        # но новый ETag сохранен
+        self.assertEqual(results[self.shop.url]['status'], 'unchanged')
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.fetch_etag, '"v2"')
+
+    def test_http_error_is_reported_per_shop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        results = self.refresh()
+
+        self.assertEqual(len(results), 2)
+        self.assertFalse(any(item['ok'] for item in results.values()))
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.fetch_etag, '')
+
+
+class ImportQueueTest(TestCase):
+    """
+    Задания одного магазина: новое заменяет ожидающие, импорты
+    магазина не идут одновременно.
+    """
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name='Связной')
+        self.other = Shop.objects.create(name='Евросеть')
+
+    def test_new_upload_supersedes_queued_jobs(self):
+        first = enqueue_import(self.shop, url='http://example.com/1.yaml')
+        second = enqueue_import(self.shop, url='http://example.com/2.yaml')
+        other = enqueue_import(self.other, url='http://example.com/3.yaml')
+        last = enqueue_import(self.shop, url='http://example.com/4.yaml')
+
+        statuses = dict(ImportJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[first.id], 'superseded')
+        self.assertEqual(statuses[second.id], 'superseded')
+        self.assertEqual(statuses[other.id], 'queued')
+        self.assertEqual(statuses[last.id], 'queued')
+        second.refresh_from_db()
+        self.assertEqual(second.result, {'superseded_by': last.id})
+
+    def test_running_job_is_not_superseded(self):
+        running = enqueue_import(self.shop, url='http://example.com/1.yaml')
+        self.assertEqual(claim_next_job(), running)
+        queued = enqueue_import(self.shop, url='http://example.com/2.yaml')
+
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'running')
+        # Следующее задание магазина ждет окончания текущего
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(
+            ImportJob.objects.get(pk=queued.pk).status, 'queued')
+
+    def test_claim_runs_latest_job_of_shop(self):
+        stale = enqueue_import(self.shop, url='http://example.com/1.yaml')
+        newer = ImportJob.objects.create(
+            shop=self.shop, url='http://example.com/2.yaml')
+
+        self.assertEqual(claim_next_job(), newer)
+        self.assertEqual(
+            ImportJob.objects.get(pk=stale.pk).status, 'superseded')
+
+    @override_settings(IMPORT_JOB_STALE_SECONDS=60)
+    def test_heartbeat_keeps_job_running(self):
+        job = enqueue_import(self.shop, url='http://example.com/1.yaml')
+        self.assertEqual(claim_next_job(), job)
+        stale = timezone.now() - timedelta(minutes=5)
+
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=stale)
+        Heartbeat(job, interval=0)()
+        self.assertEqual(requeue_stale_jobs(), 0)
+        # Чаще interval heartbeat не пишет в БД
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=stale)
+        Heartbeat(job, interval=60)()
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+    def test_heartbeat_without_written_goods(self):
+        beats = []
+        # Фазы импорта
+        result = YamlImporter.import_source(
+            io.BytesIO(PRICE_LIST),
+            profiler=NullProfiler(heartbeat=lambda: beats.append('phase')))
+        self.assertNotIn('profile', result)
+        self.assertIn('phase', beats)
+        # Ожидание блокировки магазина
+        with ShopImportLock(lock_key(self.shop)), \
+                self.assertRaises(ShopImportLocked):
+            ShopImportLock(lock_key(self.shop), timeout=0.3,
+                           on_wait=lambda: beats.append('lock')).acquire()
+        self.assertIn('lock', beats)
+
+    def test_lock_key_of_new_shop(self):
+        # Первый импорт еще не созданного магазина и импорт уже
+        # созданного ждут одну блокировку
+        self.assertEqual(lock_key(None, ' связной '), lock_key(self.shop))
+        self.assertEqual(lock_key(Shop(name='Связной')), lock_key(self.shop))
+        self.assertNotEqual(lock_key(self.other), lock_key(self.shop))
+        with ShopImportLock(lock_key(None, 'Связной')), \
+                self.assertRaises(ShopImportLocked):
+            ShopImportLock(lock_key(self.shop), timeout=0).acquire()
+
+    def test_shop_lock_is_exclusive(self):
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with ShopImportLock(lock_key(self.shop)):
+                acquired.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        acquired.wait(5)
+
+        with self.assertRaises(ShopImportLocked):
+            ShopImportLock(lock_key(self.shop), timeout=0).acquire()
+        # Блокировка другого магазина свободна
+        with ShopImportLock(lock_key(self.other), timeout=0):
+            pass
+        release.set()
+        thread.join()
+        with ShopImportLock(lock_key(self.shop), timeout=0):
+            pass
+
+
+class ImportTest(TestCase):
+    """
+    Импорт прайс-листа: поколения каталога, пачки, отпечаток и
+    контрольные точки.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def import_price_list(self, body=PRICE_LIST, **options):
+        return YamlImporter.import_source(io.BytesIO(body), **options)
+
+    def fail_batches(self, after=1):
+        """
+        Ошибка БД при записи пачек после первых after успешных.
+        """
+        insert_rows = CatalogWriter.insert_rows
+        calls = []
+
+        def failing(writer, *args):
+            calls.append(args)
+            if len(calls) > after:
+                raise DatabaseError('сбой записи пачки')
+            return insert_rows(writer, *args)
+        return mock.patch.object(CatalogWriter, 'insert_rows', failing)
+
+    @staticmethod
+    def dump(data):
+        return yaml.safe_dump(
+            data, allow_unicode=True, sort_keys=False).encode('utf-8')
+
+    def test_incremental_import_keeps_offer_ids(self):
+        shop = self.import_price_list()['shop']
+        offers = dict(ProductInfo.objects.values_list('external_id', 'id'))
+        buyer = User.objects.create_user(
+            'buyer@example.com', 'password', type='buyer')
+        basket = Order.objects.create(user=buyer, status='basket')
+        order = Order.objects.create(user=buyer, status='new')
+        for target in (basket, order):
+            OrderItem.objects.create(
+                order=target, product_info_id=offers[4216292], quantity=1)
+
+        data = yaml.safe_load(PRICE_LIST)
+        kept, removed = data['goods']
+        kept['price'] = 105000
+        data['goods'] = [kept, dict(
+            removed, id=4216400, model='apple/iphone/11', name='Смартфон '
+            'Apple iPhone 11 128GB (черный)')]
+        result = self.import_price_list(
+            self.dump(data), shop=shop, incremental=True)
+
+        self.assertEqual(
+            (result['created'], result['updated'], result['unchanged'],
+             result['deleted']), (1, 1, 0, 1))
+        current = dict(ProductInfo.objects.values_list('external_id', 'id'))
+        self.assertEqual(set(current), {4216292, 4216400})
+        self.assertEqual(current[4216292], offers[4216292])
+        self.assertEqual(
+            ProductInfo.objects.get(pk=offers[4216292]).price, 105000)
+        # Корзина и заказ ссылаются на то же предложение
+        self.assertEqual(
+            list(OrderItem.objects.order_by('order_id').values_list(
+                'order_id', 'product_info_id')),
+            [(basket.pk, offers[4216292]), (order.pk, offers[4216292])])
+
+    def test_same_price_list_is_skipped(self):
+        first = self.import_price_list()
+        offers = list(ProductInfo.objects.values_list('id', 'generation'))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.import_price_list()
+        # Тот же прайс-лист в другом оформлении совпадает по данным
+        reformatted = self.import_price_list(
+            self.dump(yaml.safe_load(PRICE_LIST)))
+
+        self.assertEqual(first['status'], 'imported')
+        for result in (second, reformatted):
+            self.assertEqual(result['status'], 'unchanged')
+            self.assertEqual(result['unchanged'], 2)
+            self.assertEqual(result['created'], 0)
+        self.assertFalse(any(
+            query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            for query in queries.captured_queries))
+        self.assertEqual(
+            list(ProductInfo.objects.values_list('id', 'generation')),
+            offers)
+        # С force прайс-лист импортируется заново
+        self.assertEqual(
+            self.import_price_list(force=True)['status'], 'imported')
+
+    def test_profiler_report(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.import_price_list(
+                profiler=ImportProfiler(trace_memory=False), batch_size=1)
+
+        report = result['profile']
+        phases = {phase['phase']: phase for phase in report['phases']}
+        for name in ('load', 'lock', 'validate', 'fingerprint', 'categories',
+                     'preload', 'transaction', 'products', 'offers',
+                     'activate', 'facets'):
+            self.assertIn(name, phases)
+        # Две пачки по одному товару
+        self.assertEqual(phases['transaction']['calls'], 2)
+        self.assertGreater(phases['offers']['queries'], 0)
+        self.assertEqual(report['rows'], 2)
+        self.assertEqual(report['errors'], 0)
+        self.assertIsNone(report['peak_memory_mb'])
+        # Каждый запрос импорта отнесен ровно к одной фазе
+        self.assertEqual(report['queries'], len(queries))
+        self.assertEqual(
+            sum(phase['queries'] for phase in phases.values()),
+            report['queries'])
+        self.assertAlmostEqual(
+            sum(phase['seconds'] for phase in phases.values()),
+            report['seconds'], delta=0.001)
+        self.assertIn('итого', format_table(report))
+
+    def test_invalid_price_list_is_rejected(self):
+        shop = self.import_price_list()['shop']
+        offers = list(ProductInfo.objects.values_list('id', 'price'))
+        data = yaml.safe_load(PRICE_LIST)
+        first, second = data['goods']
+        first['price'] = -1
+        second['category'] = 999
+        data['goods'].append(dict(second, category=224))
+        body = self.dump(data)
+
+        for stream in (False, True):
+            with self.subTest(stream=stream), \
+                    CaptureQueriesContext(connection) as queries, \
+                    self.assertRaises(PriceListValidationError) as error:
+                self.import_price_list(body, shop=shop, stream=stream)
+
+            report = error.exception.report
+            self.assertFalse(report['valid'])
+            self.assertEqual(report['goods'], 3)
+            self.assertEqual(report['errors_total'], 3)
+            self.assertEqual(report['duplicates'], 1)
+            self.assertEqual(report['unknown_categories'], [999])
+            self.assertEqual(
+                [(item['id'], item['field']) for item in report['errors']],
+                [(4216292, 'price'), (4216313, 'category'),
+                 (4216313, 'id')])
+            self.assertFalse(any(
+                query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                for query in queries.captured_queries))
+        self.assertEqual(
+            list(ProductInfo.objects.values_list('id', 'price')), offers)
+
+    def test_resume_from_checkpoint(self):
+        data = yaml.safe_load(PRICE_LIST)
+        data['goods'].append(dict(
+            data['goods'][1], id=4216400, name='Смартфон Apple iPhone 11'))
+        body = self.dump(data)
+
+        with self.fail_batches(), self.assertRaises(DatabaseError):
+            self.import_price_list(body, batch_size=1, resume=True)
+
+        shop = Shop.objects.get(name='Связной')
+        checkpoint = ImportCheckpoint.objects.get(shop=shop)
+        self.assertEqual(checkpoint.offset, 1)
+        self.assertEqual(checkpoint.stats['created'], 1)
+        # Первая пачка осталась в несобранном поколении
+        written = ProductInfo.objects.get(generation=checkpoint.generation)
+        self.assertEqual(shop.catalog_generation, 0)
+
+        result = self.import_price_list(body, batch_size=1, resume=True)
+
+        shop.refresh_from_db()
+        self.assertEqual(result['status'], 'imported')
+        self.assertEqual(result['resumed_from'], 1)
+        self.assertEqual(result['created'], 3)
+        self.assertEqual(shop.catalog_generation, checkpoint.generation)
+        self.assertEqual(
+            ProductInfo.objects.filter(
+                generation=checkpoint.generation).count(), 3)
+        self.assertTrue(ProductInfo.objects.filter(pk=written.pk).exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    @staticmethod
+    def catalog():
+        return sorted(
+            (info.external_id, info.model, info.product.name,
+             info.price, info.price_rrc, info.quantity,
+             sorted((parameter.parameter.name, parameter.value)
+                    for parameter in info.product_parameters.all()))
+            for info in ProductInfo.objects.active().with_details())
+
+    def test_price_list_formats(self):
+        self.import_price_list()
+        expected = self.catalog()
+        bodies = {
+            'yaml': PRICE_LIST,
+            'jsonl': price_list_jsonl(),
+            'csv': PRICE_LIST_CSV,
+        }
+
+        for fmt, body in bodies.items():
+            for compressed in (False, True):
+                for stream in (False, True):
+                    source = io.BytesIO(
+                        gzip.compress(body) if compressed else body)
+                    with self.subTest(fmt=fmt, gzip=compressed,
+                                      stream=stream):
+                        # Формат определяется по содержимому
+                        result = YamlImporter.import_source(
+                            source, stream=stream, force=True)
+                        self.assertEqual(result['created'], 2)
+                        self.assertEqual(result['errors'], 0)
+                        self.assertEqual(self.catalog(), expected)
+
+    def writer(self, batch_size):
+        shop, _ = Shop.objects.get_or_create(name='Связной')
+        category, _ = Category.objects.get_or_create(name='Смартфоны')
+        return CatalogWriter(shop, {224: category}, batch_size)
+
+    @staticmethod
+    def goods(count, start=0):
+        """
+        Товары с новыми продуктами и именами параметров.
+        """
+        return [{
+            'id': number,
+            'category': 224,
+            'model': f'model/{number}',
+            'name': f'Товар {number}',
+            'price': 100 + number,
+            'price_rrc': 200 + number,
+            'quantity': 1,
+            'parameters': {f'Параметр {number}': number},
+        } for number in range(start, start + count)]
+
+    def test_writer_queries_per_batch(self):
+        def queries(count, batch_size, start):
+            writer = self.writer(batch_size)
+            with CaptureQueriesContext(connection) as captured:
+                stats = writer.write(self.goods(count, start))
+            self.assertEqual(stats['created'], count)
+            return len(captured)
+
+        per_batch = queries(5, 5, start=0)
+        # Число запросов не зависит от размера пачки и растет
+        # только с числом пачек
+        self.assertEqual(queries(40, 40, start=100), per_batch)
+        self.assertEqual(queries(40, 10, start=200), per_batch * 4)
+
+    def test_writer_reuses_concurrently_created_rows(self):
+        writer = self.writer(batch_size=10)
+        goods = self.goods(2)
+        # Параллельный импорт создал продукт и параметр после того,
+        # как writer загрузил справочники
+        category = Category.objects.get(name='Смартфоны')
+        product = Product.objects.create(name='Товар 0', category=category)
+        parameter = Parameter.objects.create(name='Параметр 1')
+
+        stats = writer.write(goods)
+
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['failed_batches'], 0)
+        self.assertEqual(
+            Product.objects.filter(name__in=['Товар 0', 'Товар 1']).count(),
+            2)
+        self.assertEqual(Parameter.objects.filter(
+            name__in=['Параметр 0', 'Параметр 1']).count(), 2)
+        self.assertTrue(writer.offers().filter(
+            external_id=0, product=product).exists())
+        self.assertTrue(ProductParameter.objects.filter(
+            product_info__external_id=1, parameter=parameter).exists())
+
+    def test_writer_reports_failed_batches(self):
+        writer = self.writer(batch_size=1)
+
+        with self.fail_batches(), \
+                self.assertLogs('backend.import_logic', 'WARNING') as logs:
+            stats = writer.write(self.goods(3))
+
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['failed_batches'], 2)
+        self.assertEqual(stats['errors'], 2)
+        self.assertIn('сбой записи пачки', writer.batch_error)
+        self.assertEqual(writer.error_messages, [writer.batch_error] * 2)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(writer.offers().count(), 1)
+
+    def test_failed_full_import_keeps_active_generation(self):
+        shop = self.import_price_list()['shop']
+        shop.refresh_from_db()
+        generation = shop.catalog_generation
+        offers = set(ProductInfo.objects.values_list('id', flat=True))
+
+        with self.fail_batches(), self.assertRaises(ValueError):
+            self.import_price_list(shop=shop, batch_size=1, force=True)
+
+        shop.refresh_from_db()
+        self.assertEqual(shop.catalog_generation, generation)
+        # Записанная первая пачка нового поколения удалена
+        self.assertFalse(ProductInfo.objects.filter(
+            shop=shop, generation__gt=generation).exists())
+        self.assertEqual(
+            set(ProductInfo.objects.values_list('id', flat=True)), offers)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+class PartnerImportTest(TestCase):
+    """
+    Загрузка прайс-листа магазином через partner/update и статус
+    задания импорта.
+    """
+
+    def setUp(self):
+        cache.clear()
+        upload_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(upload_dir.cleanup)
+        uploads = override_settings(IMPORT_UPLOAD_DIR=upload_dir.name)
+        uploads.enable()
+        self.addCleanup(uploads.disable)
+
+        self.user = User.objects.create_user(
+            'shop@example.com', 'password', type='shop')
+        self.shop = Shop.objects.create(name='Связной', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, body=PRICE_LIST, name='price.yaml', **data):
+        return self.client.post('/api/v1/partner/update/', {
+            'file': SimpleUploadedFile(name, body), **data})
+
+    def status(self, job_id, client=None):
+        return (client or self.client).get(
+            f'/api/v1/partner/import-status/{job_id}/')
+
+    def test_import_status(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 202, response.data)
+        job_id = response.data['JobId']
+
+        response = self.status(job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['shop'], 'Связной')
+        self.assertIsNone(response.data['duration'])
+        # Хеш считается при сохранении загрузки, воркер файл не перечитывает
+        raw_hash = hashlib.sha256(PRICE_LIST).hexdigest()
+        self.assertEqual(ImportJob.objects.get(pk=job_id).file_hash,
+                         raw_hash)
+
+        with mock.patch('backend.import_logic.hash_file') as hash_file:
+            run_job(claim_next_job())
+        hash_file.assert_not_called()
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.import_raw_hash, raw_hash)
+
+        response = self.status(job_id)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['processed'], 2)
+        self.assertEqual(response.data['attempts'], 1)
+        self.assertEqual(response.data['error'], '')
+        self.assertEqual(response.data['result']['created'], 2)
+        self.assertEqual(response.data['result']['status'], 'imported')
+        self.assertGreaterEqual(response.data['duration'], 0)
+        self.assertEqual(ProductInfo.objects.filter(
+            shop=self.shop).count(), 2)
+
+    def test_too_large_upload(self):
+        with override_settings(IMPORT_MAX_SIZE=len(PRICE_LIST) - 1):
+            response = self.upload()
+
+            self.assertEqual(response.status_code, 413)
+            self.assertFalse(response.data['Status'])
+            self.assertFalse(ImportJob.objects.exists())
+            self.assertEqual(os.listdir(settings.IMPORT_UPLOAD_DIR), [])
+
+            # Сжатый файл проходит по размеру, но при распаковке
+            # ограничение действует на распакованные данные
+            response = self.upload(
+                gzip.compress(PRICE_LIST), name='price.yaml.gz')
+            self.assertEqual(response.status_code, 202, response.data)
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('больше допустимого размера', job.error)
+        self.assertFalse(ProductInfo.objects.exists())
+
+    def test_import_status_of_other_shop(self):
+        job = ImportJob.objects.create(
+            shop=self.shop, url='http://example.com/price.yaml')
+        other = User.objects.create_user(
+            'other@example.com', 'password', type='shop')
+        Shop.objects.create(name='Евросеть', user=other)
+        buyer = User.objects.create_user(
+            'buyer@example.com', 'password', type='buyer')
+
+        for user, expected in ((other, 404), (buyer, 403)):
+            client = APIClient()
+            client.force_authenticate(user)
+            with self.subTest(user=user.email):
+                self.assertEqual(
+                    self.status(job.id, client).status_code, expected)
+
+
+# Бюджет SQL-запросов на запрос к API. Число запросов не должно зависеть
+# от объема данных и размера страницы: рост означает N+1. Ответы каталога
+# и заказов читают версию каталога (CatalogVersion) одним запросом
+QUERY_BUDGETS = {
+    'api-root': 0,
+    'shop-list': 3,
+    'shop-detail': 2,
+    'category-list': 3,
+    'category-detail': 2,
+    'product-list': 3,
+    'product-detail': 2,
+    'product-info-list': 3,
+    'product-info-cursor': 2,
+    'product-info-search': 4,
+    'product-info-detail': 4,
+    'product-info-facets': 2,
+    'product-info-not-modified': 1,
+    'contact-list': 2,
+    'contact-create': 1,
+    'contact-detail': 1,
+    'contact-update': 2,
+    'contact-delete': 3,
+    'basket-list': 4,
+    'basket-add': 9,
+    'basket-update': 4,
+    'basket-delete': 4,
+    'order-list': 7,
+    'order-list-not-modified': 2,
+    'order-detail': 6,
+    'order-confirm': 6,
+    'user-register': 3,
+    'user-login': 5,
+    'user-logout': 2,
+    'user-profile': 1,
+    'user-profile-update': 2,
+    'partner-update': 6,
+    'partner-import-status': 1,
+}
+
+
+def seed_catalog(scale, start=0):
+    """
+    Заполняет каталог: scale магазинов по 10 товаров с тремя
+    параметрами в двух категориях.
+
+    Returns:
+        list: Созданные ProductInfo
+    """
+    parameters = [Parameter.objects.get_or_create(name=name)[0]
+                  for name in ('Цвет', 'Память', 'Диагональ')]
+    categories = [Category.objects.get_or_create(name=name)[0]
+                  for name in ('Смартфоны', 'Аксессуары')]
+    infos = []
+    for shop_index in range(start, start + scale):
+        shop = Shop.objects.create(name=f'Магазин {shop_index}')
+        products = Product.objects.bulk_create(
+            Product(name=f'Товар {shop_index}-{index}',
+                    category=categories[index % 2])
+            for index in range(10))
+        shop_infos = ProductInfo.objects.bulk_create(
+            ProductInfo(product=product, shop=shop, external_id=index,
+                        model=f'model/{index}', quantity=100,
+                        price=1000 + index, price_rrc=1200 + index,
+                        search_text=build_search_text(
+                            product.name, f'model/{index}'))
+            for index, product in enumerate(products))
+        ProductParameter.objects.bulk_create(
+            ProductParameter(product_info=info, parameter=parameter,
+                             value=f'{parameter.name} {info.external_id}')
+            for info in shop_infos for parameter in parameters)
+        infos.extend(shop_infos)
+    refresh_entries(ProductInfo.objects.filter(
+        pk__in=[info.pk for info in infos]))
+    bump_catalog_version()
+    return infos
+
+
+class CatalogFilterTest(TestCase):
+    """
+    Фильтры и сортировка /api/v1/product-info/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.infos = seed_catalog(2)
+        ProductInfo.objects.filter(external_id__lt=3).update(quantity=0)
+        Shop.objects.filter(name='Магазин 1').update(state=False)
+        refresh_entries(ProductInfo.objects.all())
+
+    def setUp(self):
+        # Кэш не откатывается вместе с транзакцией теста
+        cache.clear()
+
+    def get(self, query, expected=200):
+        response = APIClient().get(f'/api/v1/product-info/?{query}')
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data
+
+    def test_filters(self):
+        shop = self.infos[0].shop_id
+        category = self.infos[0].product.category_id
+        cases = {
+            f'shop={shop}': 10,
+            f'category={category}': 10,
+            f'shop={shop}&category={category}': 5,
+            'price_min=1003&price_max=1005': 6,
+            'price_rrc_max=1201': 4,
+            'in_stock=1': 14,
+            'active_shops=1': 10,
+            'in_stock=1&active_shops=1&price_max=1004': 2,
+        }
+        for query, count in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.get(query)['count'], count)
+
+    def test_ordering(self):
+        prices = [item['price'] for item in
+                  self.get('ordering=-price&shop=' +
+                           str(self.infos[0].shop_id))['results']]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        self.assertEqual(prices[0], '1009.00')
+
+    def test_invalid_params(self):
+        for query in ('shop=abc', 'price_min=x', 'ordering=name',
+                      'price_min=10&price_max=5'):
+            with self.subTest(query=query):
+                self.get(query, expected=400)
+
+    def test_cursor_pagination(self):
+        seed_catalog(3, start=2)
+        query = 'pagination=cursor&ordering=-price&in_stock=1'
+        expected = [info.id for info in ProductInfo.objects.filter(
+            quantity__gt=0).order_by('-price', '-id')]
+        pages, url = [], f'/api/v1/product-info/?{query}'
+        while url:
+            data = APIClient().get(url).data
+            self.assertNotIn('count', data)
+            pages.append([item['id'] for item in data['results']])
+            url = data['next']
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages), 3)
+
+        # Назад с последней страницы
+        data = APIClient().get(data['previous']).data
+        self.assertEqual([item['id'] for item in data['results']], pages[1])
+        data = APIClient().get(data['previous']).data
+        self.assertEqual([item['id'] for item in data['results']], pages[0])
+        self.assertIsNone(data['previous'])
+
+        # Курсор от другой сортировки не подходит
+        response = APIClient().get(
+            data['next'].replace('ordering=-price', 'ordering=price'))
+        self.assertEqual(response.status_code, 404)
+        # Без курсора - прежний вывод с номерами страниц
+        self.assertEqual(self.get('page=2')['count'], 50)
+
+
+class ImportedCatalogTest(TestCase):
+    """
+    Поиск и фасеты каталога, импортированного из прайс-листа.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        YamlImporter.process_data(yaml.safe_load(PRICE_LIST))
+
+    def setUp(self):
+        # Кэш не откатывается вместе с транзакцией теста
+        cache.clear()
+
+    def search(self, query):
+        response = APIClient().get('/api/v1/product-info/', {'q': query})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['external_id'] for item in response.data['results']]
+
+    def test_search(self):
+        cases = {
+            'iphone': [4216292, 4216313],
+            'Apple iPhone XR': [4216313],
+            'КРАСНЫЙ': [4216313],
+            'xs-max': [4216292],
+            'samsung': [],
+            '!!!': [],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), expected)
+
+    def test_incremental_import_updates_search_text(self):
+        self.assertEqual(self.search('синий'), [])
+        data = yaml.safe_load(PRICE_LIST)
+        data['goods'][1]['parameters']['Цвет'] = 'синий'
+        YamlImporter.process_data(data, incremental=True)
+        self.assertEqual(self.search('синий'), [4216313])
+
+    def facets(self, **params):
+        response = APIClient().get('/api/v1/product-info/facets/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {facet['name']: {item['value']: item['count']
+                                for item in facet['values']}
+                for facet in response.data}
+
+    def test_facets(self):
+        self.assertEqual(self.facets(category=224), {
+            'Диагональ (дюйм)': {'6.1': 1, '6.5': 1},
+            'Цвет': {'золотистый': 1, 'красный': 1},
+        })
+        self.assertEqual(self.facets(category=1), {})
+
+        color = Parameter.objects.get(name='Цвет').id
+        diagonal = Parameter.objects.get(name='Диагональ (дюйм)').id
+        cases = {
+            f'param={color}:красный': [4216313],
+            f'param={color}:красный&param={color}:золотистый': [
+                4216292, 4216313],
+            f'param={color}:красный&param={diagonal}:6.5': [],
+            f'param={color}:черный': [],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/v1/product-info/?{query}')
+                self.assertEqual(
+                    [item['external_id'] for item in
+                     response.data['results']], expected)
+        response = APIClient().get('/api/v1/product-info/?param=цвет')
+        self.assertEqual(response.status_code, 400)
+
+    def test_numeric_ranges(self):
+        diagonal = Parameter.objects.get(name='Диагональ (дюйм)')
+        self.assertEqual(sorted(ProductParameter.objects.filter(
+            parameter=diagonal).values_list('value_numeric', flat=True)),
+            [6.1, 6.5])
+        self.assertFalse(ProductParameter.objects.filter(
+            parameter__name='Цвет', value_numeric__isnull=False).exists())
+
+        cases = {
+            f'param_min={diagonal.id}:6.2': [4216292],
+            f'param_max={diagonal.id}:6.1': [4216313],
+            f'param_min={diagonal.id}:6&param_max={diagonal.id}:7': [
+                4216292, 4216313],
+            f'param_min={diagonal.id}:7': [],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/v1/product-info/?{query}')
+                self.assertEqual(
+                    [item['external_id'] for item in
+                     response.data['results']], expected)
+        response = APIClient().get(
+            f'/api/v1/product-info/?param_min={diagonal.id}:7'
+            f'&param_max={diagonal.id}:6')
+        self.assertEqual(response.status_code, 400)
+
+        facets = {facet['name']: facet for facet in APIClient().get(
+            '/api/v1/product-info/facets/').data}
+        self.assertEqual((facets['Диагональ (дюйм)']['min'],
+                          facets['Диагональ (дюйм)']['max']), (6.1, 6.5))
+        self.assertNotIn('min', facets['Цвет'])
+
+    def test_admin_edit_refreshes_catalog(self):
+        admin = User.objects.create_superuser('admin@example.com', 'password')
+        self.client.force_login(admin)
+        info = ProductInfo.objects.get(external_id=4216313)
+        for name, value in (('Диагональ (дюйм)', '7,2'), ('Цвет', 'синий')):
+            item = ProductParameter.objects.get(
+                product_info=info, parameter__name=name)
+            response = self.client.post(
+                f'/admin/backend/productparameter/{item.pk}/change/', {
+                    'product_info': info.pk,
+                    'parameter': item.parameter_id,
+                    'value': value,
+                })
+            self.assertEqual(response.status_code, 302)
+
+        diagonal = ProductParameter.objects.get(
+            product_info=info, parameter__name='Диагональ (дюйм)')
+        self.assertEqual(diagonal.value_numeric, 7.2)
+        self.assertEqual(self.search('синий'), [4216313])
+        self.assertEqual(self.facets(category=224), {
+            'Диагональ (дюйм)': {'6.5': 1, '7,2': 1},
+            'Цвет': {'золотистый': 1, 'синий': 1},
+        })
+        response = APIClient().get(
+            f'/api/v1/product-info/?param_min={diagonal.parameter_id}:7')
+        self.assertEqual([item['external_id'] for item in
+                          response.data['results']], [4216313])
+
+    def test_catalog_entries(self):
+        expected = json.loads(json.dumps(ProductInfoSerializer(
+            ProductInfo.objects.with_details().order_by('pk'),
+            many=True).data))
+        for query in ('', '?q=apple', '?q=apple&ordering=id'):
+            with self.subTest(query=query):
+                response = APIClient().get(f'/api/v1/product-info/{query}')
+                results = sorted(response.data['results'],
+                                 key=lambda item: item['id'])
+                self.assertEqual(results, expected)
+
+        data = yaml.safe_load(PRICE_LIST)
+        data['shop'] = 'Связной Онлайн'
+        data['goods'][1]['price'] = 999
+        data['goods'][1]['parameters']['Цвет'] = 'синий'
+        YamlImporter.process_data(data, shop=Shop.objects.get(),
+                                  incremental=True)
+        entry = CatalogEntry.objects.get(external_id=4216313)
+        self.assertEqual((entry.price, entry.shop_name),
+                         (999, 'Связной Онлайн'))
+        self.assertIn({'parameter': {'id': Parameter.objects.get(
+            name='Цвет').id, 'name': 'Цвет'}, 'value': 'синий'},
+            entry.parameters)
+
+        data['goods'].pop()
+        YamlImporter.process_data(data)
+        response = APIClient().get('/api/v1/product-info/')
+        self.assertEqual([item['external_id'] for item in
+                          response.data['results']], [4216292])
+        self.assertEqual(CatalogEntry.objects.count(), 1)
+
+    def test_response_cache(self):
+        other = seed_catalog(1)[0].shop_id
+        shop = Shop.objects.get(name='Связной').id
+        urls = {'all': '/api/v1/product-info/',
+                'shop': f'/api/v1/product-info/?shop={shop}',
+                'other': f'/api/v1/product-info/?shop={other}',
+                'facets': f'/api/v1/product-info/facets/?shop={shop}',
+                'categories': '/api/v1/categories/'}
+
+        def statuses():
+            return {name: APIClient().get(url)['X-Cache']
+                    for name, url in urls.items()}
+
+        cache_stats(reset=True)
+        self.assertEqual(set(statuses().values()), {'MISS'})
+        # Из БД читается только версия каталога
+        with self.assertNumQueries(len(urls)):
+            self.assertEqual(set(statuses().values()), {'HIT'})
+        self.assertEqual(cache_stats(), {'hits': 5, 'misses': 5,
+                                         'coalesced': 0, 'stale': 0})
+
+        # Импорт не трогает ответы по другому магазину
+        data = yaml.safe_load(PRICE_LIST)
+        data['goods'][1]['price'] = 999
+        YamlImporter.process_data(data, incremental=True)
+        self.assertEqual(statuses(), {
+            'all': 'MISS', 'shop': 'MISS', 'other': 'HIT',
+            'facets': 'MISS', 'categories': 'MISS'})
+        response = APIClient().get(urls['shop'])
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertIn('999.00', [item['price'] for item in
+                                 response.data['results']])
+
+        # Правка в админке сбрасывает все ответы
+        bump_catalog_version()
+        self.assertEqual(set(statuses().values()), {'MISS'})
+        # Ошибки не кэшируются
+        hits = cache_stats()['hits']
+        for _ in range(2):
+            response = APIClient().get('/api/v1/product-info/?shop=x')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(cache_stats()['hits'], hits)
+
+    def test_version_from_database(self):
+        url = '/api/v1/product-info/'
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'MISS')
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'HIT')
+        # Версия не хранится в кэше процесса
+        version = catalog_version()
+        cache.clear()
+        self.assertEqual(catalog_version(), version)
+
+        # Импорт в другом процессе меняет только версию в БД
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'MISS')
+        CatalogVersion.objects.filter(key=SHOPS_VERSION_KEY).update(
+            version=F('version') + 1)
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'MISS')
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'HIT')
+
+    def test_single_flight(self):
+        request = APIRequestFactory().get('/api/v1/product-info/')
+        calls, responses = [], []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return Response({'count': 1})
+
+        threads = [threading.Thread(target=lambda: responses.append(
+            cached_build(request, 'v1', build))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(response['X-Cache'] for response in responses),
+                         ['COALESCED'] * 4 + ['MISS'])
+        self.assertEqual({response.data['count'] for response in responses},
+                         {1})
+
+    def test_stale_while_revalidate(self):
+        url = '/api/v1/product-info/'
+        etag = APIClient().get(url)['ETag']
+        bump_catalog_version()
+        # Новую версию ответа вычисляет другой процесс
+        key = response_key(APIRequestFactory().get(url), catalog_version())
+        cache.add(key + LOCK_SUFFIX, time.time())
+        response = APIClient().get(url)
+        self.assertEqual((response['X-Cache'], response['ETag']),
+                         ('STALE', etag))
+        with override_settings(CATALOG_CACHE_STALE_SECONDS=0,
+                               CATALOG_CACHE_LOCK_TIMEOUT=0.1):
+            response = APIClient().get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get(self):
+        client = APIClient()
+        response = client.get('/api/v1/categories/')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+
+        response = client.get('/api/v1/categories/',
+                              HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((response.content, response['ETag']), (b'', etag))
+
+        # Импорт меняет версию каталога и ETag
+        YamlImporter.process_data(yaml.safe_load(PRICE_LIST),
+                                  incremental=True)
+        response = client.get('/api/v1/categories/',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        buyer = User.objects.create_user('buyer@example.com', 'password')
+        client.force_authenticate(buyer)
+        self.assertEqual(client.get('/api/v1/categories/')['Cache-Control'],
+                         'private, no-cache')
+        order = Order.objects.create(user=buyer, status='new')
+        url = f'/api/v1/orders/{order.id}/'
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        order.status = 'confirmed'
+        order.save()
+        self.assertEqual(client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Импорт в другом процессе меняет версию каталога только в БД:
+        # позиции заказов показывают текущие предложения
+        etags = {url: client.get(url)['ETag']
+                 for url in (url, '/api/v1/orders/', '/api/v1/categories/')}
+        CatalogVersion.objects.filter(key=SHOPS_VERSION_KEY).update(
+            version=F('version') + 1)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(client.get(
+                    url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_import_rebuilds_facets(self):
+        data = yaml.safe_load(PRICE_LIST)
+        data['goods'][1]['parameters']['Цвет'] = 'золотистый'
+        YamlImporter.process_data(data, incremental=True)
+        self.assertEqual(self.facets(category=224)['Цвет'],
+                         {'золотистый': 2})
+        data['goods'].pop()
+        YamlImporter.process_data(data)
+        self.assertEqual(self.facets(shop=Shop.objects.get().id)['Цвет'],
+                         {'золотистый': 1})
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class QueryBudgetTest(TestCase):
+    """
+    Бюджет SQL-запросов для каждого маршрута backend/urls.py.
+
+    Списки замеряются дважды: на небольших данных и после того, как
+    данных становится больше страницы. Число запросов должно совпасть.
+    С переменной окружения API_QUERY_REPORT печатается таблица запросов
+    и времени по эндпоинтам, а если в ней указан путь к .json - отчет
+    сохраняется в файл.
+    """
+    report = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        # Меньше страницы, чтобы рост данных менял число объектов в ответе
+        cls.infos = seed_catalog(1)
+        cls.buyer = User.objects.create_user(
+            'buyer@example.com', 'password', type='buyer')
+        cls.shop_user = User.objects.create_user(
+            'shop@example.com', 'password', type='shop')
+        cls.shop = Shop.objects.create(name='Свой магазин',
+                                       user=cls.shop_user)
+        cls.contact = Contact.objects.create(
+            user=cls.buyer, city='Москва', street='Тверская', house='1',
+            phone='+70000000000')
+        cls.job = ImportJob.objects.create(
+            shop=cls.shop, url='http://example.com/price.yaml')
+
+    def setUp(self):
+        # Кэш не откатывается вместе с транзакцией теста
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        target = os.environ.get('API_QUERY_REPORT')
+        if not target:
+            return
+        if target.endswith('.json'):
+            with open(target, 'w', encoding='utf-8') as file:
+                json.dump(cls.report, file, ensure_ascii=False, indent=2)
+            return
+        lines = [f'{"эндпоинт":<24} {"запросов":>9} {"бюджет":>7} '
+                 f'{"время, мс":>10}']
+        for name, item in sorted(cls.report.items()):
+            lines.append(
+                f'{name:<24} {item["queries"]:>9} {item["budget"]:>7} '
+                f'{item["ms"]:>10.1f}')
+        print('\n' + '\n'.join(lines))
+
+    def add_orders(self, count, items=3):
+        infos = ProductInfo.objects.all()[:items]
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.buyer, status='new', contact=self.contact)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product_info=info, quantity=1)
+                for info in infos)
+
+    def fill_basket(self, items):
+        basket, _ = Order.objects.get_or_create(
+            user=self.buyer, status='basket')
+        in_basket = basket.ordered_items.values('product_info')
+        OrderItem.objects.bulk_create(
+            OrderItem(order=basket, product_info=info, quantity=1)
+            for info in ProductInfo.objects.exclude(
+                id__in=in_basket)[:items])
+        return basket
+
+    def client_for(self, user=None, token=False):
+        client = APIClient()
+        if token:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        elif user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def measure(self, name, client, method, url, data=None,
+                expected=200, **kwargs):
+        """
+        Выполняет запрос и проверяет статус и бюджет запросов.
+
+        Returns:
+            int: Число SQL-запросов
+        """
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, **kwargs)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, expected,
+                         f'{name}: {getattr(response, "data", None)}')
+        count = len(queries)
+        self.report[name] = {
+            'queries': count,
+            'budget': QUERY_BUDGETS[name],
+            'ms': round(elapsed * 1000, 1),
+        }
+        self.assertLessEqual(
+            count, QUERY_BUDGETS[name],
+            f'{name}: {count} запросов\n' + '\n'.join(
+                query['sql'] for query in queries.captured_queries))
+        return count
+
+    def assert_independent(self, name, request, grow):
+        """
+        Число запросов не меняется, когда данных становится больше
+        страницы.
+        """
+        before = request()
+        grow()
+        self.assertEqual(request(), before,
+                         f'{name}: число запросов зависит от объема данных')
+
+    def test_catalog(self):
+        client = self.client_for()
+        info = self.infos[0]
+        self.measure('api-root', client, 'get', '/api/v1/')
+        lists = {'shop-list': '/api/v1/shops/',
+                 'category-list': '/api/v1/categories/',
+                 'product-list': '/api/v1/products/',
+                 'product-info-list': '/api/v1/product-info/',
+                 'product-info-cursor':
+                     '/api/v1/product-info/?pagination=cursor',
+                 'product-info-search': '/api/v1/product-info/?q=товар'}
+        self.assert_independent(
+            'catalog',
+            lambda: {name: self.measure(name, client, 'get', url)
+                     for name, url in lists.items()},
+            lambda: seed_catalog(3, start=1))
+        self.measure('shop-detail', client, 'get',
+                     f'/api/v1/shops/{info.shop_id}/')
+        self.measure('category-detail', client, 'get',
+                     f'/api/v1/categories/{info.product.category_id}/')
+        self.measure('product-detail', client, 'get',
+                     f'/api/v1/products/{info.product_id}/')
+        self.measure('product-info-detail', client, 'get',
+                     f'/api/v1/product-info/{info.id}/')
+        self.measure('product-info-facets', client, 'get',
+                     '/api/v1/product-info/facets/',
+                     {'category': info.product.category_id})
+        etag = client.get('/api/v1/product-info/')['ETag']
+        self.measure('product-info-not-modified', client, 'get',
+                     '/api/v1/product-info/', expected=304,
+                     HTTP_IF_NONE_MATCH=etag)
+
+    def test_contacts(self):
+        client = self.client_for(self.buyer)
+        self.assert_independent(
+            'contact-list',
+            lambda: self.measure('contact-list', client, 'get',
+                                 '/api/v1/contacts/'),
+            lambda: Contact.objects.bulk_create(
+                Contact(user=self.buyer, city='Москва', street=f'Улица {i}',
+                        phone='+70000000000') for i in range(25)))
+        url = f'/api/v1/contacts/{self.contact.id}/'
+        self.measure('contact-create', client, 'post', '/api/v1/contacts/',
+                     {'city': 'Тверь', 'street': 'Советская',
+                      'phone': '+70000000001'}, expected=201)
+        self.measure('contact-detail', client, 'get', url)
+        self.measure('contact-update', client, 'patch', url,
+                     {'city': 'Казань'})
+        self.measure('contact-delete', client, 'delete', url, expected=204)
+
+    def test_basket(self):
+        client = self.client_for(self.buyer)
+        self.fill_basket(3)
+        self.assert_independent(
+            'basket-list',
+            lambda: self.measure('basket-list', client, 'get',
+                                 '/api/v1/basket/'),
+            lambda: (seed_catalog(3, start=1), self.fill_basket(25)))
+        info = ProductInfo.objects.exclude(
+            ordered_items__order__user=self.buyer).first()
+        self.measure('basket-add', client, 'post', '/api/v1/basket/',
+                     {'product_info_id': info.id, 'quantity': 1},
+                     expected=201)
+        item = OrderItem.objects.get(order__user=self.buyer,
+                                     product_info=info)
+        self.measure('basket-update', client, 'patch',
+                     f'/api/v1/basket/{item.id}/', {'quantity': 2})
+        self.measure('basket-delete', client, 'delete',
+                     f'/api/v1/basket/{item.id}/')
+
+    def test_orders(self):
+        client = self.client_for(self.buyer)
+        self.add_orders(2)
+        self.assert_independent(
+            'order-list',
+            lambda: self.measure('order-list', client, 'get',
+                                 '/api/v1/orders/'),
+            lambda: self.add_orders(25, items=5))
+        order = Order.objects.filter(user=self.buyer).first()
+        self.measure('order-detail', client, 'get',
+                     f'/api/v1/orders/{order.id}/')
+        etag = client.get('/api/v1/orders/')['ETag']
+        self.measure('order-list-not-modified', client, 'get',
+                     '/api/v1/orders/', expected=304,
+                     HTTP_IF_NONE_MATCH=etag)
+
+    def test_order_confirm(self):
+        client = self.client_for(self.buyer)
+        seed_catalog(3, start=1)
+        self.fill_basket(3)
+
+        def confirm():
+            count = self.measure(
+                'order-confirm', client, 'post', '/api/v1/order/confirm/',
+                {'contact_id': self.contact.id})
+            self.fill_basket(25)
+            return count
+
+        self.assert_independent('order-confirm', confirm, lambda: None)
+
+    def test_users(self):
+        client = self.client_for()
+        self.measure('user-register', client, 'post',
+                     '/api/v1/user/register/',
+                     {'email': 'new@example.com', 'password': 'password',
+                      'password2': 'password'}, expected=201)
+        self.measure('user-login', client, 'post', '/api/v1/user/login/',
+                     {'email': 'buyer@example.com', 'password': 'password'})
+        client = self.client_for(self.buyer, token=True)
+        self.measure('user-profile', client, 'get', '/api/v1/user/profile/')
+        self.measure('user-profile-update', client, 'put',
+                     '/api/v1/user/profile/', {'company': 'ООО Ромашка'})
+        self.measure('user-logout', client, 'post', '/api/v1/user/logout/')
+
+    def test_partner(self):
+        client = self.client_for(self.shop_user)
+        self.measure('partner-update', client, 'post',
+                     '/api/v1/partner/update/',
+                     {'url': 'http://example.com/price.yaml'}, expected=202)
+        self.measure('partner-import-status', client, 'get',
+                     f'/api/v1/partner/import-status/{self.job.id}/')
@@ -41,4 +41,8 @@ urlpatterns = [
         'partner/update/',
         views.PartnerUpdate.as_view(),
         name='partner-update'),
+    path(
+        'partner/import-status/<int:pk>/',
+        views.PartnerImportStatus.as_view(),
+        name='partner-import-status'),
 ]
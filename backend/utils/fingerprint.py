@@ -0,0 +1,100 @@
+"""
+Отпечатки прайс-листов для пропуска повторных импортов.
+
+Используются два хеша:
+- хеш исходных байтов - совпадает только у побайтно одинаковых файлов,
+  зато считается без разбора YAML;
+- нормализованный хеш разобранных данных - не зависит от форматирования
+  файла и порядка товаров.
+"""
+import hashlib
+import json
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    Хеш файла, прочитанного по частям.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_fileobj(file):
+    """
+    Хеш открытого файлового объекта; позиция возвращается в начало.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class HashingReader:
+    """
+    Обертка над потоком, считающая хеш прочитанных байтов.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.digest.update(chunk)
+        return chunk
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False,
+                      separators=(',', ':'), default=str).encode('utf-8')
+
+
+class DataHasher:
+    """
+    Нормализованный хеш прайс-листа.
+
+    Хеши товаров складываются по модулю 2**256, поэтому результат не
+    зависит от порядка товаров и считается потоково, по одному товару.
+    """
+
+    def __init__(self, shop_name, categories):
+        self.header = _canonical({
+            'shop': shop_name,
+            'categories': sorted(
+                (_canonical(category).decode('utf-8')
+                 for category in categories or []))
+        })
+        self.total = 0
+        self.count = 0
+
+    def update(self, item):
+        item_hash = hashlib.sha256(_canonical(item)).digest()
+        self.total = (self.total + int.from_bytes(item_hash, 'big')) \
+            % (1 << 256)
+        self.count += 1
+
+    def wrap(self, goods):
+        """
+        Пропускает товары через хешер, не меняя их.
+        """
+        for item in goods:
+            self.update(item)
+            yield item
+
+    def hexdigest(self):
+        digest = hashlib.sha256(self.header)
+        digest.update(self.count.to_bytes(8, 'big'))
+        digest.update(self.total.to_bytes(32, 'big'))
+        return digest.hexdigest()
@@ -0,0 +1,220 @@
+"""
+Профилирование импорта прайс-листов по фазам.
+
+Для каждой фазы считаются время, число SQL-запросов и время в SQL.
+Время фаз исключающее: пока идет вложенная фаза, внешняя не считается,
+поэтому сумма фаз плюс "прочее" равна общему времени импорта.
+
+Смена фазы - признак того, что импорт жив: на ней вызывается heartbeat
+(задание очереди продлевает updated_at, см. import_jobs.Heartbeat).
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection
+
+OTHER_PHASE = 'other'
+
+
+class NullProfiler:
+    """
+    Профилировщик, который ничего не замеряет. Используется по умолчанию,
+    чтобы код импорта не проверял наличие профилировщика.
+
+    Args:
+        heartbeat: Функция, вызываемая при смене фазы и по
+            profiler.heartbeat(), или None
+    """
+    rows = 0
+    errors = 0
+
+    def __init__(self, heartbeat=None):
+        self._heartbeat = heartbeat
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def heartbeat(self):
+        """
+        Сообщает, что импорт продолжается (например, в долгом цикле
+        внутри одной фазы).
+        """
+        if self._heartbeat is not None:
+            self._heartbeat()
+
+    @contextmanager
+    def phase(self, name):
+        self.heartbeat()
+        yield
+
+    def report(self):
+        """
+        Returns:
+            None: Без замеров отчета нет
+        """
+        return None
+
+    def iterate(self, name, iterable):
+        return iterable
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class ImportProfiler(NullProfiler):
+    """
+    Собирает время, SQL-запросы и пик памяти импорта по фазам.
+
+    Использование:
+        with ImportProfiler() as profiler:
+            with profiler.phase('load'):
+                ...
+        report = profiler.report()
+
+    Args:
+        trace_memory: Отслеживать пик памяти через tracemalloc
+            (замедляет выделение памяти)
+        heartbeat: См. NullProfiler
+    """
+
+    def __init__(self, trace_memory=True, heartbeat=None):
+        super().__init__(heartbeat)
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.stack = []
+        self.rows = 0
+        self.errors = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.peak_memory = None
+        self._mark = None
+        self._wrapper = None
+        self._own_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory:
+            self._own_tracing = not tracemalloc.is_tracing()
+            if self._own_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._wrapper = connection.execute_wrapper(self._execute)
+        self._wrapper.__enter__()
+        self.started = self._mark = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        now = time.perf_counter()
+        self._charge(now)
+        self.elapsed = now - self.started
+        self._wrapper.__exit__(*exc_info)
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._own_tracing:
+                tracemalloc.stop()
+        return False
+
+    def _stats(self, name):
+        return self.phases.setdefault(name, {
+            'calls': 0, 'seconds': 0.0, 'queries': 0, 'sql_seconds': 0.0})
+
+    def _charge(self, now):
+        """
+        Относит время с последней отметки к текущей фазе.
+        """
+        name = self.stack[-1] if self.stack else OTHER_PHASE
+        self._stats(name)['seconds'] += now - self._mark
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name):
+        self.heartbeat()
+        self._charge(time.perf_counter())
+        self._stats(name)['calls'] += 1
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self.stack.pop()
+
+    def iterate(self, name, iterable):
+        """
+        Относит время получения каждого элемента к фазе name
+        (например, разбор товаров в потоковом режиме).
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _execute(self, execute, sql, params, many, context):
+        stats = self._stats(self.stack[-1] if self.stack else OTHER_PHASE)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats['queries'] += 1
+            stats['sql_seconds'] += time.perf_counter() - started
+
+    def report(self):
+        """
+        Returns:
+            dict: Отчет, пригодный для сохранения в JSON
+        """
+        phases = [
+            {'phase': name, **{key: round(value, 6) if isinstance(
+                value, float) else value for key, value in stats.items()}}
+            for name, stats in self.phases.items()
+        ]
+        return {
+            'seconds': round(self.elapsed, 6),
+            'queries': sum(stats['queries'] for stats in self.phases.values()),
+            'sql_seconds': round(sum(
+                stats['sql_seconds'] for stats in self.phases.values()), 6),
+            'rows': self.rows,
+            'errors': self.errors,
+            'rows_per_second': round(
+                self.rows / self.elapsed, 1) if self.elapsed else 0,
+            'peak_memory_mb': round(self.peak_memory / 1024 / 1024, 1)
+            if self.peak_memory is not None else None,
+            'phases': phases,
+        }
+
+
+def format_table(report):
+    """
+    Отчет профилировщика в виде текстовой таблицы.
+    """
+    lines = [
+        f'{"фаза":<14} {"вызовов":>8} {"время, с":>10} {"%":>6} '
+        f'{"запросов":>9} {"SQL, с":>9}'
+    ]
+    total = report['seconds'] or 1
+    for phase in sorted(report['phases'], key=lambda item: -item['seconds']):
+        lines.append(
+            f'{phase["phase"]:<14} {phase["calls"]:>8} '
+            f'{phase["seconds"]:>10.3f} '
+            f'{phase["seconds"] / total * 100:>6.1f} '
+            f'{phase["queries"]:>9} {phase["sql_seconds"]:>9.3f}')
+    lines.append(
+        f'{"итого":<14} {"":>8} {report["seconds"]:>10.3f} {100:>6.1f} '
+        f'{report["queries"]:>9} {report["sql_seconds"]:>9.3f}')
+    memory = report['peak_memory_mb']
+    lines.append(
+        f'Строк: {report["rows"]}, ошибок: {report["errors"]}, '
+        f'{report["rows_per_second"]:.0f} строк/с'
+        + (f', пик памяти: {memory} МБ' if memory is not None else ''))
+    return '\n'.join(lines)
+
+
+def format_json(report):
+    return json.dumps(report, ensure_ascii=False, indent=2)
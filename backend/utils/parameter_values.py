@@ -0,0 +1,26 @@
+"""
+Числовые значения параметров товаров.
+
+Значение параметра хранится строкой (ProductParameter.value), а если
+строка - это число, то и в ProductParameter.value_numeric: по нему
+фильтр ?param_min= / ?param_max= идет диапазоном по индексу, без
+приведения строк в каждом запросе. Числом считается только вся
+строка целиком: '6.5', '128', '-10', '6,5'; значения с единицами
+измерения или вроде '2688x1242' остаются только строками.
+"""
+import math
+import re
+
+_number = re.compile(r'[+-]?(\d+([.,]\d*)?|[.,]\d+)')
+
+
+def numeric_value(value):
+    """
+    Returns:
+        float или None: Число из строки значения параметра
+    """
+    value = str(value).strip()
+    if not _number.fullmatch(value):
+        return None
+    number = float(value.replace(',', '.'))
+    return number if math.isfinite(number) else None
@@ -0,0 +1,445 @@
+"""
+Форматы прайс-листов: YAML, JSON Lines и CSV, каждый также в gzip.
+
+Любой формат разбирается в одну и ту же структуру
+{'shop': ..., 'categories': [...], 'goods': [...]}, поэтому дальше
+импорт не зависит от формата. Формат выбирается явно, по Content-Type,
+по расширению или по первым байтам файла. Новый формат подключается
+через register_format().
+
+JSON Lines: первая строка - объект с shop и categories, каждая
+следующая - один товар в том же виде, что и в YAML.
+
+CSV: файл состоит из листов, каждый начинается строкой-заголовком
+листа и строкой с названиями колонок:
+
+    #shop
+    name
+    Связной
+    #categories
+    id,name
+    224,Смартфоны
+    #goods
+    id,category,model,name,price,price_rrc,quantity,param:Цвет
+    4216292,224,apple/iphone/xs-max,Смартфон,110000,116990,14,золотистый
+
+Параметры задаются колонками param:<название> либо отдельным листом
+#parameters с колонками id,name,value, который идет перед #goods.
+Лист #goods должен быть последним.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+
+import yaml
+
+from .spooling import LimitedReader
+from .yaml_stream import stream_load as yaml_stream_load
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML собран без libyaml
+    from yaml import SafeLoader
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_EXTENSIONS = ('.gz', '.gzip')
+GZIP_CONTENT_TYPES = ('application/gzip', 'application/x-gzip')
+# Сколько байтов читается для определения формата по содержимому
+SNIFF_SIZE = 512
+
+FORMATS = {}
+
+
+def register_format(price_format):
+    """
+    Подключает формат прайс-листа. Формат - объект с атрибутами name,
+    extensions, content_types и методами sniff(head), load(stream),
+    stream(stream, on_close).
+    """
+    FORMATS[price_format.name] = price_format
+    return price_format
+
+
+def primed(goods, on_close=None):
+    """
+    Генератор товаров, который вызывает on_close после чтения или при
+    закрытии. Пустой первый yield гарантирует, что close() генератора
+    выполнит finally, даже если товары не читались.
+    """
+    def generate():
+        try:
+            yield
+            yield from goods
+        finally:
+            if on_close:
+                on_close()
+
+    generator = generate()
+    next(generator)
+    return generator
+
+
+def _text(stream):
+    return io.TextIOWrapper(
+        io.BufferedReader(stream) if isinstance(stream, io.RawIOBase)
+        else stream, encoding='utf-8-sig', newline='')
+
+
+def _number(value):
+    """
+    Число из ячейки CSV. Нечисловое значение возвращается как есть,
+    чтобы проверка прайс-листа сообщила об ошибке.
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class YamlFormat:
+    name = 'yaml'
+    extensions = ('.yaml', '.yml')
+    content_types = ('application/yaml', 'application/x-yaml', 'text/yaml',
+                     'text/x-yaml')
+
+    def sniff(self, head):
+        # YAML - формат по умолчанию
+        return False
+
+    def load(self, stream):
+        try:
+            return yaml.load(stream, Loader=SafeLoader)
+        except yaml.YAMLError as e:
+            raise ValueError(f'Ошибка YAML: {e}')
+
+    def stream(self, stream, on_close=None):
+        return yaml_stream_load(stream, on_close=on_close)
+
+
+class JsonLinesFormat:
+    name = 'jsonl'
+    extensions = ('.jsonl', '.ndjson')
+    content_types = ('application/jsonl', 'application/x-jsonlines',
+                     'application/x-ndjson', 'application/jsonlines')
+
+    def sniff(self, head):
+        return head.lstrip().startswith(b'{')
+
+    def _objects(self, lines):
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'Ошибка JSON в строке {number}: {e}')
+
+    def _header(self, objects):
+        header = next(objects, None)
+        if not isinstance(header, dict) or 'shop' not in header:
+            raise ValueError(
+                'Первая строка JSON Lines должна содержать shop и categories')
+        return {'shop': header['shop'],
+                'categories': header.get('categories') or []}
+
+    def load(self, stream):
+        objects = self._objects(_text(stream))
+        data = self._header(objects)
+        data['goods'] = list(objects)
+        return data
+
+    def stream(self, stream, on_close=None):
+        try:
+            objects = self._objects(_text(stream))
+            data = self._header(objects)
+        except BaseException:
+            if on_close:
+                on_close()
+            raise
+        data['goods'] = primed(objects, on_close)
+        return data
+
+
+class CsvFormat:
+    name = 'csv'
+    extensions = ('.csv',)
+    content_types = ('text/csv', 'application/csv')
+    sheets = ('shop', 'categories', 'parameters', 'goods')
+    param_prefix = 'param:'
+
+    def sniff(self, head):
+        return head.lstrip(b'\xef\xbb\xbf').lstrip().lower().startswith(
+            b'#shop')
+
+    def _read_header(self, rows):
+        """
+        Читает листы до #goods.
+
+        Returns:
+            tuple: Данные без goods, колонки листа goods и параметры
+                из листа parameters по id товара
+        """
+        data = {'categories': []}
+        parameters = {}
+        sheet, columns = None, None
+        for row in rows:
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if row[0].startswith('#'):
+                sheet = row[0][1:].strip().lower()
+                if sheet not in self.sheets:
+                    raise ValueError(f'Неизвестный лист CSV: {row[0]}')
+                columns = None
+                continue
+            if sheet is None:
+                raise ValueError('CSV должен начинаться с листа #shop')
+            if columns is None:
+                columns = [column.strip() for column in row]
+                if sheet == 'goods':
+                    return data, columns, parameters
+                continue
+
+            values = dict(zip(columns, row))
+            if sheet == 'shop':
+                data['shop'] = values.get('name', '').strip()
+            elif sheet == 'categories':
+                data['categories'].append({
+                    'id': _number(values.get('id', '')),
+                    'name': values.get('name', '').strip()})
+            else:
+                parameters.setdefault(
+                    _number(values.get('id', '')), {}
+                )[values.get('name', '').strip()] = values.get('value', '')
+        if 'shop' not in data:
+            raise ValueError('В CSV нет листа #shop')
+        return data, None, parameters
+
+    def _goods(self, rows, columns, parameters):
+        param_columns = [
+            (index, column[len(self.param_prefix):])
+            for index, column in enumerate(columns)
+            if column.startswith(self.param_prefix)]
+        fields = [(index, column) for index, column in enumerate(columns)
+                  if not column.startswith(self.param_prefix)]
+        for row in rows:
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if row[0].startswith('#'):
+                raise ValueError('Лист #goods должен быть последним')
+            item = {column: row[index] if index < len(row) else ''
+                    for index, column in fields}
+            for key in ('id', 'category', 'quantity', 'price', 'price_rrc'):
+                if key in item:
+                    item[key] = _number(item[key])
+            item_parameters = dict(parameters.get(item.get('id'), {}))
+            for index, name in param_columns:
+                if index < len(row) and row[index] != '':
+                    item_parameters[name] = row[index]
+            item['parameters'] = item_parameters
+            yield item
+
+    def load(self, stream):
+        data = self.stream(stream)
+        data['goods'] = list(data['goods'])
+        return data
+
+    def stream(self, stream, on_close=None):
+        try:
+            rows = csv.reader(_text(stream))
+            data, columns, parameters = self._read_header(rows)
+        except csv.Error as e:
+            if on_close:
+                on_close()
+            raise ValueError(f'Ошибка CSV: {e}')
+        except BaseException:
+            if on_close:
+                on_close()
+            raise
+        goods = self._goods(rows, columns, parameters) if columns else ()
+        data['goods'] = primed(self._csv_errors(goods), on_close)
+        return data
+
+    @staticmethod
+    def _csv_errors(goods):
+        try:
+            yield from goods
+        except csv.Error as e:
+            raise ValueError(f'Ошибка CSV: {e}')
+
+
+register_format(YamlFormat())
+register_format(JsonLinesFormat())
+register_format(CsvFormat())
+
+
+def _base_content_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def is_gzip(name=None, content_type=None, head=b''):
+    if head[:2] == GZIP_MAGIC:
+        return True
+    if _base_content_type(content_type) in GZIP_CONTENT_TYPES:
+        return True
+    return bool(name) and name.lower().endswith(GZIP_EXTENSIONS)
+
+
+def guess_format(name=None, content_type=None):
+    """
+    Формат по Content-Type или расширению (без .gz).
+
+    Returns:
+        str или None: Название формата, если его удалось определить
+    """
+    content_type = _base_content_type(content_type)
+    for price_format in FORMATS.values():
+        if content_type in price_format.content_types:
+            return price_format.name
+
+    if name:
+        path = name.split('?')[0].lower()
+        stem, extension = os.path.splitext(path)
+        if extension in GZIP_EXTENSIONS:
+            extension = os.path.splitext(stem)[1]
+        for price_format in FORMATS.values():
+            if extension in price_format.extensions:
+                return price_format.name
+    return None
+
+
+def detect_format(name=None, content_type=None, head=b''):
+    """
+    Определяет формат прайс-листа: сначала по Content-Type, затем по
+    расширению, затем по содержимому. По умолчанию - YAML.
+
+    Args:
+        name: Имя файла, путь или URL
+        content_type: Content-Type ответа или загруженного файла
+        head: Первые байты распакованного содержимого
+
+    Returns:
+        str: Название формата
+    """
+    guessed = guess_format(name, content_type)
+    if guessed:
+        return guessed
+    for price_format in FORMATS.values():
+        if price_format.sniff(head):
+            return price_format.name
+    return YamlFormat.name
+
+
+def supported_extensions():
+    """
+    Расширения всех подключенных форматов, в том числе сжатых.
+    """
+    extensions = [extension for price_format in FORMATS.values()
+                  for extension in price_format.extensions]
+    return tuple(extensions) + tuple(
+        extension + gzip_extension for extension in extensions
+        for gzip_extension in GZIP_EXTENSIONS)
+
+
+class PeekableReader(io.RawIOBase):
+    """
+    Поток, у которого можно заранее прочитать первые байты, не теряя их.
+    Закрытие обертки не закрывает исходный поток.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b''
+
+    def peek(self, size):
+        while len(self.buffer) < size:
+            chunk = self.stream.read(size - len(self.buffer))
+            if not chunk:
+                break
+            self.buffer += chunk
+        return self.buffer[:size]
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        if self.buffer:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        else:
+            data = self.stream.read(size)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_price_list(stream, fmt=None, name=None, content_type=None,
+                    max_size=None):
+    """
+    Готовит бинарный поток прайс-листа к разбору: распаковывает gzip
+    и определяет формат.
+
+    Args:
+        max_size: Наибольший размер распакованного gzip, байт
+
+    Returns:
+        tuple: Формат и поток с распакованным содержимым
+    """
+    reader = PeekableReader(stream)
+    if is_gzip(name, content_type, reader.peek(2)):
+        unpacked = gzip.GzipFile(fileobj=io.BufferedReader(reader), mode='rb')
+        reader = PeekableReader(
+            LimitedReader(unpacked, max_size) if max_size else unpacked)
+        # Content-Type описывал сжатый файл, а не формат внутри
+        if _base_content_type(content_type) in GZIP_CONTENT_TYPES:
+            content_type = None
+    if fmt is None:
+        try:
+            head = reader.peek(SNIFF_SIZE)
+        except (OSError, EOFError) as e:
+            raise ValueError(f'Ошибка распаковки gzip: {e}')
+        fmt = detect_format(name, content_type, head)
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат прайс-листа: {fmt}')
+    return FORMATS[fmt], reader
+
+
+def load_price_list(stream, fmt=None, name=None, content_type=None,
+                    max_size=None):
+    """
+    Разбирает прайс-лист целиком.
+
+    Returns:
+        dict: shop, categories и список goods
+    """
+    price_format, reader = open_price_list(
+        stream, fmt, name, content_type, max_size)
+    try:
+        return price_format.load(reader)
+    except (OSError, EOFError) as e:
+        raise ValueError(f'Ошибка распаковки gzip: {e}')
+    except UnicodeDecodeError as e:
+        raise ValueError(f'Неверная кодировка прайс-листа: {e}')
+
+
+def stream_price_list(stream, fmt=None, name=None, content_type=None,
+                      on_close=None, max_size=None):
+    """
+    Потоковый разбор прайс-листа: goods - генератор товаров.
+
+    Returns:
+        dict: shop, categories и генератор goods
+    """
+    try:
+        price_format, reader = open_price_list(
+            stream, fmt, name, content_type, max_size)
+    except BaseException:
+        if on_close:
+            on_close()
+        raise
+    return price_format.stream(reader, on_close=on_close)
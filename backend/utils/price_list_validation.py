@@ -0,0 +1,303 @@
+"""
+Проверка прайс-листа до записи в БД.
+
+Проверка не обращается к БД и проходит по товарам один раз, поэтому
+прайс-лист с ошибками отклоняется целиком, не тронув каталог магазина.
+Правила совпадают с normalize_good, но числа без строк проверяются
+без Decimal: так проверка прайс-листа на 100 тысяч товаров занимает
+доли секунды.
+"""
+import math
+from decimal import Decimal, InvalidOperation
+
+# Ограничения полей моделей Product, ProductInfo и ProductParameter
+NAME_MAX_LENGTH = 80
+PARAM_NAME_MAX_LENGTH = 40
+PARAM_VALUE_MAX_LENGTH = 100
+
+# Граница и точность для DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('100000000')
+PRICE_STEP = Decimal('0.01')
+# Наибольшая цена, которая после округления до копеек меньше MAX_PRICE
+_MAX_FLOAT_PRICE = float(MAX_PRICE) - 0.005
+
+REQUIRED_FIELDS = ('id', 'category', 'name', 'price', 'price_rrc',
+                   'quantity')
+
+# Сколько ошибок попадает в отчет, остальные только считаются
+MAX_REPORTED_ERRORS = 100
+
+
+class PriceListValidationError(ValueError):
+    """
+    Прайс-лист не прошел проверку. Отчет доступен в атрибуте report.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(
+            f'Прайс-лист не прошел проверку: ошибок {report["errors_total"]}'
+            f' в {report["goods"]} товарах')
+
+
+def _check_integer(value):
+    """
+    Returns:
+        str или None: Текст ошибки для id и quantity
+    """
+    if type(value) is int:
+        return None if value >= 0 else 'не может быть отрицательным'
+    if type(value) is float:
+        if not value.is_integer():
+            return 'должно быть целым числом'
+        return None if value >= 0 else 'не может быть отрицательным'
+    if isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            return 'должно быть целым числом'
+        return None if number >= 0 else 'не может быть отрицательным'
+    return 'должно быть целым числом'
+
+
+def _check_price(value):
+    """
+    Returns:
+        str или None: Текст ошибки для price и price_rrc
+    """
+    if type(value) is int or type(value) is float:
+        if not math.isfinite(value):
+            return 'должно быть числом'
+        if value < 0:
+            return 'не может быть отрицательной'
+        return None if value < _MAX_FLOAT_PRICE else 'слишком большая цена'
+    if isinstance(value, str):
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            return 'должно быть числом'
+        if not price.is_finite():
+            return 'должно быть числом'
+        if price < 0:
+            return 'не может быть отрицательной'
+        try:
+            price = price.quantize(PRICE_STEP)
+        except InvalidOperation:
+            return 'слишком большая цена'
+        return None if price < MAX_PRICE else 'слишком большая цена'
+    return 'должно быть числом'
+
+
+class PriceListValidator:
+    """
+    Проверяет заголовок и товары прайс-листа, собирая отчет об ошибках.
+
+    Товары можно передавать по одному через check(), поэтому проверка
+    работает и на потоке товаров, не загружая их в память.
+    """
+
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.category_ids = set()
+        self.seen_ids = set()
+        self.count = 0
+        self.errors = []
+        self.errors_total = 0
+        self.duplicates = 0
+        self.unknown_categories = set()
+
+    def error(self, field, message, index=None, external_id=None):
+        self.errors_total += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({
+                'index': index,
+                'id': external_id,
+                'field': field,
+                'error': message,
+            })
+
+    def check_header(self, shop, categories):
+        if not isinstance(shop, str) or not shop.strip():
+            self.error('shop', 'не указано название магазина')
+        if categories is None:
+            categories = []
+        if not isinstance(categories, list):
+            self.error('categories', 'должно быть списком')
+            return
+        for index, category in enumerate(categories):
+            if not isinstance(category, dict) \
+                    or not category.get('id') or not category.get('name'):
+                self.error('categories', 'категория без id или name',
+                           index=index)
+                continue
+            self.category_ids.add(category['id'])
+
+    def check(self, item):
+        if self._is_plain_valid(item):
+            self.seen_ids.add(item['id'])
+            self.count += 1
+            return
+        self._check_detailed(item)
+
+    def _is_plain_valid(self, item):
+        """
+        Быстрая проверка типичного товара: целые id и quantity, числовые
+        цены, строковые параметры. Все, что не прошло, проверяется
+        подробно в _check_detailed с текстами ошибок.
+        """
+        if type(item) is not dict:
+            return False
+        try:
+            external_id = item['id']
+            quantity = item['quantity']
+            price = item['price']
+            price_rrc = item['price_rrc']
+            name = item['name']
+            category = item['category']
+        except KeyError:
+            return False
+        if type(external_id) is not int or external_id < 0 \
+                or external_id in self.seen_ids:
+            return False
+        if type(quantity) is not int or quantity < 0:
+            return False
+        for price_value in (price, price_rrc):
+            price_type = type(price_value)
+            if price_type is not int and price_type is not float:
+                return False
+            if not 0 <= price_value < _MAX_FLOAT_PRICE:
+                return False
+        if type(name) is not str or len(name) > NAME_MAX_LENGTH:
+            return False
+        if category not in self.category_ids:
+            return False
+        model = item.get('model')
+        if model is not None and (type(model) is not str
+                                  or len(model) > NAME_MAX_LENGTH):
+            return False
+        parameters = item.get('parameters')
+        if parameters is None:
+            return True
+        if type(parameters) is not dict:
+            return False
+        for param_name, value in parameters.items():
+            if type(param_name) is not str \
+                    or len(param_name) > PARAM_NAME_MAX_LENGTH:
+                return False
+            value_type = type(value)
+            if value_type is str:
+                if len(value) > PARAM_VALUE_MAX_LENGTH:
+                    return False
+            elif value_type is not float and (
+                    value_type is not int or value.bit_length() > 300):
+                # Прочие типы проверяются по строковому представлению
+                return False
+        return True
+
+    def _check_detailed(self, item):
+        index = self.count
+        self.count += 1
+        if not isinstance(item, dict):
+            self.error(None, 'товар должен быть словарем', index=index)
+            return
+
+        external_id = item.get('id')
+        missing = [field for field in REQUIRED_FIELDS
+                   if item.get(field) is None]
+        for field in missing:
+            self.error(field, 'отсутствует поле', index, external_id)
+
+        if 'id' not in missing:
+            message = _check_integer(external_id)
+            if message:
+                self.error('id', message, index, external_id)
+            elif external_id in self.seen_ids:
+                self.duplicates += 1
+                self.error('id', 'дубликат', index, external_id)
+            else:
+                self.seen_ids.add(external_id)
+        if 'quantity' not in missing:
+            message = _check_integer(item['quantity'])
+            if message:
+                self.error('quantity', message, index, external_id)
+        for field in ('price', 'price_rrc'):
+            if field not in missing:
+                message = _check_price(item[field])
+                if message:
+                    self.error(field, message, index, external_id)
+
+        category = item.get('category')
+        if 'category' not in missing and category not in self.category_ids:
+            self.unknown_categories.add(category)
+            self.error('category', f'неизвестная категория {category}',
+                       index, external_id)
+
+        if 'name' not in missing \
+                and len(str(item['name'])) > NAME_MAX_LENGTH:
+            self.error('name', 'слишком длинное название', index,
+                       external_id)
+        if len(str(item.get('model') or '')) > NAME_MAX_LENGTH:
+            self.error('model', 'слишком длинная модель', index, external_id)
+
+        parameters = item.get('parameters')
+        if parameters is None:
+            return
+        if not isinstance(parameters, dict):
+            self.error('parameters', 'должно быть словарем', index,
+                       external_id)
+            return
+        for name, value in parameters.items():
+            if len(str(name)) > PARAM_NAME_MAX_LENGTH \
+                    or len(str(value)) > PARAM_VALUE_MAX_LENGTH:
+                self.error('parameters', f'слишком длинный параметр {name}',
+                           index, external_id)
+
+    def check_goods(self, goods):
+        if goods is None:
+            return
+        if not isinstance(goods, list) and not hasattr(goods, '__next__'):
+            self.error('goods', 'должно быть списком')
+            return
+        for item in goods:
+            self.check(item)
+
+    @property
+    def valid(self):
+        return not self.errors_total
+
+    def report(self):
+        """
+        Returns:
+            dict: Структурированный отчет о проверке
+        """
+        return {
+            'valid': self.valid,
+            'goods': self.count,
+            'errors_total': self.errors_total,
+            'duplicates': self.duplicates,
+            'unknown_categories': sorted(
+                self.unknown_categories, key=str),
+            'errors': self.errors,
+        }
+
+
+def validate_price_list(data, max_errors=MAX_REPORTED_ERRORS):
+    """
+    Проверяет прайс-лист: разобранный словарь или результат stream_load.
+
+    Returns:
+        dict: Отчет о проверке
+
+    Raises:
+        PriceListValidationError: Если в прайс-листе есть ошибки
+    """
+    validator = PriceListValidator(max_errors)
+    if not isinstance(data, dict):
+        validator.error(None, 'неверный формат прайс-листа')
+    else:
+        validator.check_header(data.get('shop'), data.get('categories'))
+        validator.check_goods(data.get('goods'))
+    report = validator.report()
+    if not validator.valid:
+        raise PriceListValidationError(report)
+    return report
@@ -0,0 +1,111 @@
+"""
+Генерация синтетических прайс-листов для бенчмарков импорта.
+"""
+import csv
+import gzip
+import json
+
+SAMPLE_CATEGORIES = [
+    {'id': 224, 'name': 'Смартфоны'},
+    {'id': 15, 'name': 'Аксессуары'},
+    {'id': 1, 'name': 'Flash-накопители'},
+    {'id': 5, 'name': 'Телевизоры'},
+]
+
+
+def generate_goods(count, start_id=1):
+    """
+    Генерирует товары в формате прайс-листа.
+    """
+    for i in range(count):
+        yield {
+            'id': start_id + i,
+            'category': SAMPLE_CATEGORIES[i % len(SAMPLE_CATEGORIES)]['id'],
+            'model': f'model/{i % 97}',
+            'name': f'Товар {i % 5000}',
+            'price': 1000 + i % 100000,
+            'price_rrc': 1500 + i % 100000,
+            'quantity': i % 20,
+            'parameters': {
+                'Диагональ (дюйм)': round(4 + (i % 30) / 10, 1),
+                'Встроенная память (Гб)': (32, 64, 128, 256)[i % 4],
+                'Цвет': ('черный', 'белый', 'золотистый')[i % 3],
+            },
+        }
+
+
+def _yaml_scalar(value):
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return str(value)
+
+
+def _open(path):
+    """
+    Открывает файл на запись текста, со сжатием gzip для .gz.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_yaml(path, count, shop='Связной'):
+    """
+    Записывает прайс-лист YAML построчно, не держа его в памяти.
+    """
+    with _open(path) as file:
+        file.write(f'shop: {_yaml_scalar(shop)}\ncategories:\n')
+        for category in SAMPLE_CATEGORIES:
+            file.write(f'  - id: {category["id"]}\n'
+                       f'    name: {_yaml_scalar(category["name"])}\n')
+        file.write('goods:\n')
+        for good in generate_goods(count):
+            file.write(f'  - id: {good["id"]}\n')
+            for key in ('category', 'model', 'name', 'price',
+                        'price_rrc', 'quantity'):
+                file.write(f'    {key}: {_yaml_scalar(good[key])}\n')
+            file.write('    parameters:\n')
+            for name, value in good['parameters'].items():
+                file.write(f'      {_yaml_scalar(name)}: '
+                           f'{_yaml_scalar(value)}\n')
+
+
+def write_jsonl(path, count, shop='Связной'):
+    """
+    Записывает прайс-лист JSON Lines: заголовок и по строке на товар.
+    """
+    with _open(path) as file:
+        file.write(json.dumps(
+            {'shop': shop, 'categories': SAMPLE_CATEGORIES},
+            ensure_ascii=False) + '\n')
+        for good in generate_goods(count):
+            file.write(json.dumps(good, ensure_ascii=False) + '\n')
+
+
+def write_csv(path, count, shop='Связной'):
+    """
+    Записывает прайс-лист CSV с параметрами в колонках param:<название>.
+    """
+    fields = ['id', 'category', 'model', 'name', 'price', 'price_rrc',
+              'quantity']
+    param_names = list(next(generate_goods(1))['parameters'])
+    with _open(path) as file:
+        writer = csv.writer(file)
+        writer.writerows([['#shop'], ['name'], [shop], ['#categories'],
+                          ['id', 'name']])
+        writer.writerows([category['id'], category['name']]
+                         for category in SAMPLE_CATEGORIES)
+        writer.writerow(['#goods'])
+        writer.writerow(fields + [f'param:{name}' for name in param_names])
+        for good in generate_goods(count):
+            writer.writerow(
+                [good[field] for field in fields]
+                + [good['parameters'][name] for name in param_names])
+
+
+# Генераторы по названию формата (см. utils.price_formats)
+WRITERS = {
+    'yaml': write_yaml,
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+}
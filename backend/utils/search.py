@@ -0,0 +1,46 @@
+"""
+Текст для поиска по каталогу.
+
+Для каждого предложения хранится одна строка из названия товара,
+модели и значений параметров (ProductInfo.search_text). Строка
+приводится к нижнему регистру, ё заменяется на е, а знаки препинания
+на пробелы, поэтому запрос нормализуется той же функцией. На
+PostgreSQL по ней строится tsvector и триграммный индекс
+(миграция 0011), на других БД поиск идет по вхождению слов.
+"""
+import re
+
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+# Полная длина не ограничена (TextField), но слишком длинные строки
+# только раздувают индексы
+SEARCH_TEXT_MAX_LENGTH = 2000
+# Больше слов в запросе не учитывается
+MAX_QUERY_WORDS = 8
+
+_separators = re.compile(r'[^\w.+-]+')
+
+
+def normalize_search_text(text):
+    """
+    Нижний регистр, ё -> е, разделители -> один пробел.
+    """
+    text = str(text).lower().replace('ё', 'е')
+    return _separators.sub(' ', text).strip()
+
+
+def build_search_text(name, model='', parameters=None):
+    """
+    Строка поиска предложения: название, модель и значения параметров.
+    """
+    parts = [name, model]
+    parts.extend((parameters or {}).values())
+    text = normalize_search_text(' '.join(str(part) for part in parts))
+    return text[:SEARCH_TEXT_MAX_LENGTH]
+
+
+def query_words(query):
+    """
+    Слова поискового запроса после нормализации.
+    """
+    return normalize_search_text(query).split()[:MAX_QUERY_WORDS]
@@ -0,0 +1,104 @@
+"""
+Потоковое сохранение прайс-листов во временный файл.
+
+Загруженный файл или ответ по URL записываются частями в
+SpooledTemporaryFile: небольшие остаются в памяти, большие уходят на
+диск. Хеш исходных байтов считается по ходу записи, поэтому файл не
+читается лишний раз, а размер ограничивается до того, как прайс-лист
+займет память или диск.
+"""
+import hashlib
+import tempfile
+
+# Временный файл держится в памяти, пока не превысит этот размер
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Размер части при чтении ответа по URL
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class PriceListTooLarge(ValueError):
+    """
+    Прайс-лист больше допустимого размера (IMPORT_MAX_SIZE).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        megabyte = 1024 * 1024
+        limit = f'{max_size // megabyte} МБ' if max_size >= megabyte \
+            else f'{max_size} байт'
+        super().__init__(f'Прайс-лист больше допустимого размера {limit}')
+
+
+class LimitedReader:
+    """
+    Обертка над потоком, которая не дает прочитать больше max_size
+    байтов. Защищает от бесконечных ответов и gzip-бомб.
+    """
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise PriceListTooLarge(self.max_size)
+        return chunk
+
+
+def spool_chunks(chunks, max_size=None, content_type=None):
+    """
+    Записывает части во временный файл, считая хеш и размер.
+
+    Returns:
+        SpooledTemporaryFile: Файл в начальной позиции с атрибутами
+            raw_hash, size и content_type
+
+    Raises:
+        PriceListTooLarge: Если данных больше max_size
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            if max_size and size > max_size:
+                raise PriceListTooLarge(max_size)
+            digest.update(chunk)
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    spooled.raw_hash = digest.hexdigest()
+    spooled.size = size
+    spooled.content_type = content_type
+    return spooled
+
+
+def check_content_length(response, max_size):
+    """
+    Отклоняет ответ заранее, если Content-Length больше max_size.
+    При сжатии (Content-Encoding) заголовок описывает сжатые байты,
+    а лимит проверяется уже по распакованным при чтении.
+    """
+    length = response.headers.get('Content-Length', '')
+    if max_size and length.isdigit() and int(length) > max_size:
+        raise PriceListTooLarge(max_size)
+
+
+def spool_response(response, max_size=None):
+    """
+    Сохраняет ответ requests (stream=True) во временный файл.
+    Content-Encoding: gzip и deflate распаковываются при чтении.
+
+    Returns:
+        SpooledTemporaryFile: См. spool_chunks
+    """
+    check_content_length(response, max_size)
+    return spool_chunks(
+        response.iter_content(DOWNLOAD_CHUNK_SIZE), max_size,
+        response.headers.get('Content-Type'))
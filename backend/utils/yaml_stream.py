@@ -0,0 +1,148 @@
+"""
+Потоковый разбор прайс-листов YAML.
+
+Вместо yaml.safe_load документ читается по событиям парсера: шапка
+(shop, categories) собирается целиком, а последовательность goods
+отдается по одному товару. В памяти одновременно находится только
+текущий товар, поэтому расход памяти не зависит от размера файла.
+"""
+import yaml
+from yaml.events import (
+    AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent,
+    MappingStartEvent, MappingEndEvent, StreamEndEvent
+)
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML собран без libyaml
+    from yaml import SafeLoader
+
+
+def _compose(loader, anchors):
+    """
+    Собирает узел из событий парсера (аналог Composer.compose_node,
+    который недоступен у CParser).
+    """
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None, None, f'found undefined alias {event.anchor}',
+                event.start_mark)
+        return anchors[event.anchor]
+
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark,
+                          event.end_mark, style=event.style)
+    elif isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None,
+                            flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None,
+                           flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose(loader, anchors)
+            node.value.append((key, _compose(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        raise yaml.composer.ComposerError(
+            None, None, f'unexpected event {event}', event.start_mark)
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def _read_value(loader, anchors):
+    return loader.construct_document(_compose(loader, anchors))
+
+
+def _close(loader, on_close):
+    loader.dispose()
+    if on_close:
+        on_close()
+
+
+def _iter_goods(loader, anchors, on_close):
+    """
+    Отдает товары из последовательности goods по одному.
+    """
+    try:
+        # Пустой первый yield: после него close() генератора гарантированно
+        # выполнит finally и закроет источник
+        yield
+        loader.get_event()  # SequenceStartEvent
+        while not loader.check_event(SequenceEndEvent):
+            yield _read_value(loader, anchors)
+        loader.get_event()
+
+        # Ключи после goods уже не могут повлиять на импорт
+        while not loader.check_event(MappingEndEvent):
+            key = _read_value(loader, anchors)
+            if key in ('shop', 'categories'):
+                raise ValueError(
+                    'В потоковом режиме секция goods должна идти '
+                    'после shop и categories')
+            _read_value(loader, anchors)
+    except yaml.YAMLError as e:
+        raise ValueError(f'Ошибка YAML: {e}')
+    finally:
+        _close(loader, on_close)
+
+
+def stream_load(stream, on_close=None):
+    """
+    Потоковая загрузка прайс-листа.
+
+    Args:
+        stream: Файловый объект (бинарный или текстовый)
+        on_close: Функция, вызываемая после чтения всех товаров
+
+    Returns:
+        dict: shop и categories, а в goods - генератор товаров
+
+    Raises:
+        ValueError: Если документ не является прайс-листом
+    """
+    loader = SafeLoader(stream)
+    anchors = {}
+    try:
+        loader.get_event()  # StreamStartEvent
+        if loader.check_event(StreamEndEvent):
+            raise ValueError('Пустой YAML документ')
+        loader.get_event()  # DocumentStartEvent
+        if not loader.check_event(MappingStartEvent):
+            raise ValueError('Неверный формат YAML файла')
+        loader.get_event()
+
+        data = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _read_value(loader, anchors)
+            if key == 'goods' and loader.check_event(SequenceStartEvent):
+                goods = _iter_goods(loader, anchors, on_close)
+                next(goods)
+                data['goods'] = goods
+                return data
+            data[key] = _read_value(loader, anchors)
+    except yaml.YAMLError as e:
+        _close(loader, on_close)
+        raise ValueError(f'Ошибка YAML: {e}')
+    except BaseException:
+        _close(loader, on_close)
+        raise
+
+    _close(loader, on_close)
+    return data
@@ -1,39 +1,50 @@
 # Django и DRF импорты
+from django.conf import settings
+from django.db.models import Count, Max
 from rest_framework import viewsets, permissions, generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import (
-    api_view, permission_classes, authentication_classes
+    action, api_view, permission_classes, authentication_classes
 )
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import TokenAuthentication
 
-# Для работы с YAML и импортом
-import yaml
-
 # Наши собственные модули
-from backend.import_logic import YamlImporter
+from backend.import_jobs import enqueue_import
+from .catalog_cache import CatalogCacheMixin, catalog_version
+from .conditional import conditional_response, make_etag
+from .facets import facet_counts
+from .filters import (
+    CATALOG_ENTRY_LOOKUPS, filter_facets, filter_product_infos,
+    filter_products
+)
 from .models import (
     Shop, Category, Product, ProductInfo, Contact,
-    Order, OrderItem
+    Order, OrderItem, ImportJob, ParameterFacet, CatalogEntry
 )
+from .pagination import KeysetPagination
 from .serializers import (
     ShopSerializer, CategorySerializer, ProductSerializer,
-    ProductInfoSerializer, UserLoginSerializer, UserProfileSerializer,
-    UserRegisterSerializer, ContactSerializer, OrderSerializer,
-    BasketSerializer, BasketItemSerializer
+    ProductInfoSerializer, CatalogEntrySerializer, ProductInfoRowSerializer,
+    UserLoginSerializer,
+    UserProfileSerializer, UserRegisterSerializer, ContactSerializer,
+    OrderSerializer,
+    BasketSerializer, BasketItemSerializer, ImportJobSerializer
 )
-from .permissions import IsBuyer
+from .permissions import IsBuyer, IsShop
 from .utils.email_utils import (
     send_order_confirmation,
     send_admin_notification,
     send_registration_confirmation
 )
+from .utils.price_formats import FORMATS, guess_format
+from .utils.spooling import PriceListTooLarge
 # ==================== VIEWSETS ДЛЯ КАТАЛОГА ====================
 
 
-class ShopViewSet(viewsets.ReadOnlyModelViewSet):
+class ShopViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра списка магазинов.
     Доступ: чтение - всем, запись - только авторизованным.
@@ -43,7 +54,7 @@ class ShopViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра категорий товаров.
     Доступ: чтение - всем, запись - только авторизованным.
@@ -53,26 +64,81 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра товаров.
     Доступ: чтение - всем, запись - только авторизованным.
+
+    Фильтр: ?category=<id,...>, курсор: ?pagination=cursor
     """
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = filter_products(queryset, self.request.query_params)
+        return queryset
 
 
-class ProductInfoViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductInfoViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для просмотра информации о товарах (цены, наличие в магазинах).
     Доступ: чтение - всем, запись - только авторизованным.
+
+    Поиск ?q= по названию, модели и параметрам, фильтры списка: shop,
+    category, price_min, price_max, price_rrc_min, price_rrc_max,
+    in_stock, active_shops, param и сортировка ordering
+    (см. filters.filter_product_infos). С ?pagination=cursor список
+    отдается по курсору (см. pagination.KeysetPagination).
+
+    Список без поиска читается из витрины CatalogEntry одним запросом,
+    поиск и детальный просмотр - из ProductInfo. Списки собираются из
+    словарей values() без ModelSerializer (CatalogEntrySerializer,
+    ProductInfoRowSerializer), вывод тот же, что у ProductInfoSerializer.
+    Ответы кэшируются (см. catalog_cache), список с ?shop= зависит
+    только от версий этих магазинов.
     """
-    queryset = ProductInfo.objects.select_related(
-        'product', 'shop'
-    ).prefetch_related('product_parameters')
+    queryset = ProductInfo.objects.active().with_details()
     serializer_class = ProductInfoSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    cache_shop_param = 'shop'
+
+    def from_catalog_entries(self):
+        return self.action == 'list' \
+            and not self.request.query_params.get('q', '').strip()
+
+    def get_queryset(self):
+        if self.action != 'list':
+            return super().get_queryset()
+        if self.from_catalog_entries():
+            return filter_product_infos(
+                CatalogEntry.objects.active(), self.request.query_params,
+                CATALOG_ENTRY_LOOKUPS).as_rows()
+        # rank - ключ сортировки поиска, нужен курсору
+        return filter_product_infos(
+            ProductInfo.objects.active(), self.request.query_params
+        ).as_rows('rank')
+
+    def get_serializer_class(self):
+        if self.action != 'list':
+            return super().get_serializer_class()
+        if self.from_catalog_entries():
+            return CatalogEntrySerializer
+        return ProductInfoRowSerializer
+
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Параметры и число предложений с каждым значением для ?category=
+        и ?shop=. Значения передаются обратно в фильтр ?param=.
+        """
+        return self.cached_response(request, lambda: Response(facet_counts(
+            filter_facets(ParameterFacet.objects.all(),
+                          request.query_params))))
 
 
 # ==================== РЕГИСТРАЦИЯ ====================
@@ -201,6 +267,13 @@ def user_profile(request):
 
 # ==================== PARTNER UPDATE ====================
 
+def is_true(value):
+    """
+    Интерпретирует флаг из параметров запроса.
+    """
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
 class PartnerUpdate(APIView):
     """
     Класс для обновления прайса от поставщика через YAML
@@ -232,38 +305,86 @@ class PartnerUpdate(APIView):
         url = request.data.get('url')
         file = request.FILES.get('file')
 
-        if url:
-            try:
-                data = YamlImporter.load_yaml(url)
-                result = YamlImporter.process_data(data, shop)
-                return Response({
-                    'Status': True,
-                    'Message': 'Прайс-лист успешно обновлен',
-                    'Shop': result['shop'].name,
-                    'Categories': result['categories'],
-                    'Products': result['products']
-                })
-            except Exception as e:
-                return Response({'Status': False, 'Error': str(e)}, status=400)
-
-        elif file:
-            try:
-                data = yaml.safe_load(file)
-                result = YamlImporter.process_data(data, shop)
-                return Response({
-                    'Status': True,
-                    'Message': 'Файл успешно обработан',
-                    'Shop': result['shop'].name,
-                    'Categories': result['categories'],
-                    'Products': result['products']
-                })
-            except Exception as e:
-                return Response({'Status': False, 'Error': str(e)}, status=400)
+        if not url and not file:
+            return Response(
+                {'Status': False, 'Error': 'Не указаны данные для импорта'},
+                status=400
+            )
 
-        return Response(
-            {'Status': False, 'Error': 'Не указаны данные для импорта'},
-            status=400
-        )
+        # Иначе воркер прочитал бы url как путь к локальному файлу
+        if url and not str(url).startswith(('http://', 'https://')):
+            return Response(
+                {'Status': False, 'Error': 'Неверный URL прайс-листа'},
+                status=400
+            )
+
+        # Формат можно указать явно, иначе он определяется по имени
+        # файла, Content-Type или содержимому
+        price_format = request.data.get('format') or None
+        if price_format and price_format not in FORMATS:
+            return Response(
+                {'Status': False,
+                 'Error': 'Неизвестный формат прайс-листа'},
+                status=400
+            )
+        if not price_format and file is not None:
+            price_format = guess_format(file.name, file.content_type)
+
+        # Размер известен заранее: Django уже сохранил загрузку частями
+        # (большие файлы - во временный файл на диске)
+        max_size = settings.IMPORT_MAX_SIZE
+        if file is not None and max_size and file.size > max_size:
+            return Response(
+                {'Status': False,
+                 'Error': str(PriceListTooLarge(max_size))},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        # Импорт выполняется воркером import_worker, клиент получает
+        # id задания и следит за ним через partner/import-status/<id>/
+        try:
+            job = enqueue_import(
+                shop,
+                user=request.user,
+                url=url,
+                file=file,
+                options={
+                    # Потоковый разбор: товары читаются по одному
+                    'stream': is_true(request.data.get('stream')),
+                    # Инкрементальный режим: записываются только изменения
+                    'incremental': is_true(request.data.get('incremental')),
+                    # Импорт даже при совпадении отпечатка прайс-листа
+                    'force': is_true(request.data.get('force')),
+                    # Профиль фаз импорта сохраняется в результате задания
+                    'profile': is_true(request.data.get('profile')),
+                    # yaml, jsonl или csv; None - определить при импорте
+                    'format': price_format,
+                }
+            )
+        except PriceListTooLarge as e:
+            return Response(
+                {'Status': False, 'Error': str(e)},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        return Response({
+            'Status': True,
+            'Message': 'Импорт поставлен в очередь',
+            'JobId': job.id
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class PartnerImportStatus(generics.RetrieveAPIView):
+    """
+    Статус задания импорта прайс-листа: состояние, прогресс,
+    количество строк, длительность и ошибки.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsShop]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(
+            shop__user=self.request.user
+        ).select_related('shop')
 
 
 # ==================== КОРЗИНА ====================
@@ -276,19 +397,18 @@ class BasketViewSet(viewsets.ModelViewSet):
     permission_classes = [IsBuyer]
 
     def get_queryset(self):
-        # Получаем или создаем корзину пользователя
-        basket, created = Order.objects.get_or_create(
-            user=self.request.user,
-            status='basket',
-            defaults={'status': 'basket'}
-        )
-        return basket.ordered_items.all()
+        # Позиции корзины пользователя вместе с предложениями
+        return OrderItem.objects.filter(
+            order__user=self.request.user,
+            order__status='basket'
+        ).with_details()
 
-    def get_basket(self):
+    def get_basket(self, with_items=False):
         """
         Получаем или создаем корзину пользователя.
         """
-        basket, created = Order.objects.get_or_create(
+        orders = Order.objects.with_items() if with_items else Order.objects
+        basket, created = orders.get_or_create(
             user=self.request.user,
             status='basket',
             defaults={'status': 'basket'}
@@ -299,7 +419,7 @@ class BasketViewSet(viewsets.ModelViewSet):
         """
         Просмотр корзины с общей стоимостью.
         """
-        basket = self.get_basket()
+        basket = self.get_basket(with_items=True)
         serializer = BasketSerializer(basket)
         return Response(serializer.data)
 
@@ -316,7 +436,8 @@ class BasketViewSet(viewsets.ModelViewSet):
 
         # Проверяем наличие товара
         try:
-            product_info = ProductInfo.objects.get(id=product_info_id)
+            product_info = ProductInfo.objects.active().with_details().get(
+                id=product_info_id)
         except ProductInfo.DoesNotExist:
             return Response(
                 {'status': False, 'error': 'Товар не найден'},
@@ -451,7 +572,8 @@ class OrderConfirmView(APIView):
 
         # Находим корзину пользователя
         try:
-            basket = Order.objects.get(user=request.user, status='basket')
+            basket = Order.objects.with_items().get(
+                user=request.user, status='basket')
         except Order.DoesNotExist:
             return Response({
                 'status': False,
@@ -504,12 +626,45 @@ class OrderConfirmView(APIView):
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    Просмотр заказов пользователя
+    Просмотр заказов пользователя, новые первыми.
+    Курсор: ?pagination=cursor
+
+    ETag строится из времени изменения и числа заказов (один запрос) и
+    версии каталога в БД (в позициях - текущие предложения), с
+    совпадающим If-None-Match ответ 304 без чтения заказов (см.
+    conditional).
     """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
+    def get_orders(self):
         return Order.objects.filter(
-            user=self.request.user
-        ).exclude(status='basket')
\ No newline at end of file
+            user=self.request.user).exclude(status='basket')
+
+    def get_queryset(self):
+        return self.get_orders().with_items()
+
+    def list(self, request, *args, **kwargs):
+        changed = self.get_orders().aggregate(
+            updated_at=Max('updated_at'), count=Count('id'))
+        etag = make_etag(request, request.user.pk, changed['updated_at'],
+                         changed['count'], catalog_version())
+        return conditional_response(
+            request, etag, lambda: super(OrderViewSet, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = self.get_orders().filter(
+                pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            # 404 как обычно
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(request, request.user.pk, updated_at,
+                         catalog_version())
+        return conditional_response(
+            request, etag, lambda: super(OrderViewSet, self).retrieve(
+                request, *args, **kwargs))
\ No newline at end of file
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Поиск по каталогу (pg_trgm, tsvector)
     'backend',  #Мое приложение
     'rest_framework',
     'rest_framework.authtoken',  # Для токенов API
@@ -151,6 +152,49 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'backend.User'
 
+# Размер пачки для массовой записи товаров при импорте прайс-листов
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+
+# Очередь импорта: каталог для загруженных файлов и время, после которого
+# задание без признаков жизни возвращается в очередь
+IMPORT_UPLOAD_DIR = os.getenv(
+    'IMPORT_UPLOAD_DIR', str(BASE_DIR / 'uploads' / 'imports'))
+IMPORT_JOB_STALE_SECONDS = int(os.getenv('IMPORT_JOB_STALE_SECONDS', '600'))
+# Как часто выполняющееся задание продлевает updated_at, сек. Должно быть
+# заметно меньше IMPORT_JOB_STALE_SECONDS
+IMPORT_JOB_HEARTBEAT_SECONDS = int(
+    os.getenv('IMPORT_JOB_HEARTBEAT_SECONDS', '30'))
+# Сколько раз задание запускается заново после сбоя воркера или БД
+IMPORT_JOB_MAX_ATTEMPTS = int(os.getenv('IMPORT_JOB_MAX_ATTEMPTS', '3'))
+# Наибольший размер прайс-листа (загрузки, ответа по URL или распакованного
+# gzip), байт
+IMPORT_MAX_SIZE = int(os.getenv('IMPORT_MAX_SIZE', str(200 * 1024 * 1024)))
+# Сколько импорт ждет, пока закончится другой импорт того же магазина, сек.
+# Пока задание ждет, оно продлевает updated_at
+IMPORT_LOCK_TIMEOUT = int(os.getenv('IMPORT_LOCK_TIMEOUT', '300'))
+
+# Кэш Django. По умолчанию locmem - отдельный в каждом процессе; версии
+# каталога хранятся в БД, поэтому ответы не устаревают и с ним. Общий бэкенд
+# (Redis, Memcached, DatabaseCache) на рабочем сервере позволяет процессам
+# не вычислять одни и те же ответы каждому
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Время жизни ответов API каталога в кэше (backend/catalog_cache.py), сек.;
+# 0 выключает кэш
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+# Сколько запрос ждет ответ, который уже вычисляет другой запрос, сек.
+CATALOG_CACHE_LOCK_TIMEOUT = float(
+    os.getenv('CATALOG_CACHE_LOCK_TIMEOUT', '10'))
+# Сколько секунд после начала пересчета ответа ждущие получают его
+# предыдущую версию (stale-while-revalidate); 0 - ждут новую
+CATALOG_CACHE_STALE_SECONDS = float(
+    os.getenv('CATALOG_CACHE_STALE_SECONDS', '5'))
+
 # Email settings (для разработки используем консольный вывод)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@procurement.com'